@@ -0,0 +1,253 @@
+##
+# Runs `src/ImportWatcomSymbolsScript.py` against synthetic exports on top of the mock
+# Ghidra API in `mock_ghidra.py`, and reports the time and peak memory of each phase.
+#
+#   python bench/bench_import.py --functions 1000 10000 100000
+#   python bench/bench_import.py --functions 10000 --load whole --json before.json
+#   python bench/bench_import.py --functions 10000 --runs 2
+#   python bench/bench_import.py --functions 10000 --runs 2 --reimport
+#
+# The phases are the ones in the import plan (fragments, locals, globals), plus `setup`
+# (everything before the first of them) and `finish` (kicking off analysis). Time
+# spent creating types is taken out of the phase it happened in and reported as `types`,
+# so the rows add up to the total.
+#
+# Ghidra itself is not in the loop, so the numbers are about the script's own work and
+# the number of API calls it makes, which are reported as well.
+##
+from __future__ import print_function, division
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_PATH = os.path.join(BENCH_DIR, '..', 'src', 'ImportWatcomSymbolsScript.py')
+
+sys.path.insert(0, BENCH_DIR)
+import generate_export
+import mock_ghidra
+
+
+class LineCounter(object):
+    """Swallows the script's output, keeping count of it."""
+
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, text):
+        self.lines += text.count('\n')
+
+    def flush(self):
+        pass
+
+
+class PhaseRecorder(object):
+    def __init__(self, traceMemory):
+        self.traceMemory = traceMemory
+        self.phases = []
+        self.typeSeconds = 0.0
+        self.typeCalls = 0
+        self.typePeak = 0
+        self.name = None
+        self.startTime = None
+        self.typeSecondsAtStart = 0.0
+
+    def peak(self):
+        if not self.traceMemory:
+            return 0
+        return tracemalloc.get_traced_memory()[1]
+
+    def resetPeak(self):
+        if self.traceMemory:
+            tracemalloc.reset_peak()
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if self.name is not None:
+            typeSeconds = self.typeSeconds - self.typeSecondsAtStart
+            self.phases.append({'name': self.name, 'seconds': now - self.startTime - typeSeconds, 'peakBytes': self.peak()})
+        self.resetPeak()
+        self.name = name
+        self.startTime = now
+        self.typeSecondsAtStart = self.typeSeconds
+
+    def finish(self):
+        self.enter(None)
+        self.phases.append({'name': 'types', 'seconds': self.typeSeconds, 'peakBytes': self.typePeak, 'calls': self.typeCalls})
+
+    def wrapPhase(self, applyPhase):
+        def recordPhase(op):
+            self.enter(op['name'])
+            return applyPhase(op)
+        return recordPhase
+
+    def wrapFinish(self, resumeAnalysis):
+        def recordFinish():
+            self.enter('finish')
+            return resumeAnalysis()
+        return recordFinish
+
+    def wrapCreateType(self, createType):
+        def recordCreateType(*args, **kwargs):
+            self.typeCalls += 1
+            startTime = time.perf_counter()
+            try:
+                return createType(*args, **kwargs)
+            finally:
+                self.typeSeconds += time.perf_counter() - startTime
+                # the peak so far in this phase is the best a nested measurement can do
+                self.typePeak = max(self.typePeak, self.peak())
+        return recordCreateType
+
+
+def collectCounters(program, api, fragmentsModule):
+    functionManager = program.getFunctionManager()
+    return {
+        'functions': functionManager.getFunctionCount(),
+        'symbols': program.getSymbolTable().getNumSymbols(),
+        'dataTypes': program.getDataTypeManager().getDataTypeCount(),
+        'data': len(program.getListing().data),
+        'fragments': fragmentsModule.getNumChildren(),
+        'addDataTypeCalls': program.getDataTypeManager().addCalls,
+        'functionQueries': functionManager.queries,
+        'functionUpdates': functionManager.updates,
+        'symbolWrites': program.getSymbolTable().writes,
+        'fragmentLookups': fragmentsModule.lookups,
+        'fragmentMoves': sum(fragment.moves for fragment in fragmentsModule.children),
+        'commits': api.commits,
+    }
+
+def runImport(exportPath, streaming=True, traceMemory=True, scriptArgs=(), profileInterval=None, program=None):
+    """Import `exportPath` into `program` (a fresh mock program by default) and return what it took."""
+    mock_ghidra.install()
+    if program is None:
+        program = mock_ghidra.makeProgram()
+    api = mock_ghidra.FlatApi(program, exportPath, os.path.abspath(SCRIPT_PATH), scriptArgs)
+    namespace = api.globals()
+    with open(SCRIPT_PATH) as scriptFile:
+        code = compile(scriptFile.read(), SCRIPT_PATH, 'exec')
+
+    recorder = PhaseRecorder(traceMemory)
+    output = LineCounter()
+    stdout = sys.stdout
+    if traceMemory:
+        tracemalloc.start()
+    startTime = time.perf_counter()
+    try:
+        sys.stdout = output
+        recorder.enter('setup')
+        exec(code, namespace)
+        namespace['STREAMING_LOAD'] = streaming
+        namespace['PROFILE_INTERVAL'] = profileInterval
+        namespace['OPERATIONS']['phase'] = recorder.wrapPhase(namespace['OPERATIONS']['phase'])
+        namespace['createType'] = recorder.wrapCreateType(namespace['createType'])
+        namespace['resumeAnalysis'] = recorder.wrapFinish(namespace['resumeAnalysis'])
+        namespace['main']()
+        recorder.finish()
+    finally:
+        sys.stdout = stdout
+        totalSeconds = time.perf_counter() - startTime
+        if traceMemory:
+            tracemalloc.stop()
+
+    with open(exportPath + '.metrics.json') as metricsFile:
+        scriptMetrics = json.load(metricsFile)
+    return {
+        'program': program,
+        'export': exportPath,
+        'exportBytes': getExportBytes(exportPath),
+        'streaming': streaming,
+        'totalSeconds': totalSeconds,
+        'peakBytes': max(phase['peakBytes'] for phase in recorder.phases),
+        'phases': recorder.phases,
+        'outputLines': output.lines,
+        'counters': collectCounters(program, api, program.getListing().getDefaultRootModule()),
+        'metrics': scriptMetrics,
+    }
+
+def getExportBytes(exportPath):
+    """The size of the export, with the shards of a sharded one."""
+    if os.path.basename(exportPath) != 'index.json':
+        return os.path.getsize(exportPath)
+    directory = os.path.dirname(exportPath)
+    shards = os.path.join(directory, 'modules')
+    return os.path.getsize(exportPath) + sum(os.path.getsize(os.path.join(shards, name)) for name in os.listdir(shards))
+
+def formatBytes(n):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if n < 1024 or unit == 'GiB':
+            return '{:.1f} {}'.format(n, unit) if unit != 'B' else '{} B'.format(n)
+        n /= 1024.0
+
+def printResult(result, sizes):
+    print('{} functions, {} modules, {} export, {} load, run {}'.format(
+        sizes.functions, sizes.modules, formatBytes(result['exportBytes']), 'streaming' if result['streaming'] else 'whole', result['run']))
+    print('  {:<10} {:>10} {:>12}'.format('phase', 'seconds', 'peak memory'))
+    for phase in result['phases']:
+        print('  {:<10} {:>10.3f} {:>12}'.format(phase['name'], phase['seconds'], formatBytes(phase['peakBytes'])))
+    print('  {:<10} {:>10.3f} {:>12}'.format('total', result['totalSeconds'], formatBytes(result['peakBytes'])))
+    counters = result['counters']
+    print('  ' + ', '.join('{} {}'.format(name, counters[name]) for name in sorted(counters)))
+    print('  {} lines of output'.format(result['outputLines']))
+    profile = result['metrics'].get('profile')
+    if profile is not None:
+        print('  {} samples, most often in:'.format(profile['samples']))
+        for where, samples in profile['self'][:10]:
+            print('    {:>6} {}'.format(samples, where))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the importer on synthetic exports.')
+    parser.add_argument('--functions', type=int, nargs='+', default=[1000, 10000], help='export sizes to run, in routines')
+    generate_export.addSizeArguments(parser, withFunctions=False)
+    parser.add_argument('--load', choices=('streaming', 'whole'), default='streaming')
+    parser.add_argument('--format', choices=('json', 'sharded', 'sharded-gz'), default='json', help='write the exports as one JSON file, or as an index and shards')
+    parser.add_argument('--no-memory', action='store_true', help="don't trace memory (tracing slows everything down)")
+    parser.add_argument('--runs', type=int, default=1, help='import each export this many times (later runs reuse the type archive)')
+    parser.add_argument('--reimport', action='store_true', help='import into the same program every run (later runs only apply changes)')
+    parser.add_argument('--profile', type=float, metavar='SECONDS', help="sample the script's stack this often")
+    parser.add_argument('--work-dir', help='keep the generated exports here and reuse them')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    workDir = args.work_dir or tempfile.mkdtemp(prefix='watcom-bench-')
+    if not os.path.isdir(workDir):
+        os.makedirs(workDir)
+    results = []
+    try:
+        for functions in args.functions:
+            sizes = generate_export.sizesFromArguments(args, functions)
+            exportPath = os.path.join(workDir, 'export-{}f-{}m-{}t-{}l-{}s.json'.format(
+                sizes.functions, sizes.modules, sizes.typesPerModule, sizes.localsPerFunction, sizes.seed))
+            if args.format != 'json':
+                exportPath = os.path.join(exportPath[:-len('.json')] + '-' + args.format, 'index.json')
+                if not os.path.exists(exportPath):
+                    generate_export.writeShardedExport(os.path.dirname(exportPath), sizes, args.format == 'sharded-gz')
+            elif not os.path.exists(exportPath):
+                generate_export.writeExport(exportPath, sizes)
+            program = None
+            for run in range(args.runs):
+                result = runImport(exportPath, streaming=args.load == 'streaming', traceMemory=not args.no_memory, profileInterval=args.profile, program=program)
+                program = result.pop('program')
+                if not args.reimport:
+                    program = None
+                result['functionsRequested'] = functions
+                result['modules'] = sizes.modules
+                result['run'] = run + 1
+                printResult(result, sizes)
+                results.append(result)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(workDir)
+
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(results, out, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+##
+# Writes a synthetic Watcom debug symbols export in the same shape as `src/main.ts`.
+#
+#   python bench/generate_export.py out.json --functions 10000
+#   python bench/generate_export.py out/ --functions 10000 --sharded --gzip
+#
+# Every module gets the same handful of "library" types (`size_t`, `struct FILE`, ...)
+# plus its own structs, pointers, arrays and function types, routines with register
+# parameters, stack locals, nested blocks and module data. The output only depends on
+# the sizes asked for, and it is written one record at a time so that even very large
+# exports don't need to fit in memory.
+##
+from __future__ import print_function, division
+
+import argparse
+import gzip
+import json
+import os
+import random
+
+CODE_SEGMENT = 1
+DATA_SEGMENT = 3
+
+# where the LX object table would put the segments, which is where the mock program has them
+SEGMENT_MAP = [
+    {'segment': 1, 'base': 0x10000, 'size': 0x4000000},
+    {'segment': 2, 'base': 0x4010000, 'size': 0x10000},
+    {'segment': 3, 'base': 0x4020000, 'size': 0x1000000},
+]
+FUNCTION_SIZE = 32
+DATA_SIZE = 16
+ROUTINES_PER_ROW = 4
+
+# the first entries of every module's type table, shared by all modules
+LIBRARY_TYPES = [
+    {'typeName': 'SCALAR', 'categoryName': 'TYPE_NAME', 'scalarTypeClassName': 'int', 'scalarTypeSizeInBytes': 4},       # 1
+    {'typeName': 'SCALAR', 'categoryName': 'TYPE_NAME', 'scalarTypeClassName': 'unsigned', 'scalarTypeSizeInBytes': 4},  # 2
+    {'typeName': 'SCALAR', 'categoryName': 'TYPE_NAME', 'scalarTypeClassName': 'int', 'scalarTypeSizeInBytes': 1},       # 3
+    {'typeName': 'SCALAR', 'categoryName': 'TYPE_NAME', 'scalarTypeClassName': 'void', 'scalarTypeSizeInBytes': 1},      # 4
+    {'typeName': 'SCOPE', 'categoryName': 'TYPE_NAME', 'name': 'struct'},                                                  # 5
+    {'typeName': 'NAME', 'categoryName': 'TYPE_NAME', 'name': 'size_t', 'scope': 0, 'type': 2},                            # 6
+    {'typeName': 'STRUCTURE_LIST', 'categoryName': 'STRUCTURE', 'size': 12, 'numberOfFields': 3, 'fields': [               # 7
+        {'typeName': 'STRUCTURE_FIELD_BYTE', 'categoryName': 'STRUCTURE', 'name': 'fd', 'offset': 0, 'type': 1},
+        {'typeName': 'STRUCTURE_FIELD_BYTE', 'categoryName': 'STRUCTURE', 'name': 'buf', 'offset': 4, 'type': 8},
+        {'typeName': 'STRUCTURE_FIELD_BYTE', 'categoryName': 'STRUCTURE', 'name': 'next', 'offset': 8, 'type': 9},
+    ]},
+    {'typeName': 'NEAR386', 'categoryName': 'POINTER', 'baseType': 3},                                                     # 8
+    {'typeName': 'NEAR386', 'categoryName': 'POINTER', 'baseType': 7},                                                     # 9
+    {'typeName': 'NAME', 'categoryName': 'TYPE_NAME', 'name': 'FILE', 'scope': 5, 'type': 7},                              # 10
+    {'typeName': 'PROCEDURE_NEAR386', 'categoryName': 'PROCEDURE', 'retType': 1, 'paramsCount': 2, 'paramTypes': [9, 6]},  # 11
+    {'typeName': 'NEAR386', 'categoryName': 'POINTER', 'baseType': 11},                                                    # 12
+]
+
+
+class Sizes(object):
+    def __init__(self, functions, modules=None, typesPerModule=40, localsPerFunction=4, dataPerModule=5, seed=1):
+        self.functions = functions
+        self.modules = modules or max(1, functions // 20)
+        self.typesPerModule = max(typesPerModule, len(LIBRARY_TYPES) + 4)
+        self.localsPerFunction = localsPerFunction
+        self.dataPerModule = dataPerModule
+        self.seed = seed
+
+    def functionsIn(self, moduleIndex):
+        perModule, extra = divmod(self.functions, self.modules)
+        return perModule + (1 if moduleIndex < extra else 0)
+
+    def codeOffset(self, moduleIndex):
+        perModule, extra = divmod(self.functions, self.modules)
+        return (moduleIndex * perModule + min(moduleIndex, extra)) * FUNCTION_SIZE
+
+    def dataOffset(self, moduleIndex):
+        return moduleIndex * self.dataPerModule * DATA_SIZE
+
+    def random(self, moduleIndex, salt):
+        return random.Random('{}:{}:{}'.format(self.seed, moduleIndex, salt))
+
+
+def moduleName(moduleIndex):
+    return 'src/module{:05d}.c'.format(moduleIndex)
+
+def generateModule(sizes, moduleIndex):
+    return {
+        'moduleIndex': moduleIndex,
+        'language': 0,
+        'locals_offset': 0,
+        'locals_num_entries': 1,
+        'types_offset': 0,
+        'types_num_entries': 1,
+        'lines_offset': 0,
+        'lines_num_entries': 0,
+        'name': moduleName(moduleIndex),
+    }
+
+def generateTypes(sizes, moduleIndex):
+    """This module's type table, and the indexes of its structs and function types."""
+    rng = sizes.random(moduleIndex, 'types')
+    entries = [dict(entry) for entry in LIBRARY_TYPES]
+    structs = [7]
+    procedures = [11]
+    while len(entries) + 4 <= sizes.typesPerModule:
+        kind = rng.random()
+        base = len(entries) + 1
+        if kind < 0.5:
+            # struct with a NAME, a pointer to itself and a field pointing at an earlier struct
+            other = rng.choice(structs)
+            size = 12 + 4 * rng.randint(0, 3)
+            fields = [
+                {'typeName': 'STRUCTURE_FIELD_BYTE', 'categoryName': 'STRUCTURE', 'name': 'id', 'offset': 0, 'type': 1},
+                {'typeName': 'STRUCTURE_FIELD_BYTE', 'categoryName': 'STRUCTURE', 'name': 'self', 'offset': 4, 'type': base + 1},
+                {'typeName': 'STRUCTURE_FIELD_BYTE', 'categoryName': 'STRUCTURE', 'name': 'other', 'offset': 8, 'type': base + 3},
+            ]
+            for i in range((size - 12) // 4):
+                fields.append({'typeName': 'STRUCTURE_FIELD_BYTE', 'categoryName': 'STRUCTURE', 'name': 'f{}'.format(i), 'offset': 12 + 4 * i, 'type': 2})
+            entries.append({'typeName': 'STRUCTURE_LIST', 'categoryName': 'STRUCTURE', 'size': size, 'numberOfFields': len(fields), 'fields': fields})
+            entries.append({'typeName': 'NEAR386', 'categoryName': 'POINTER', 'baseType': base})
+            entries.append({'typeName': 'NAME', 'categoryName': 'TYPE_NAME', 'name': 'm{}_s{}'.format(moduleIndex, base), 'scope': 5, 'type': base})
+            entries.append({'typeName': 'NEAR386', 'categoryName': 'POINTER', 'baseType': other})
+            structs.append(base)
+        elif kind < 0.8:
+            # typedef of an array of an earlier struct, and a pointer to it
+            entries.append({'typeName': 'ARRAY_BYTE_INDEX', 'categoryName': 'ARRAY', 'highBound': rng.randint(1, 15), 'baseType': rng.choice(structs)})
+            entries.append({'typeName': 'NAME', 'categoryName': 'TYPE_NAME', 'name': 'm{}_a{}'.format(moduleIndex, base), 'scope': 0, 'type': base})
+            entries.append({'typeName': 'NEAR386', 'categoryName': 'POINTER', 'baseType': base + 1})
+            entries.append({'typeName': 'NEAR386', 'categoryName': 'POINTER', 'baseType': 1})
+        else:
+            # function type taking pointers to earlier structs
+            paramTypes = [base + 1, base + 2, 1]
+            entries.append({'typeName': 'PROCEDURE_NEAR386', 'categoryName': 'PROCEDURE', 'retType': rng.choice([1, 4, 9]), 'paramsCount': len(paramTypes), 'paramTypes': paramTypes})
+            entries.append({'typeName': 'NEAR386', 'categoryName': 'POINTER', 'baseType': rng.choice(structs)})
+            entries.append({'typeName': 'NEAR386', 'categoryName': 'POINTER', 'baseType': rng.choice(structs)})
+            entries.append({'typeName': 'NEAR386', 'categoryName': 'POINTER', 'baseType': base})
+            procedures.append(base)
+    for i, entry in enumerate(entries):
+        entry['selfIndex'] = i + 1
+    return entries, structs, procedures
+
+def registerParam(name):
+    return [{'lsmName': 'MULTI_REG', 'registerNames': [name], 'registerNumbers': [0]}]
+
+def routineName(moduleIndex, i):
+    return 'm{}_func{}'.format(moduleIndex, i)
+
+def dataName(moduleIndex, i):
+    return 'm{}_data{}'.format(moduleIndex, i)
+
+def generateLocals(sizes, moduleIndex):
+    rng = sizes.random(moduleIndex, 'locals')
+    _, structs, procedures = generateTypes(sizes, moduleIndex)
+    entries = [{'typeName': 'SET_BASE386', 'segment': CODE_SEGMENT, 'location': sizes.codeOffset(moduleIndex)}]
+    for i in range(sizes.dataPerModule):
+        entries.append({'typeName': 'MODULE386', 'segment': DATA_SEGMENT, 'location': sizes.dataOffset(moduleIndex) + i * DATA_SIZE, 'typeIndex': rng.choice(structs), 'symbolName': dataName(moduleIndex, i)})
+    for i in range(sizes.functionsIn(moduleIndex)):
+        startOffset = i * FUNCTION_SIZE
+        entries.append({
+            'typeName': 'NEAR_RTN_386',
+            'startOffset': startOffset,
+            'size': FUNCTION_SIZE,
+            'parentBlockOffset': 0,
+            'prologueSize': 3,
+            'epilogueSize': 2,
+            'returnAddressOffset': 4,
+            'typeIndex': rng.choice(procedures),
+            'returnValueLocation': registerParam('EAX'),
+            'numberOfRegisterParams': 2,
+            'registerParams': [registerParam('EAX'), registerParam('EDX')],
+            'symbolName': routineName(moduleIndex, i),
+        })
+        for j in range(sizes.localsPerFunction):
+            # every fourth local reuses a name, like nested scopes do
+            name = 'local{}'.format(j if j % 4 != 3 else 0)
+            entries.append({'typeName': 'LOCAL', 'location': [{'lsmName': 'BP_OFFSET_BYTE', 'offset': -4 * (j + 1)}], 'typeIndex': rng.choice([1, 2, 6, 9]), 'symbolName': name})
+        if i % 3 == 0:
+            entries.append({'typeName': 'BLOCK_386', 'startOffset': startOffset + 4, 'size': 8, 'parentBlockOffset': startOffset})
+            entries.append({'typeName': 'LOCAL', 'location': [{'lsmName': 'CONST_ADDR386', 'constSegment': DATA_SEGMENT, 'constAddress': sizes.dataOffset(moduleIndex)}], 'typeIndex': 1, 'symbolName': 'static{}'.format(i)})
+    return entries
+
+def generateGlobals(sizes, moduleIndex):
+    for i in range(sizes.functionsIn(moduleIndex)):
+        yield {'addressOffset': sizes.codeOffset(moduleIndex) + i * FUNCTION_SIZE, 'addressSegment': CODE_SEGMENT, 'moduleIndex': moduleIndex, 'kind': 4, 'isStatic': False, 'isData': False, 'isCode': True, 'name': routineName(moduleIndex, i) + '_'}
+    for i in range(sizes.dataPerModule):
+        yield {'addressOffset': sizes.dataOffset(moduleIndex) + i * DATA_SIZE, 'addressSegment': DATA_SEGMENT, 'moduleIndex': moduleIndex, 'kind': 2, 'isStatic': False, 'isData': True, 'isCode': False, 'name': '_' + dataName(moduleIndex, i)}
+
+def generateAddressesTable(sizes):
+    code = {'address': 0, 'segment': CODE_SEGMENT, 'addressInfo': []}
+    data = {'address': 0, 'segment': DATA_SEGMENT, 'addressInfoCount': sizes.modules, 'addressInfo': []}
+    for moduleIndex in range(sizes.modules):
+        # like real exports, a module's code comes in several rows that are right next to each other
+        functions = sizes.functionsIn(moduleIndex)
+        for first in range(0, functions, ROUTINES_PER_ROW):
+            count = min(ROUTINES_PER_ROW, functions - first)
+            code['addressInfo'].append({'address': sizes.codeOffset(moduleIndex) + first * FUNCTION_SIZE, 'size': count * FUNCTION_SIZE, 'moduleIndex': moduleIndex})
+        data['addressInfo'].append({'address': sizes.dataOffset(moduleIndex), 'size': sizes.dataPerModule * DATA_SIZE, 'moduleIndex': moduleIndex})
+    code['addressInfoCount'] = len(code['addressInfo'])
+    return [code, data]
+
+def meta(moduleIndex):
+    return {'moduleIndex': moduleIndex, 'moduleName': moduleName(moduleIndex), 'offset': 0, 'len': 0}
+
+def writeArray(out, name, records, last=False):
+    out.write('"{}": ['.format(name))
+    first = True
+    for record in records:
+        if not first:
+            out.write(',')
+        out.write('\n')
+        json.dump(record, out)
+        first = False
+    out.write(']' if last else '],\n')
+
+MASTER_DEBUG_HEADER = '{"signature": [87, 66], "exeMajorVersion": 3, "exeMinorVersion": 0, "objMajorVersion": 1, "objMinorVersion": 0, "langSize": 2, "segmentSize": 6, "debugSize": 0}'
+
+def writeExport(path, sizes):
+    with open(path, 'w') as out:
+        out.write('{"masterDebugHeader": ' + MASTER_DEBUG_HEADER + ',\n')
+        out.write('"debuggingRegion": {"langs": ["C"], "segments": [1, 2, 3],\n')
+        writeArray(out, 'segmentMap', SEGMENT_MAP)
+        out.write('"sectionDebugHeaders": [],\n')
+        modules = range(sizes.modules)
+        writeArray(out, 'modules', (generateModule(sizes, m) for m in modules))
+        writeArray(out, 'modulesLocals', ({'meta': meta(m), 'entries': generateLocals(sizes, m)} for m in modules))
+        writeArray(out, 'modulesTypes', ({'meta': meta(m), 'entries': generateTypes(sizes, m)[0]} for m in modules))
+        writeArray(out, 'globalSymbolsTable', (g for m in modules for g in generateGlobals(sizes, m)))
+        writeArray(out, 'addressesTable', generateAddressesTable(sizes), last=True)
+        out.write('}}\n')
+
+def writeShardedExport(directory, sizes, gzipped=False):
+    """Write the export like `main.ts --sharded` does, and return the path of the index."""
+    moduleDirectory = os.path.join(directory, 'modules')
+    if not os.path.isdir(moduleDirectory):
+        os.makedirs(moduleDirectory)
+    modules = range(sizes.modules)
+    shards = []
+    for m in modules:
+        shardPath = 'modules/{:05d}.json{}'.format(m, '.gz' if gzipped else '')
+        shard = json.dumps({'moduleIndex': m, 'debuggingRegion': {
+            'modulesTypes': [{'meta': meta(m), 'entries': generateTypes(sizes, m)[0]}],
+            'modulesLocals': [{'meta': meta(m), 'entries': generateLocals(sizes, m)}],
+        }})
+        if gzipped:
+            with gzip.open(os.path.join(directory, shardPath), 'wb') as out:
+                out.write(shard.encode('utf-8'))
+        else:
+            with open(os.path.join(directory, shardPath), 'w') as out:
+                out.write(shard)
+        shards.append({'moduleIndex': m, 'path': shardPath})
+
+    indexPath = os.path.join(directory, 'index.json')
+    with open(indexPath, 'w') as out:
+        out.write('{"format": "watcom-sharded-1", "masterDebugHeader": ' + MASTER_DEBUG_HEADER + ',\n')
+        out.write('"debuggingRegion": {"langs": ["C"], "segments": [1, 2, 3],\n')
+        writeArray(out, 'segmentMap', SEGMENT_MAP)
+        out.write('"sectionDebugHeaders": [],\n')
+        writeArray(out, 'modules', (generateModule(sizes, m) for m in modules))
+        writeArray(out, 'globalSymbolsTable', (g for m in modules for g in generateGlobals(sizes, m)))
+        writeArray(out, 'addressesTable', generateAddressesTable(sizes))
+        writeArray(out, 'shards', shards, last=True)
+        out.write('}}\n')
+    return indexPath
+
+def addSizeArguments(parser, withFunctions=True):
+    if withFunctions:
+        parser.add_argument('--functions', type=int, default=1000, help='routines in the whole export')
+    parser.add_argument('--modules', type=int, help='modules to spread them over (default: one per 20 functions)')
+    parser.add_argument('--types-per-module', type=int, default=40)
+    parser.add_argument('--locals-per-function', type=int, default=4)
+    parser.add_argument('--data-per-module', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+
+def sizesFromArguments(args, functions=None):
+    return Sizes(functions or args.functions, args.modules, args.types_per_module, args.locals_per_function, args.data_per_module, args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic Watcom debug symbols export.')
+    parser.add_argument('output', help='the export, or with --sharded the directory for it')
+    parser.add_argument('--sharded', action='store_true', help='write an index and a shard per module')
+    parser.add_argument('--gzip', action='store_true', help='gzip the shards')
+    addSizeArguments(parser)
+    args = parser.parse_args()
+    if args.sharded:
+        writeShardedExport(args.output, sizesFromArguments(args), args.gzip)
+    else:
+        writeExport(args.output, sizesFromArguments(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1529 @@
+##
+# A small stand-in for the parts of the Ghidra (and Java) API that
+# `src/ImportWatcomSymbolsScript.py` uses, so the script can run under a plain CPython.
+#
+# It only keeps as much state as the script can observe (functions, symbols, data types,
+# fragments, ...). It is good enough to time the script and to check what it did, not to
+# predict how long Ghidra itself takes for each call.
+##
+from __future__ import print_function, division
+
+import bisect
+import hashlib
+import json
+import re
+import sys
+import time
+import types
+
+
+class DuplicateNameException(Exception):
+    pass
+
+class NotFoundException(Exception):
+    pass
+
+class CodeUnitInsertionException(Exception):
+    pass
+
+class CancelledException(Exception):
+    pass
+
+
+#
+# addresses and memory
+#
+
+class Address(object):
+    __slots__ = ('offset',)
+
+    def __init__(self, offset):
+        self.offset = offset
+
+    def add(self, n):
+        return Address(self.offset + n)
+
+    def subtract(self, other):
+        if isinstance(other, Address):
+            return self.offset - other.offset
+        return Address(self.offset - other)
+
+    def getOffset(self):
+        return self.offset
+
+    def compareTo(self, other):
+        return (self.offset > other.offset) - (self.offset < other.offset)
+
+    def __eq__(self, other):
+        return isinstance(other, Address) and other.offset == self.offset
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        return self.offset < other.offset
+
+    def __le__(self, other):
+        return self.offset <= other.offset
+
+    def __hash__(self):
+        return hash(self.offset)
+
+    def __str__(self):
+        return '{:08x}'.format(self.offset)
+
+    __repr__ = __str__
+
+
+class AddressRange(object):
+    def __init__(self, minAddress, maxAddress):
+        self.minAddress = minAddress
+        self.maxAddress = maxAddress
+
+    def getMinAddress(self):
+        return self.minAddress
+
+    def getMaxAddress(self):
+        return self.maxAddress
+
+    def getLength(self):
+        return self.maxAddress.offset - self.minAddress.offset + 1
+
+
+class AddressSet(object):
+    """Inclusive [min, max] ranges, merged as they are added."""
+
+    def __init__(self, minAddress=None, maxAddress=None):
+        self.ranges = []
+        if minAddress is not None:
+            self.add(minAddress, maxAddress)
+
+    def add(self, minAddress, maxAddress=None):
+        if isinstance(minAddress, AddressSet):
+            for r in minAddress.ranges:
+                self.add(Address(r[0]), Address(r[1]))
+            return
+        if isinstance(minAddress, AddressRange):
+            minAddress, maxAddress = minAddress.minAddress, minAddress.maxAddress
+        if maxAddress is None:
+            maxAddress = minAddress
+        lo, hi = minAddress.offset, maxAddress.offset
+        # ranges are sorted and disjoint, so only the neighbours of the new one can merge
+        first = bisect.bisect_left(self.ranges, (lo, lo))
+        if first > 0 and self.ranges[first - 1][1] + 1 >= lo:
+            first -= 1
+        last = first
+        while last < len(self.ranges) and self.ranges[last][0] <= hi + 1:
+            lo, hi = min(lo, self.ranges[last][0]), max(hi, self.ranges[last][1])
+            last += 1
+        self.ranges[first:last] = [(lo, hi)]
+
+    def contains(self, address, maxAddress=None):
+        lo = address.offset
+        hi = maxAddress.offset if maxAddress is not None else lo
+        i = bisect.bisect_right(self.ranges, (lo, float('inf'))) - 1
+        return i >= 0 and self.ranges[i][0] <= lo and hi <= self.ranges[i][1]
+
+    def intersects(self, start, end):
+        i = bisect.bisect_right(self.ranges, (end.offset, float('inf'))) - 1
+        return i >= 0 and self.ranges[i][1] >= start.offset
+
+    def intersect(self, other):
+        result = AddressSet()
+        for lo, hi in self.ranges:
+            for otherLo, otherHi in other.ranges:
+                if otherLo <= hi and lo <= otherHi:
+                    result.add(Address(max(lo, otherLo)), Address(min(hi, otherHi)))
+        return result
+
+    def isEmpty(self):
+        return not self.ranges
+
+    def getNumAddressRanges(self):
+        return len(self.ranges)
+
+    def getNumAddresses(self):
+        return sum(r[1] - r[0] + 1 for r in self.ranges)
+
+    def getMinAddress(self):
+        return Address(self.ranges[0][0]) if self.ranges else None
+
+    def getMaxAddress(self):
+        return Address(self.ranges[-1][1]) if self.ranges else None
+
+    def getAddressRanges(self):
+        return [AddressRange(Address(r[0]), Address(r[1])) for r in self.ranges]
+
+    def __iter__(self):
+        return iter(self.getAddressRanges())
+
+
+class MemoryBlock(object):
+    def __init__(self, name, start, size):
+        self.name = name
+        self.start = Address(start)
+        self.size = size
+
+    def getName(self):
+        return self.name
+
+    def getStart(self):
+        return self.start
+
+    def getEnd(self):
+        return self.start.add(self.size - 1)
+
+    def getSize(self):
+        return self.size
+
+    def contains(self, address):
+        return self.start.offset <= address.offset < self.start.offset + self.size
+
+
+class Memory(object):
+    def __init__(self, blocks):
+        self.blocks = blocks
+
+    def getBlock(self, nameOrAddress):
+        for block in self.blocks:
+            if block.name == nameOrAddress or (isinstance(nameOrAddress, Address) and block.contains(nameOrAddress)):
+                return block
+        return None
+
+    def getBlocks(self):
+        return list(self.blocks)
+
+    def contains(self, address):
+        return any(block.contains(address) for block in self.blocks)
+
+
+class Register(object):
+    def __init__(self, name, numBytes=4):
+        self.name = name
+        self.numBytes = numBytes
+
+    def getName(self):
+        return self.name
+
+    def getNumBytes(self):
+        return self.numBytes
+
+
+#
+# data types
+#
+
+class CategoryPath(object):
+    ROOT = None
+
+    def __init__(self, path):
+        self.path = path
+
+    def getPath(self):
+        return self.path
+
+    def __str__(self):
+        return self.path
+
+CategoryPath.ROOT = CategoryPath('/')
+
+
+class DataTypeConflictHandler(object):
+    REPLACE_HANDLER = 'REPLACE_HANDLER'
+    KEEP_HANDLER = 'KEEP_HANDLER'
+    DEFAULT_HANDLER = 'DEFAULT_HANDLER'
+
+
+class DataType(object):
+    def __init__(self, name, length, category=None):
+        self.name = name
+        self.length = length
+        self.category = category or CategoryPath.ROOT
+
+    def getName(self):
+        return self.name
+
+    def getLength(self):
+        return self.length
+
+    def getCategoryPath(self):
+        return self.category
+
+    def getPathName(self):
+        return self.category.path.rstrip('/') + '/' + self.name
+
+    def getDataTypePath(self):
+        return self.getPathName()
+
+    def __repr__(self):
+        return '<{} {}>'.format(type(self).__name__, self.getPathName())
+
+
+class BuiltInDataType(DataType):
+    pass
+
+DataType.DEFAULT = BuiltInDataType('undefined', 1)
+
+
+class VoidDataType(BuiltInDataType):
+    dataType = None
+
+VoidDataType.dataType = VoidDataType('void', 0)
+
+
+def _builtIn(cache, prefix, size):
+    if size not in cache:
+        cache[size] = BuiltInDataType('{}{}'.format(prefix, size), size)
+    return cache[size]
+
+
+class AbstractIntegerDataType(object):
+    signed = dict()
+    unsigned = dict()
+
+    @staticmethod
+    def getSignedDataType(size, dtm):
+        return _builtIn(AbstractIntegerDataType.signed, 'int', size)
+
+    @staticmethod
+    def getUnsignedDataType(size, dtm):
+        return _builtIn(AbstractIntegerDataType.unsigned, 'uint', size)
+
+
+class AbstractFloatDataType(object):
+    floats = dict()
+
+    @staticmethod
+    def getFloatDataType(size, dtm):
+        return _builtIn(AbstractFloatDataType.floats, 'float', size)
+
+
+class AbstractComplexDataType(object):
+    complexes = dict()
+
+    @staticmethod
+    def getComplexDataType(size, dtm):
+        return _builtIn(AbstractComplexDataType.complexes, 'complex', size)
+
+
+class Undefined(object):
+    undefined = dict()
+
+    @staticmethod
+    def getUndefinedDataType(size):
+        return _builtIn(Undefined.undefined, 'undefined', size)
+
+
+class Pointer32DataType(DataType):
+    def __init__(self, baseType):
+        DataType.__init__(self, baseType.getName() + ' *32', 4, baseType.getCategoryPath())
+        self.baseType = baseType
+
+    def getDataType(self):
+        return self.baseType
+
+
+class ArrayDataType(DataType):
+    def __init__(self, baseType, count, elementLength=-1, dtm=None):
+        DataType.__init__(self, '{}[{}]'.format(baseType.getName(), count), max(baseType.getLength(), 1) * count, baseType.getCategoryPath())
+        self.baseType = baseType
+        self.count = count
+
+
+class TypedefDataType(DataType):
+    def __init__(self, category, name, baseType, dtm=None):
+        DataType.__init__(self, name, baseType.getLength(), category)
+        self.baseType = baseType
+
+
+class StructureDataType(DataType):
+    def __init__(self, category, name, length, dtm=None):
+        DataType.__init__(self, name, length, category)
+        self.components = dict()
+
+    def replaceAtOffset(self, offset, dataType, length, name, comment):
+        if offset + max(dataType.getLength(), 0) > self.length:
+            raise ValueError('component at {} does not fit in {}'.format(offset, self.name))
+        self.components[offset] = (name, dataType)
+
+    def insertBitFieldAt(self, byteOffset, byteWidth, bitOffset, dataType, bitSize, name, comment):
+        self.components[(byteOffset, bitOffset)] = (name, dataType)
+
+    def getNumComponents(self):
+        return len(self.components)
+
+
+class ParameterDefinition(object):
+    def __init__(self, name, dataType):
+        self.name = name
+        self.dataType = dataType
+
+    def getName(self):
+        return self.name
+
+    def getDataType(self):
+        return self.dataType
+
+
+class FunctionDefinitionDataType(DataType):
+    def __init__(self, category, name, dtm=None):
+        DataType.__init__(self, name, -1, category)
+        self.returnType = None
+        self.arguments = []
+
+    def setReturnType(self, dataType):
+        self.returnType = dataType
+
+    def getReturnType(self):
+        return self.returnType
+
+    def replaceArgument(self, ordinal, name, dataType, comment, source):
+        while len(self.arguments) <= ordinal:
+            self.arguments.append(ParameterDefinition(None, Undefined.getUndefinedDataType(4)))
+        self.arguments[ordinal] = ParameterDefinition(name, dataType)
+
+    def setArguments(self, arguments):
+        self.arguments = list(arguments)
+
+    def getArguments(self):
+        return list(self.arguments)
+
+
+class DataTypeManager(object):
+    def __init__(self, name='program'):
+        self.name = name
+        self.types = dict()
+        self.addCalls = 0
+
+    def addDataType(self, dataType, handler):
+        self.addCalls += 1
+        self.types[dataType.getPathName()] = dataType
+        return dataType
+
+    def resolve(self, dataType, handler):
+        return self.addDataType(dataType, handler)
+
+    def getDataType(self, path, name=None):
+        if name is not None:
+            path = path.getPath().rstrip('/') + '/' + name
+        return self.types.get(str(path))
+
+    def getDataTypeCount(self, includePointersAndArrays=True):
+        return len(self.types)
+
+    def getAllDataTypes(self):
+        return iter(list(self.types.values()))
+
+    def startTransaction(self, description):
+        return 1
+
+    def endTransaction(self, transactionID, commit):
+        pass
+
+
+class FileDataTypeManager(DataTypeManager):
+    """A data type archive, pickled to its file on `save()`."""
+
+    def __init__(self, path):
+        DataTypeManager.__init__(self, path)
+        self.path = path
+        self.byId = dict()
+        self.ids = dict()
+
+    @staticmethod
+    def createFileArchive(f):
+        return FileDataTypeManager(f.getAbsolutePath())
+
+    @staticmethod
+    def openFileArchive(f, openForUpdate):
+        import pickle
+        archive = FileDataTypeManager(f.getAbsolutePath())
+        with open(archive.path, 'rb') as archiveFile:
+            archive.byId = pickle.load(archiveFile)
+        return archive
+
+    def resolve(self, dataType, handler):
+        if id(dataType) not in self.ids:
+            self.addCalls += 1
+            self.ids[id(dataType)] = len(self.byId) + 1
+            self.byId[len(self.byId) + 1] = dataType
+        return dataType
+
+    def getID(self, dataType):
+        return self.ids[id(dataType)]
+
+    def getDataType(self, path, name=None):
+        if isinstance(path, int):
+            return self.byId.get(path)
+        return DataTypeManager.getDataType(self, path, name)
+
+    def save(self):
+        import pickle
+        with open(self.path, 'wb') as archiveFile:
+            pickle.dump(self.byId, archiveFile, pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        pass
+
+
+#
+# symbols, functions and the listing
+#
+
+class SourceType(object):
+    DEFAULT = 'DEFAULT'
+    ANALYSIS = 'ANALYSIS'
+    IMPORTED = 'IMPORTED'
+    USER_DEFINED = 'USER_DEFINED'
+
+
+class SymbolType(object):
+    LABEL = 'LABEL'
+    FUNCTION = 'FUNCTION'
+
+
+class Symbol(object):
+    def __init__(self, table, name, address, source, symbolType=SymbolType.LABEL):
+        self.table = table
+        self.name = name
+        self.address = address
+        self.source = source
+        self.symbolType = symbolType
+
+    def getName(self):
+        return self.name
+
+    def getAddress(self):
+        return self.address
+
+    def getSource(self):
+        return self.source
+
+    def getSymbolType(self):
+        return self.symbolType
+
+    def isPrimary(self):
+        return self.table.getPrimarySymbol(self.address) is self
+
+    def setName(self, name, source):
+        self.name = name
+        self.source = source
+
+    def delete(self):
+        return self.table.removeSymbolSpecial(self)
+
+
+class SymbolTable(object):
+    def __init__(self):
+        self.symbols = dict()
+        self.writes = 0
+
+    def createLabel(self, address, name, source):
+        self.writes += 1
+        for symbol in self.symbols.get(address, []):
+            if symbol.name == name:
+                return symbol
+        symbol = Symbol(self, name, address, source)
+        self.symbols.setdefault(address, []).append(symbol)
+        return symbol
+
+    def getSymbols(self, address):
+        return list(self.symbols.get(address, []))
+
+    def getPrimarySymbol(self, address):
+        symbols = self.symbols.get(address)
+        return symbols[0] if symbols else None
+
+    def getAllSymbols(self, includeDynamic):
+        return [symbol for symbols in self.symbols.values() for symbol in symbols]
+
+    def getNumSymbols(self):
+        return sum(len(symbols) for symbols in self.symbols.values())
+
+    def removeSymbolSpecial(self, symbol):
+        self.writes += 1
+        symbols = self.symbols.get(symbol.address, [])
+        if symbol in symbols:
+            symbols.remove(symbol)
+            return True
+        return False
+
+
+class VariableStorage(object):
+    def __init__(self, program, *args):
+        if len(args) == 1:
+            self.register = args[0]
+            self.stackOffset = None
+        else:
+            self.register = None
+            self.stackOffset, self.size = args
+
+    def __repr__(self):
+        if self.register is not None:
+            return self.register.getName()
+        return 'Stack[{}]'.format(self.stackOffset)
+
+
+class Variable(object):
+    def getName(self):
+        return self.name
+
+    def setName(self, name, source):
+        self.name = name
+
+    def getDataType(self):
+        return self.dataType
+
+
+class ParameterImpl(Variable):
+    def __init__(self, name, dataType, storage, program, source=None):
+        self.name = name
+        self.dataType = dataType
+        self.storage = storage
+
+
+class ReturnParameterImpl(ParameterImpl):
+    def __init__(self, dataType, storage, program):
+        ParameterImpl.__init__(self, None, dataType, storage, program)
+
+
+class LocalVariableImpl(Variable):
+    """(name, dataType, stackOffset, program, source) or (name, firstUseOffset, dataType, address, program, source)"""
+
+    def __init__(self, name, *args):
+        self.name = name
+        self.firstUseOffset = 0
+        if isinstance(args[0], DataType) or args[0] is None:
+            self.dataType, self.stackOffset = args[0], args[1]
+            self.address = None
+        else:
+            self.firstUseOffset, self.dataType, self.address = args[0], args[1], args[2]
+            self.stackOffset = None
+
+    def setFirstUseOffset(self, offset):
+        self.firstUseOffset = offset
+
+    def getStackOffset(self):
+        return self.stackOffset
+
+    def isStackVariable(self):
+        return self.stackOffset is not None
+
+    def getMinAddress(self):
+        return self.address
+
+
+class Function(object):
+    class FunctionUpdateType(object):
+        CUSTOM_STORAGE = 'CUSTOM_STORAGE'
+        DYNAMIC_STORAGE_FORMAL_PARAMS = 'DYNAMIC_STORAGE_FORMAL_PARAMS'
+        DYNAMIC_STORAGE_ALL_PARAMS = 'DYNAMIC_STORAGE_ALL_PARAMS'
+
+    def __init__(self, manager, name, entry, body, source):
+        self.manager = manager
+        self.name = name
+        self.entry = entry
+        self.body = body
+        self.source = source
+        self.returnType = DataType.DEFAULT
+        self.returnStorage = None
+        self.customStorage = False
+        self.parameters = []
+        self.locals = []
+
+    def _update(self):
+        self.manager.updates += 1
+
+    def getName(self):
+        return self.name
+
+    def setName(self, name, source):
+        self._update()
+        self.manager.rename(self, name)
+        self.source = source
+
+    def getEntryPoint(self):
+        return self.entry
+
+    def getBody(self):
+        return self.body
+
+    def getSignatureSource(self):
+        return self.source
+
+    def setReturnType(self, dataType, source):
+        self._update()
+        self.returnType = dataType
+
+    def getReturnType(self):
+        return self.returnType
+
+    def setReturn(self, dataType, storage, source):
+        self._update()
+        self.returnType = dataType
+        self.returnStorage = storage
+
+    def setCustomVariableStorage(self, state):
+        self._update()
+        self.customStorage = state
+
+    def hasCustomVariableStorage(self):
+        return self.customStorage
+
+    def replaceParameters(self, params, updateType, force, source):
+        self._update()
+        self.parameters = list(params)
+
+    def updateFunction(self, callingConvention, returnParam, params, updateType, force, source):
+        self._update()
+        if returnParam is not None:
+            self.returnType = returnParam.getDataType()
+            self.returnStorage = returnParam.storage
+        self.customStorage = updateType == Function.FunctionUpdateType.CUSTOM_STORAGE
+        self.parameters = list(params)
+
+    def getParameters(self):
+        return list(self.parameters)
+
+    def getParameterCount(self):
+        return len(self.parameters)
+
+    def addLocalVariable(self, var, source):
+        self._update()
+        for existing in self.locals:
+            if existing.name == var.name:
+                raise DuplicateNameException('{} already has a local named {}'.format(self.name, var.name))
+        self.locals.append(var)
+        return var
+
+    def removeVariable(self, var):
+        self._update()
+        self.locals.remove(var)
+
+    def getLocalVariables(self):
+        return list(self.locals)
+
+
+class FunctionManager(object):
+    def __init__(self, program):
+        self.program = program
+        self.functions = dict()
+        self.entries = []
+        self.queries = 0
+        self.updates = 0
+
+    def createFunction(self, name, entry, body, source):
+        self.updates += 1
+        if entry in self.functions:
+            raise ValueError('function already exists at {}'.format(entry))
+        function = Function(self, name, entry, body, source)
+        self.functions[entry] = function
+        bisect.insort(self.entries, entry.offset)
+        return function
+
+    def rename(self, function, name):
+        function.name = name
+
+    def removeFunction(self, entry):
+        self.updates += 1
+        if entry not in self.functions:
+            return False
+        del self.functions[entry]
+        self.entries.remove(entry.offset)
+        return True
+
+    def getFunctionAt(self, address):
+        self.queries += 1
+        return self.functions.get(address)
+
+    def getFunctionContaining(self, address):
+        self.queries += 1
+        # the closest entry point at or before the address (bodies don't overlap here)
+        i = bisect.bisect_right(self.entries, address.offset) - 1
+        if i < 0:
+            return None
+        function = self.functions[Address(self.entries[i])]
+        return function if function.body.contains(address) else None
+
+    def getFunctions(self, forward):
+        return iter(sorted(self.functions.values(), key=lambda function: function.entry.offset))
+
+    def getFunctionCount(self):
+        return len(self.functions)
+
+
+class ProgramFragment(object):
+    def __init__(self, name):
+        self.name = name
+        self.addresses = AddressSet()
+        self.moves = 0
+
+    def getName(self):
+        return self.name
+
+    def move(self, minAddress, maxAddress):
+        self.moves += 1
+        self.addresses.add(minAddress, maxAddress)
+
+    def contains(self, address):
+        return self.addresses.contains(address)
+
+
+class ProgramModule(object):
+    def __init__(self, name):
+        self.name = name
+        self.children = []
+        self.lookups = 0
+
+    def getName(self):
+        return self.name
+
+    def getChildren(self):
+        return list(self.children)
+
+    def getNumChildren(self):
+        return len(self.children)
+
+    def createFragment(self, name):
+        for child in self.children:
+            if child.name == name:
+                raise DuplicateNameException(name)
+        fragment = ProgramFragment(name)
+        self.children.append(fragment)
+        return fragment
+
+
+class Listing(object):
+    def __init__(self, program):
+        self.program = program
+        self.root = ProgramModule('root')
+        self.data = dict()
+
+    def getDefaultRootModule(self):
+        return self.root
+
+    def createData(self, address, dataType):
+        if address in self.data:
+            raise CodeUnitInsertionException('data already defined at {}'.format(address))
+        self.data[address] = dataType
+        return dataType
+
+    def getDataAt(self, address):
+        return self.data.get(address)
+
+    def clearCodeUnits(self, start, end, clearContext):
+        for address in [a for a in self.data if start.offset <= a.offset <= end.offset]:
+            del self.data[address]
+
+
+class StringPropertyMap(object):
+    def __init__(self, name):
+        self.name = name
+        self.values = dict()
+
+    def getName(self):
+        return self.name
+
+    def add(self, address, value):
+        self.values[address] = value
+
+    def getString(self, address):
+        return self.values.get(address)
+
+    def remove(self, address):
+        return self.values.pop(address, None) is not None
+
+    def getSize(self):
+        return len(self.values)
+
+    def getPropertyIterator(self):
+        return iter(sorted(self.values))
+
+
+class PropertyMapManager(object):
+    def __init__(self):
+        self.maps = dict()
+
+    def createStringPropertyMap(self, name):
+        if name in self.maps:
+            raise DuplicateNameException(name)
+        self.maps[name] = StringPropertyMap(name)
+        return self.maps[name]
+
+    def getStringPropertyMap(self, name):
+        return self.maps.get(name)
+
+    def removePropertyMap(self, name):
+        return self.maps.pop(name, None) is not None
+
+
+class Date(object):
+    def __init__(self, millis):
+        self.millis = millis
+
+    def getTime(self):
+        return self.millis
+
+
+class Program(object):
+    def __init__(self, name='mock.exe', blocks=None):
+        self.name = name
+        # every program is a different one, like a fresh import into Ghidra would be
+        self.creationDate = Date(int(time.time() * 1000) + id(self) % 1000)
+        self.memory = Memory(blocks or [])
+        self.listing = Listing(self)
+        self.dataTypeManager = DataTypeManager(name)
+        self.functionManager = FunctionManager(self)
+        self.symbolTable = SymbolTable()
+        self.propertyMapManager = PropertyMapManager()
+        self.registers = dict()
+        self.transactions = 0
+
+    def getName(self):
+        return self.name
+
+    def getExecutablePath(self):
+        return '/mock/' + self.name
+
+    def getExecutableMD5(self):
+        return hashlib.md5(self.name.encode('utf-8')).hexdigest()
+
+    def getCreationDate(self):
+        return self.creationDate
+
+    def getMemory(self):
+        return self.memory
+
+    def getListing(self):
+        return self.listing
+
+    def getMinAddress(self):
+        return min(block.getStart() for block in self.memory.getBlocks())
+
+    def getUsrPropertyManager(self):
+        return self.propertyMapManager
+
+    def getDataTypeManager(self):
+        return self.dataTypeManager
+
+    def getFunctionManager(self):
+        return self.functionManager
+
+    def getSymbolTable(self):
+        return self.symbolTable
+
+    def getRegister(self, name):
+        if name not in self.registers:
+            self.registers[name] = Register(name, 2 if len(name) == 2 else 4)
+        return self.registers[name]
+
+    def startTransaction(self, description):
+        self.transactions += 1
+        return self.transactions
+
+    def endTransaction(self, transactionID, commit):
+        pass
+
+
+class AutoAnalysisManager(object):
+    managers = dict()
+
+    def __init__(self, program):
+        self.program = program
+        self.ignoreChanges = False
+        self.functions = AddressSet()
+        self.data = AddressSet()
+
+    @staticmethod
+    def getAnalysisManager(program):
+        if id(program) not in AutoAnalysisManager.managers:
+            AutoAnalysisManager.managers[id(program)] = AutoAnalysisManager(program)
+        return AutoAnalysisManager.managers[id(program)]
+
+    def setIgnoreChanges(self, state):
+        previous = self.ignoreChanges
+        self.ignoreChanges = state
+        return previous
+
+    def functionDefined(self, addressSet):
+        self.functions.add(addressSet)
+
+    def dataDefined(self, addressSet):
+        self.data.add(addressSet)
+
+
+class TaskMonitor(object):
+    def __init__(self):
+        self.cancelled = False
+        self.maximum = 0
+        self.progress = 0
+        self.message = None
+
+    def initialize(self, maximum):
+        self.maximum = maximum
+        self.progress = 0
+
+    def setMaximum(self, maximum):
+        self.maximum = maximum
+
+    def setProgress(self, progress):
+        self.progress = progress
+
+    def incrementProgress(self, amount):
+        self.progress += amount
+
+    def getProgress(self):
+        return self.progress
+
+    def setMessage(self, message):
+        self.message = message
+
+    def setShowProgressValue(self, show):
+        pass
+
+    def setIndeterminate(self, indeterminate):
+        pass
+
+    def isCancelled(self):
+        return self.cancelled
+
+    def cancel(self):
+        self.cancelled = True
+
+    def checkCancelled(self):
+        if self.cancelled:
+            raise CancelledException()
+
+    checkCanceled = checkCancelled
+
+
+#
+# Java bits
+#
+
+class File(object):
+    def __init__(self, path):
+        self.absolutePath = path
+        self.path = path
+
+    def getAbsolutePath(self):
+        return self.absolutePath
+
+    def getPath(self):
+        return self.path
+
+    def getName(self):
+        return self.path.replace('\\', '/').split('/')[-1]
+
+    def getParentFile(self):
+        return File(self.path.rsplit('/', 1)[0])
+
+    def exists(self):
+        import os
+        return os.path.exists(self.path)
+
+    def __str__(self):
+        return self.path
+
+
+class FileReader(object):
+    def __init__(self, f):
+        self.path = f.absolutePath if isinstance(f, File) else str(f)
+
+
+class FileInputStream(FileReader):
+    pass
+
+
+class GZIPInputStream(object):
+    def __init__(self, stream):
+        self.path = stream.path
+
+
+class InputStreamReader(object):
+    """Text from a stream, which the mock's JsonReader reads directly."""
+
+    def __init__(self, stream, charset='UTF-8'):
+        import gzip
+        import io
+        if isinstance(stream, GZIPInputStream):
+            self.f = io.TextIOWrapper(gzip.open(stream.path, 'rb'), encoding=charset)
+        else:
+            self.f = io.open(stream.path, 'r', encoding=charset)
+
+    def read(self, size):
+        return self.f.read(size)
+
+    def close(self):
+        self.f.close()
+
+
+class BufferedReader(object):
+    def __init__(self, reader):
+        self.path = getattr(reader, 'path', None)
+        self.reader = reader
+
+    def read(self, size):
+        return self.reader.read(size)
+
+    def close(self):
+        self.reader.close()
+
+
+class String(object):
+    def __init__(self, text):
+        self.text = text
+
+    def toCharArray(self):
+        return self.text
+
+
+class JSONError(object):
+    JSMN_SUCCESS = 'JSMN_SUCCESS'
+
+
+class MapEntry(object):
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+    def getKey(self):
+        return self.key
+
+    def getValue(self):
+        return self.value
+
+
+class JavaMap(dict):
+    """A `java.util.Map` that can be used like the dict Jython makes it look like."""
+
+    def entrySet(self):
+        return [MapEntry(key, value) for key, value in self.items()]
+
+
+class JavaList(list):
+    def size(self):
+        return len(self)
+
+    def get(self, i):
+        return self[i]
+
+
+def _toJava(value):
+    if isinstance(value, dict):
+        return JavaMap((key, _toJava(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return JavaList(_toJava(item) for item in value)
+    return value
+
+
+class JSONParser(object):
+    def parse(self, chars, tokens):
+        return JSONError.JSMN_SUCCESS
+
+    def convert(self, chars, tokens):
+        return _toJava(json.loads(chars))
+
+
+class JsonToken(object):
+    BEGIN_OBJECT = 'BEGIN_OBJECT'
+    END_OBJECT = 'END_OBJECT'
+    BEGIN_ARRAY = 'BEGIN_ARRAY'
+    END_ARRAY = 'END_ARRAY'
+    NAME = 'NAME'
+    STRING = 'STRING'
+    NUMBER = 'NUMBER'
+    BOOLEAN = 'BOOLEAN'
+    NULL = 'NULL'
+    END_DOCUMENT = 'END_DOCUMENT'
+
+
+class JsonReader(object):
+    """A pull parser with the same interface as Gson's `JsonReader`, reading in chunks.
+
+    Like the real one it never holds more than a chunk of the file plus the current token,
+    so memory measurements of the streaming loader stay meaningful. Being Python, it is a
+    lot slower than Gson, so streaming loads look worse here than they are in Ghidra.
+    """
+
+    CHUNK = 1 << 16
+    NUMBER = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+    BETWEEN_BRACKETS = re.compile(r'(?:[^"\[\]{}]+|"(?:[^"\\]|\\.)*")*')
+    NOT_WHITESPACE = re.compile(r'[^ \t\n\r]')
+
+    def __init__(self, reader):
+        import io
+        if getattr(reader, 'path', None) is not None:
+            self.f = io.open(reader.path, 'r', encoding='utf-8')
+        else:
+            self.f = reader
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        # stack of ('object'|'array', state) where state is 'first', 'value', 'name' or 'next'
+        self.stack = []
+        self.peeked = None
+
+    def close(self):
+        self.f.close()
+
+    def _fill(self, needed=1):
+        while len(self.buf) - self.pos < needed and not self.eof:
+            chunk = self.f.read(self.CHUNK)
+            if not chunk:
+                self.eof = True
+                break
+            self.buf = self.buf[self.pos:] + chunk
+            self.pos = 0
+
+    def _skipWhitespace(self):
+        while True:
+            match = self.NOT_WHITESPACE.search(self.buf, self.pos)
+            if match is not None:
+                self.pos = match.start()
+                return self.buf[self.pos]
+            self.pos = len(self.buf)
+            if self.eof:
+                return None
+            self._fill()
+
+    def _expect(self, char):
+        c = self._skipWhitespace()
+        if c != char:
+            raise ValueError('expected {!r} but found {!r}'.format(char, c))
+        self.pos += 1
+
+    def peek(self):
+        if self.peeked is not None:
+            return self.peeked
+        if self.stack:
+            kind, state = self.stack[-1]
+            c = self._skipWhitespace()
+            if kind == 'array':
+                if c == ']':
+                    self.peeked = JsonToken.END_ARRAY
+                    return self.peeked
+                if state == 'next':
+                    self._expect(',')
+                self.stack[-1] = (kind, 'next')
+            else:
+                if state in ('first', 'next'):
+                    if c == '}':
+                        self.peeked = JsonToken.END_OBJECT
+                        return self.peeked
+                    if state == 'next':
+                        self._expect(',')
+                    self.peeked = JsonToken.NAME
+                    return self.peeked
+                self._expect(':')
+                self.stack[-1] = (kind, 'next')
+        c = self._skipWhitespace()
+        if c is None:
+            self.peeked = JsonToken.END_DOCUMENT
+        elif c == '{':
+            self.peeked = JsonToken.BEGIN_OBJECT
+        elif c == '[':
+            self.peeked = JsonToken.BEGIN_ARRAY
+        elif c == '"':
+            self.peeked = JsonToken.STRING
+        elif c in 'tf':
+            self.peeked = JsonToken.BOOLEAN
+        elif c == 'n':
+            self.peeked = JsonToken.NULL
+        else:
+            self.peeked = JsonToken.NUMBER
+        return self.peeked
+
+    def _consume(self, token):
+        actual = self.peek()
+        if actual != token:
+            raise ValueError('expected {} but found {}'.format(token, actual))
+        self.peeked = None
+
+    def hasNext(self):
+        token = self.peek()
+        return token not in (JsonToken.END_OBJECT, JsonToken.END_ARRAY, JsonToken.END_DOCUMENT)
+
+    def beginObject(self):
+        self._consume(JsonToken.BEGIN_OBJECT)
+        self._expect('{')
+        self.stack.append(('object', 'first'))
+
+    def endObject(self):
+        self._consume(JsonToken.END_OBJECT)
+        self._expect('}')
+        self.stack.pop()
+
+    def beginArray(self):
+        self._consume(JsonToken.BEGIN_ARRAY)
+        self._expect('[')
+        self.stack.append(('array', 'first'))
+
+    def endArray(self):
+        self._consume(JsonToken.END_ARRAY)
+        self._expect(']')
+        self.stack.pop()
+
+    def _readString(self):
+        self._expect('"')
+        # `_fill` may move the buffer around, so keep positions relative to `self.pos`
+        scanned = 0
+        while True:
+            end = self.buf.find('"', self.pos + scanned)
+            if end == -1:
+                if self.eof:
+                    raise ValueError('unterminated string')
+                scanned = len(self.buf) - self.pos
+                self._fill(scanned + self.CHUNK)
+                continue
+            backslashes = 0
+            while self.buf[end - 1 - backslashes] == '\\':
+                backslashes += 1
+            if backslashes % 2 == 0:
+                break
+            scanned = end + 1 - self.pos
+        text = self.buf[self.pos:end]
+        if '\\' in text:
+            text = json.loads('"' + text + '"')
+        self.pos = end + 1
+        return text
+
+    def nextName(self):
+        self._consume(JsonToken.NAME)
+        name = self._readString()
+        self.stack[-1] = ('object', 'value')
+        return name
+
+    def nextString(self):
+        token = self.peek()
+        self.peeked = None
+        if token == JsonToken.NUMBER:
+            self._fill(64)
+            match = self.NUMBER.match(self.buf, self.pos)
+            self.pos = match.end()
+            return match.group(0)
+        if token != JsonToken.STRING:
+            raise ValueError('expected a string but found {}'.format(token))
+        return self._readString()
+
+    def nextBoolean(self):
+        self._consume(JsonToken.BOOLEAN)
+        self._fill(5)
+        if self.buf.startswith('true', self.pos):
+            self.pos += 4
+            return True
+        self.pos += 5
+        return False
+
+    def nextNull(self):
+        self._consume(JsonToken.NULL)
+        self._fill(4)
+        self.pos += 4
+
+    def skipValue(self):
+        token = self.peek()
+        if token == JsonToken.NAME:
+            self.nextName()
+            token = self.peek()
+        if token not in (JsonToken.BEGIN_OBJECT, JsonToken.BEGIN_ARRAY):
+            if token == JsonToken.BOOLEAN:
+                self.nextBoolean()
+            elif token == JsonToken.NULL:
+                self.nextNull()
+            else:
+                self.nextString()
+            return
+        # jump from bracket to bracket instead of tokenizing everything in between
+        self.peeked = None
+        depth = 0
+        position = self.pos
+        while True:
+            position = self.BETWEEN_BRACKETS.match(self.buf, position).end()
+            if position >= len(self.buf) or self.buf[position] == '"':
+                # the end of the buffer, possibly in the middle of a string
+                if self.eof:
+                    raise ValueError('unterminated value')
+                # nothing before `position` is needed any more
+                self.pos = position
+                self._fill(len(self.buf) - self.pos + self.CHUNK)
+                position = self.pos
+                continue
+            depth += 1 if self.buf[position] in '[{' else -1
+            position += 1
+            if depth == 0:
+                self.pos = position
+                return
+
+
+#
+# wiring it all up
+#
+
+DEFAULT_BLOCKS = (('BEGTEXT', 0x10000, 0x4000000), ('SCODE', 0x4010000, 0x10000), ('DGROUP', 0x4020000, 0x1000000))
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+def install():
+    """Register the stand-in packages in `sys.modules` so the script's imports resolve to them."""
+    modules = {
+        'ghidra': _module('ghidra'),
+        'ghidra.program': _module('ghidra.program'),
+        'ghidra.program.model': _module('ghidra.program.model'),
+        'ghidra.program.model.symbol': _module('ghidra.program.model.symbol', SourceType=SourceType, SymbolType=SymbolType),
+        'ghidra.program.model.symbol.SourceType': _module(
+            'ghidra.program.model.symbol.SourceType',
+            DEFAULT=SourceType.DEFAULT, ANALYSIS=SourceType.ANALYSIS, IMPORTED=SourceType.IMPORTED, USER_DEFINED=SourceType.USER_DEFINED,
+        ),
+        'ghidra.program.model.data': _module(
+            'ghidra.program.model.data',
+            Undefined=Undefined, FunctionDefinitionDataType=FunctionDefinitionDataType, StructureDataType=StructureDataType,
+            CategoryPath=CategoryPath, VoidDataType=VoidDataType, AbstractIntegerDataType=AbstractIntegerDataType,
+            AbstractFloatDataType=AbstractFloatDataType, AbstractComplexDataType=AbstractComplexDataType,
+            TypedefDataType=TypedefDataType, DataTypeConflictHandler=DataTypeConflictHandler,
+            Pointer32DataType=Pointer32DataType, ArrayDataType=ArrayDataType, BuiltInDataType=BuiltInDataType,
+            ParameterDefinitionImpl=ParameterDefinition, FileDataTypeManager=FileDataTypeManager, DataType=DataType,
+        ),
+        'ghidra.program.model.util': _module('ghidra.program.model.util', CodeUnitInsertionException=CodeUnitInsertionException),
+        'ghidra.program.model.address': _module('ghidra.program.model.address', AddressSet=AddressSet, Address=Address),
+        'ghidra.program.model.listing': _module(
+            'ghidra.program.model.listing',
+            ParameterImpl=ParameterImpl, VariableStorage=VariableStorage, LocalVariableImpl=LocalVariableImpl,
+            Function=Function, ReturnParameterImpl=ReturnParameterImpl, ProgramFragment=ProgramFragment,
+        ),
+        'ghidra.util': _module('ghidra.util'),
+        'ghidra.util.exception': _module(
+            'ghidra.util.exception',
+            DuplicateNameException=DuplicateNameException, NotFoundException=NotFoundException, CancelledException=CancelledException,
+        ),
+        'ghidra.app': _module('ghidra.app'),
+        'ghidra.app.plugin': _module('ghidra.app.plugin'),
+        'ghidra.app.plugin.core': _module('ghidra.app.plugin.core'),
+        'ghidra.app.plugin.core.analysis': _module('ghidra.app.plugin.core.analysis', AutoAnalysisManager=AutoAnalysisManager),
+        'generic': _module('generic'),
+        'generic.json': _module('generic.json', JSONParser=JSONParser, JSONError=JSONError),
+        'com': _module('com'),
+        'com.google': _module('com.google'),
+        'com.google.gson': _module('com.google.gson'),
+        'com.google.gson.stream': _module('com.google.gson.stream', JsonReader=JsonReader, JsonToken=JsonToken),
+        'java': _module('java'),
+        'java.io': _module('java.io', BufferedReader=BufferedReader, FileReader=FileReader, File=File,
+                           FileInputStream=FileInputStream, InputStreamReader=InputStreamReader),
+        'java.util.zip': _module('java.util.zip', GZIPInputStream=GZIPInputStream),
+        'java.lang': _module('java.lang', String=String),
+        'java.util': _module('java.util', ArrayList=list, Map=JavaMap, List=JavaList),
+    }
+    sys.modules.update(modules)
+
+
+class FlatApi(object):
+    """The GhidraScript methods the script calls as globals, bound to one mock program."""
+
+    def __init__(self, program, exportPath, scriptPath, args=()):
+        self.program = program
+        self.exportPath = exportPath
+        self.scriptPath = scriptPath
+        self.args = list(args)
+        self.monitor = TaskMonitor()
+        self.commits = 0
+        self.analyzed = 0
+
+    def getAddressFactory(self):
+        return None
+
+    def toAddr(self, offset):
+        if isinstance(offset, str):
+            offset = int(offset, 16)
+        return Address(offset)
+
+    def askFile(self, title, approveButtonText):
+        return File(self.exportPath)
+
+    def getScriptArgs(self):
+        return list(self.args)
+
+    def getMemoryBlock(self, nameOrAddress):
+        return self.program.getMemory().getBlock(nameOrAddress)
+
+    def getMemoryBlocks(self):
+        return self.program.getMemory().getBlocks()
+
+    def getFragment(self, module, name):
+        module.lookups += 1
+        for child in module.children:
+            if child.name == name:
+                return child
+        return None
+
+    def createFragment(self, name, start, length):
+        fragment = self.program.getListing().getDefaultRootModule().createFragment(name)
+        fragment.move(start, start.add(length - 1))
+        return fragment
+
+    def createLabel(self, address, name, makePrimary, source=SourceType.USER_DEFINED):
+        return self.program.getSymbolTable().createLabel(address, name, source)
+
+    def createFunction(self, address, name):
+        return self.program.getFunctionManager().createFunction(name, address, AddressSet(address, address), SourceType.USER_DEFINED)
+
+    def getFunctionAt(self, address):
+        return self.program.getFunctionManager().getFunctionAt(address)
+
+    def removeFunctionAt(self, address):
+        self.program.getFunctionManager().removeFunction(address)
+
+    def removeDataAt(self, address):
+        self.program.getListing().clearCodeUnits(address, address, False)
+
+    def removeSymbol(self, address, name):
+        symbolTable = self.program.getSymbolTable()
+        for symbol in symbolTable.getSymbols(address):
+            if symbol.getName() == name:
+                return symbol.delete()
+        return False
+
+    def start(self):
+        self.program.startTransaction('script')
+
+    def end(self, commit):
+        self.commits += 1
+
+    def analyzeChanges(self, program):
+        self.analyzed += 1
+
+    def globals(self):
+        return {
+            '__name__': 'watcom_bench',
+            '__file__': self.scriptPath,
+            'currentProgram': self.program,
+            'currentSelection': None,
+            'currentAddress': None,
+            'currentLocation': None,
+            'monitor': self.monitor,
+            'sourceFile': File(self.scriptPath),
+            'state': None,
+            'writer': None,
+            'getAddressFactory': self.getAddressFactory,
+            'toAddr': self.toAddr,
+            'askFile': self.askFile,
+            'getScriptArgs': self.getScriptArgs,
+            'getMemoryBlock': self.getMemoryBlock,
+            'getMemoryBlocks': self.getMemoryBlocks,
+            'getFragment': self.getFragment,
+            'createFragment': self.createFragment,
+            'createLabel': self.createLabel,
+            'createFunction': self.createFunction,
+            'getFunctionAt': self.getFunctionAt,
+            'removeFunctionAt': self.removeFunctionAt,
+            'removeDataAt': self.removeDataAt,
+            'removeSymbol': self.removeSymbol,
+            'start': self.start,
+            'end': self.end,
+            'analyzeChanges': self.analyzeChanges,
+        }
+
+
+def makeProgram(name='mock.exe', blocks=DEFAULT_BLOCKS):
+    return Program(name, [MemoryBlock(*block) for block in blocks])
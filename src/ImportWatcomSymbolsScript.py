@@ -39,21 +39,104 @@ except:
 
 
 from ghidra.program.model.symbol.SourceType import *
-from ghidra.program.model.data import Undefined, FunctionDefinitionDataType, StructureDataType, CategoryPath, VoidDataType, AbstractIntegerDataType, AbstractFloatDataType, AbstractComplexDataType, TypedefDataType, DataTypeConflictHandler, Pointer32DataType, ArrayDataType
+from ghidra.program.model.data import Undefined, FunctionDefinitionDataType, StructureDataType, CategoryPath, VoidDataType, AbstractIntegerDataType, AbstractFloatDataType, AbstractComplexDataType, TypedefDataType, DataTypeConflictHandler, Pointer32DataType, ArrayDataType, FileDataTypeManager, DataType
 # import string
 from ghidra.program.model.util import CodeUnitInsertionException
 from ghidra.program.model.address import AddressSet
 from ghidra.program.model.listing import ParameterImpl, VariableStorage
-from ghidra.program.model.listing import LocalVariableImpl, Function
+from ghidra.program.model.listing import LocalVariableImpl, Function, ProgramFragment
 from ghidra.program.model.symbol import SourceType
 from ghidra.program.model.listing import ReturnParameterImpl
-from ghidra.util.exception import DuplicateNameException
+from ghidra.util.exception import CancelledException, NotFoundException
+from ghidra.app.plugin.core.analysis import AutoAnalysisManager
 
 
 from generic.json import JSONParser, JSONError
+from com.google.gson.stream import JsonReader, JsonToken
+from java.io import BufferedReader, File, FileInputStream, InputStreamReader
 from java.lang import String
 from java.util import ArrayList, Map, List
+from java.util.zip import GZIPInputStream
+import json
+import os
 import sys
+import time
+
+# the planner lives next to this script
+sys.path.append(os.path.dirname(sourceFile.getAbsolutePath()))
+from watcom_import_plan import (
+    addModuleTypes, checkpointManifest, computeTypeFingerprints, computeTypeNames, getReachableTypes, hash_module_types, inModules,
+    is_sharded_export, mergeModuleTypes, orderPendingTypes, planExport, planIncremental, plan_path_for,
+    read_plan, scopePlan, select_modules, shard_path_for, TypeTable, ARRAY_KINDS, CATEGORY_POINTER,
+    KIND_NAME, KIND_PROCEDURE, KIND_SCALAR, KIND_STRUCT, SHARD_SECTIONS, SHELL_KINDS, TYPE_CODE_NAMES,
+)
+import watcom_import_log as log
+import watcom_import_metrics as metrics
+
+# Walk the export one section (and one module) at a time with a streaming reader
+# instead of building the whole document in memory. Peak memory is then bounded by
+# the largest module rather than by the size of the JSON file.
+STREAMING_LOAD = True
+
+# Commit the import in transactions of this many symbols instead of one change per call,
+# and keep auto-analysis from reacting to every single change while we work. Analysis of
+# the functions and data we created is kicked off once, at the end.
+BATCH_SIZE = 2000
+DEFER_ANALYSIS = True
+
+# Write timers and counters for every phase to `<export>.metrics.json` at the end of the
+# run. Set PROFILE_INTERVAL to a number of seconds to also sample where the time goes.
+WRITE_METRICS = True
+PROFILE_INTERVAL = None
+
+# Keep the types of each import in a Ghidra data type archive (.gdt), keyed by a hash of
+# the export's type tables, and take them from there the next time an export with the same
+# types is imported instead of making them all over again. Each export gets a directory of
+# its own in `watcom-type-archives` (next to the export by default, or TYPE_ARCHIVE_DIR), and
+# only the TYPE_ARCHIVE_KEEP most recently used archives in it are kept. REBUILD_TYPE_ARCHIVE
+# ignores (and replaces) a matching archive.
+USE_TYPE_ARCHIVE = True
+REBUILD_TYPE_ARCHIVE = False
+TYPE_ARCHIVE_DIR = None
+TYPE_ARCHIVE_KEEP = 4
+
+# Only messages at LOG_LEVEL and up reach the console, and a warning that keeps repeating
+# is only printed the first few times and then summarized at the end. With WRITE_LOG,
+# everything down to a line per symbol also goes to `<export>.log`.
+LOG_LEVEL = log.INFO
+WRITE_LOG = True
+
+# Types are only made when a symbol uses them, along with the types those refer to, and the
+# rest are counted as unreachable. Set MATERIALIZE_ALL_TYPES to make every type of every
+# module anyway, say to have all the structs around for annotating by hand.
+MATERIALIZE_ALL_TYPES = False
+
+# Label the start and end of every block (scope) inside a function, as block_start_<offset>
+# and block_end_<offset>. That's two labels per block, set it to False to skip them.
+BLOCK_LABELS = True
+
+# The options above that script arguments can set when running headless, see `main()`.
+SCRIPT_OPTIONS = (
+    'STREAMING_LOAD', 'BATCH_SIZE', 'DEFER_ANALYSIS', 'WRITE_METRICS', 'PROFILE_INTERVAL',
+    'USE_TYPE_ARCHIVE', 'REBUILD_TYPE_ARCHIVE', 'TYPE_ARCHIVE_DIR', 'TYPE_ARCHIVE_KEEP',
+    'LOG_LEVEL', 'WRITE_LOG', 'INCREMENTAL', 'MODULE_FILTER', 'ADDRESS_RANGE',
+    'SELECTION_ONLY', 'MATERIALIZE_ALL_TYPES', 'BLOCK_LABELS',
+)
+
+# Record what each import did in a manifest, and on the next import into the same program
+# only apply what changed since: new and changed functions, labels and data are applied,
+# and the ones that are gone from the export are removed again. The manifest is kept in
+# the program, so it is saved, undone and thrown away along with what the import did.
+INCREMENTAL = True
+
+# Only import part of the export: the modules whose name matches one of the MODULE_FILTER
+# globs (say ['gfx*.c', 'main.c']), what lies between the two ADDRESS_RANGE addresses (say
+# ('0x10000', '0x1ffff')), and, with SELECTION_ONLY, what is selected in the listing. When
+# more than one is set, only what passes all of them is imported. Types are only made when
+# something in scope uses them. A scoped import never removes anything.
+MODULE_FILTER = None
+ADDRESS_RANGE = None
+SELECTION_ONLY = False
 
 # currentProgram
 # currentSelection
@@ -82,7 +165,8 @@ def java_to_python(obj):
 
 def load_json_as_py(f):
     """Return JSON at `path` as native Python dict/list (raises on parse error)."""
-    text = file(f.absolutePath, "r").read()
+    with open(f.absolutePath, "r") as jsonFile:
+        text = jsonFile.read()
     #print(text)
     chars = String(text).toCharArray()          # parser expects a char[]
     tokens = ArrayList()                        # List<JSONToken>
@@ -95,123 +179,517 @@ def load_json_as_py(f):
     # return java_to_python(parsed)
     return parsed
 
+def read_json_value(reader):
+    """Read the JSON value at the reader's position as native Python dict/list/primitive."""
+    token = reader.peek()
+    if token == JsonToken.BEGIN_OBJECT:
+        obj = {}
+        reader.beginObject()
+        while reader.hasNext():
+            name = reader.nextName()
+            obj[name] = read_json_value(reader)
+        reader.endObject()
+        return obj
+    if token == JsonToken.BEGIN_ARRAY:
+        out = []
+        reader.beginArray()
+        while reader.hasNext():
+            out.append(read_json_value(reader))
+        reader.endArray()
+        return out
+    if token == JsonToken.NUMBER:
+        text = reader.nextString()
+        if '.' in text or 'e' in text or 'E' in text:
+            return float(text)
+        return int(text)
+    if token == JsonToken.BOOLEAN:
+        return reader.nextBoolean()
+    if token == JsonToken.NULL:
+        reader.nextNull()
+        return None
+    return reader.nextString()
+
+def openJsonReader(f):
+    stream = FileInputStream(f)
+    if f.getName().endswith('.gz'):
+        stream = GZIPInputStream(stream)
+    return JsonReader(BufferedReader(InputStreamReader(stream, 'UTF-8')))
 
+def skip_json_value(reader):
+    reader.skipValue()
 
-f = askFile("Give me a file to open", "Go baby go!")
+def read_module_index(reader):
+    """Read the record at the reader's position, but only keep its `moduleIndex`."""
+    moduleIndex = None
+    reader.beginObject()
+    while reader.hasNext():
+        if reader.nextName() == 'moduleIndex':
+            moduleIndex = read_json_value(reader)
+        else:
+            reader.skipValue()
+    reader.endObject()
+    return moduleIndex
 
-data = load_json_as_py(f)
-# print(type(data))       # <type 'dict'>
-# print(data.keys())      # dict keys
-debuggingRegion = data["debuggingRegion"]
-modules = debuggingRegion["modules"]     
-modulesDict = dict()
-for module in modules:
-    modulesDict[module['moduleIndex']] = module
+def iterate_json_section(f, sectionName):
+    """Yield the records of `debuggingRegion[sectionName]` one at a time.
 
-modulesLocals = debuggingRegion["modulesLocals"]
+    Everything else in the file is skipped without being materialized.
+    """
+    reader = openJsonReader(f)
+    try:
+        reader.beginObject()
+        while reader.hasNext():
+            if reader.nextName() != 'debuggingRegion':
+                reader.skipValue()
+                continue
+            reader.beginObject()
+            while reader.hasNext():
+                if reader.nextName() != sectionName:
+                    reader.skipValue()
+                    continue
+                reader.beginArray()
+                while reader.hasNext():
+                    yield read_json_value(reader)
+                reader.endArray()
+                return
+            return
+    finally:
+        reader.close()
+
+def collect_json_sections(f, sectionReaders):
+    """Read a few sections of `debuggingRegion` in one pass over the file.
+
+    `sectionReaders` maps each section to what reads one of its records. Returns the records
+    of each section, none for a section the file doesn't have.
+    """
+    sections = dict((sectionName, []) for sectionName in sectionReaders)
+    pending = set(sectionReaders)
+    reader = openJsonReader(f)
+    try:
+        reader.beginObject()
+        while reader.hasNext() and pending:
+            if reader.nextName() != 'debuggingRegion':
+                reader.skipValue()
+                continue
+            reader.beginObject()
+            while reader.hasNext() and pending:
+                sectionName = reader.nextName()
+                if sectionName not in pending:
+                    reader.skipValue()
+                    continue
+                pending.discard(sectionName)
+                readRecord = sectionReaders[sectionName]
+                records = sections[sectionName]
+                reader.beginArray()
+                while reader.hasNext():
+                    records.append(readRecord(reader))
+                reader.endArray()
+    finally:
+        reader.close()
+    return sections
+
+# set by loadPlan: whether `f` is the index of a sharded export, and the modules that
+# MODULE_FILTER picked (None for all of them)
+shardedExport = False
+selectedModules = None
+
+def iterate_shard_section(f, sectionName, moduleIndices = None):
+    """Yield the records of `sectionName` from the shards of the modules in `moduleIndices`.
+
+    The other shards aren't even opened.
+    """
+    for shard in iterate_json_section(f, 'shards'):
+        if inModules(moduleIndices, shard['moduleIndex']):
+            for record in iterate_json_section(File(shard_path_for(f.absolutePath, shard)), sectionName):
+                yield record
+
+def iterate_export_section(f, sectionName, moduleIndices = None):
+    """Like `iterate_json_section`, but also for the sections a sharded export keeps in its shards.
+
+    `moduleIndices` only saves reading, the records of other modules can still come up.
+    """
+    if shardedExport and sectionName in SHARD_SECTIONS:
+        return iterate_shard_section(f, sectionName, moduleIndices)
+    return iterate_json_section(f, sectionName)
+
+def iterate_module_types(f, moduleIndices = None):
+    """Yield (moduleIndex, entries) from `modulesTypes`, merging the records of each module.
+
+    With `moduleIndices`, only for those modules.
+    """
+    currentIndex = None
+    entries = None
+    for moduleType in iterate_export_section(f, 'modulesTypes', moduleIndices):
+        moduleIndex = moduleType['meta']['moduleIndex']
+        if not inModules(moduleIndices, moduleIndex):
+            continue
+        if moduleIndex != currentIndex:
+            if currentIndex is not None:
+                yield currentIndex, entries
+            currentIndex = moduleIndex
+            entries = []
+        entries.extend(moduleType['entries'])
+    if currentIndex is not None:
+        yield currentIndex, entries
 
-modulesTypes = debuggingRegion["modulesTypes"]
-modulesTypesDict = dict()
-for moduleType in modulesTypes:
-    moduleIndex = moduleType['meta']['moduleIndex']
-    entries = modulesTypesDict.get(moduleIndex, [])
-    entries.extend(moduleType['entries'])
-    modulesTypesDict[moduleIndex] = entries
-    if len(entries) > 0 and entries[0]['selfIndex'] != 0:
-        entries.insert(0, {'selfIndex': 0, 'typeName': 'dummy'})
-    # print(moduleIndex)
-# print(modulesTypesDict)
-
-globalSymbolsTable = debuggingRegion["globalSymbolsTable"]
-addressesTable = debuggingRegion["addressesTable"]
 
 listing = currentProgram.getListing()
 rootProgramModule = listing.getDefaultRootModule()
 dtm = currentProgram.getDataTypeManager()
+functionManager = currentProgram.getFunctionManager()
+symbolTable = currentProgram.getSymbolTable()
 
+# what the segments are called when the export has no `segmentMap` (exports from before
+# there was one), or the program isn't loaded where the executable says it should be
 segmentToName = {1: 'BEGTEXT', 2: 'SCODE', 3: 'DGROUP' }
 
-def getMemoryBlockFromSegment(segment):
-    # memoryBlock = getMemoryBlock('.object' + str(segment))
-    memoryBlock = getMemoryBlock(segmentToName[segment])
-    return memoryBlock
+# the address each segment starts at, indexed by segment number
+segmentBases = []
+
+def buildSegmentBases(segments, segmentMap):
+    """Work out where every segment starts once, so translating an address is an index."""
+    global segmentBases
+    memory = currentProgram.getMemory()
+    bases = dict()
+    for entry in segmentMap:
+        base = toAddr(entry['base'])
+        if memory.contains(base):
+            bases[entry['segment']] = base
+        else:
+            log.warning('segment {} should start at {}, but the program has no memory there', entry['segment'], base)
+    for segment, name in segmentToName.items():
+        if segment not in bases:
+            memoryBlock = getMemoryBlock(name)
+            if memoryBlock is not None:
+                bases[segment] = memoryBlock.getStart()
+    for segment in segments:
+        if segment not in bases:
+            log.warning('no idea where segment {} is, symbols in it will fail', segment)
+    segmentBases = [bases.get(segment) for segment in range(max(bases) + 1 if bases else 0)]
+    log.debug('Segments start at {}', ', '.join('{}: {}'.format(segment, base) for segment, base in sorted(bases.items())))
 
 def getAddressFromSegment(segment, address):
-    memoryBlock = getMemoryBlockFromSegment(segment)
-    return memoryBlock.getStart().add(address)
-
-def groupIntoFragments():
-    for addrTable in addressesTable:
-        segment = addrTable["segment"]
-        memoryBlock = getMemoryBlock(segmentToName[segment])
-        # print(memoryBlock)
-        # print(memoryBlock.getStart())
-        for addrInfo in addrTable["addressInfo"]:
-            module = modules[addrInfo["moduleIndex"]]
-            fragmentName = module["name"]
-            #print(module)
-            startAddress = memoryBlock.getStart().add(addrInfo["address"])
-            # print(startAddress)
-            # startAddress = toAddr(addrInfo["address"])
-            fragment = getFragment(rootProgramModule, fragmentName)
-            try:
-                if fragment is None:
-                    # print("fragment was None")
-                    fragment = createFragment(module["name"], startAddress, addrInfo["size"])
-                else:
-                    # print("fragment found")
-                    endAddress = startAddress.add(addrInfo["size"])
-                    fragment.move(startAddress, endAddress)
-            except (Exception, ghidra.util.exception.NotFoundException) as e:
-                print("Exception!")
-                print(e)
+    return segmentBases[segment].add(address)
+
+analysisManager = AutoAnalysisManager.getAnalysisManager(currentProgram)
+analysisFunctions = AddressSet()
+analysisData = AddressSet()
+ignoredChanges = None
+
+batchSymbols = 0
+batchNumber = 0
+batchStartTime = time.time()
+
+def suspendAnalysis():
+    global ignoredChanges
+    if DEFER_ANALYSIS:
+        ignoredChanges = analysisManager.setIgnoreChanges(True)
+
+def restoreAnalysis():
+    """Switch auto-analysis back to how it was before `suspendAnalysis`, whatever happened."""
+    global ignoredChanges
+    if ignoredChanges is None:
+        return
+    analysisManager.setIgnoreChanges(ignoredChanges)
+    ignoredChanges = None
+
+def resumeAnalysis():
+    if ignoredChanges is None:
+        return
+    restoreAnalysis()
+    if not analysisFunctions.isEmpty():
+        analysisManager.functionDefined(analysisFunctions)
+    if not analysisData.isEmpty():
+        analysisManager.dataDefined(analysisData)
+    if cancelled:
+        # auto-analysis gets to them, when it's on
+        log.info('Not analyzing the {} functions and {} data addresses made, the import was cancelled',
+                 analysisFunctions.getNumAddressRanges(), analysisData.getNumAddressRanges())
+        return
+    log.info('Analyzing {} functions and {} data addresses', analysisFunctions.getNumAddressRanges(), analysisData.getNumAddressRanges())
+    analyzeChanges(currentProgram)
+
+def batchTick(count = 1):
+    global batchSymbols
+    batchSymbols += count
+    # not in the middle of a function's signature and locals, they are written in one go
+    if batchSymbols >= BATCH_SIZE and pendingRoutine is None:
+        commitBatch()
+
+def commitBatch():
+    global batchSymbols, batchNumber, batchStartTime
+    flushRoutine()
+    if batchSymbols == 0:
+        return
+    commitStartTime = time.time()
+    end(True)
+    start()
+    metrics.addTime('commit', time.time() - commitStartTime)
+    metrics.count('batches')
+    elapsed = time.time() - batchStartTime
+    batchNumber += 1
+    log.info('batch {}: {} symbols in {:.2f}s ({:.0f} symbols/s)', batchNumber, batchSymbols, elapsed, batchSymbols / max(elapsed, 0.001))
+    batchSymbols = 0
+    batchStartTime = time.time()
+    showProgress()
+
+#
+# progress and cancelling
+#
+
+# How much there is of each phase, counted from the export before anything is applied:
+# fragments, locals and types go by module, globals by symbol. A phase without a total
+# (loading, removing) shows as busy.
+progressTotals = dict()
+progressPhase = None
+progressStartTime = time.time()
+
+# set when the user cancelled the import, what was done up to there is kept
+cancelled = False
+
+def countProgressTotals(modules, globalSymbolModules):
+    """`globalSymbolModules` has an item per global symbol, its module when MODULE_FILTER is set."""
+    moduleCount = len(modules) if selectedModules is None else len(selectedModules)
+    for phase in ('fragments', 'locals', 'types'):
+        progressTotals[phase] = moduleCount
+    progressTotals['globals'] = sum(1 for moduleIndex in globalSymbolModules if inModules(selectedModules, moduleIndex))
+
+def startProgress(phase, progress = 0):
+    global progressPhase, progressStartTime
+    progressPhase = phase
+    progressStartTime = time.time()
+    total = progressTotals.get(phase)
+    monitor.setMessage('Watcom symbols: {}'.format(phase))
+    monitor.setIndeterminate(total is None)
+    if total is not None:
+        monitor.initialize(total)
+        monitor.setProgress(progress)
+
+def showProgress():
+    """Say how far along the phase is, and about how long the rest of it will take."""
+    total = progressTotals.get(progressPhase)
+    done = monitor.getProgress()
+    if not total or done <= 0:
+        return
+    remaining = (time.time() - progressStartTime) * max(total - done, 0) / done
+    monitor.setMessage('Watcom symbols: {} {} of {}, about {:.0f}s left'.format(progressPhase, done, total, remaining))
+
+def trackProgress(ops):
+    """Pass the plan on, moving the monitor along as it is walked. What the scope or the
+    manifest leave out of it still counts."""
+    phase = None
+    module = None
+    for op in ops:
+        if op['op'] == 'phase':
+            phase = op['name']
+            module = None
+        elif phase != 'locals':
+            monitor.incrementProgress(1)
+        elif op.get('module', module) != module:
+            module = op['module']
+            monitor.incrementProgress(1)
+        yield op
+
+def checkCancelled():
+    """Stop if the user cancelled, with everything applied so far committed."""
+    if monitor.isCancelled():
+        commitBatch()
+        raise CancelledException()
 
 def createTypeCategory(name):
     return CategoryPath(name) 
 
+def addDataType(dataType):
+    metrics.count('types.addDataType')
+    return dtm.addDataType(dataType, DataTypeConflictHandler.REPLACE_HANDLER)
+
+modulesDict = dict()
+modulesTypesDict = dict()
 typeCache = dict()
-def createType(moduleIndex, typeIndex, withName = None, withNameIndex = None):
+
+# Types that are structurally identical in different modules (think `struct FILE` or
+# `size_t`) share a single Ghidra DataType, keyed by (fingerprint, name).
+canonicalTypes = dict()
+fingerprintCache = dict()
+typeNames = dict()
+duplicateTypesCollapsed = 0
+
+def prepareModuleTypes(moduleIndex):
     if moduleIndex not in typeCache:
         typeCache[moduleIndex] = dict()
+    if moduleIndex not in fingerprintCache:
+        types = modulesTypesDict[moduleIndex]
+        fingerprintCache[moduleIndex] = computeTypeFingerprints(types)
+        typeNames[moduleIndex] = computeTypeNames(types)
+
+def createType(moduleIndex, typeIndex, withName = None):
+    referencedTypes.setdefault(moduleIndex, set()).add(typeIndex)
+    if archivedTypeIds is not None:
+        if withName is None:
+            dataType = getArchivedType(moduleIndex, typeIndex)
+        else:
+            dataType = getArchivedFunctionType(moduleIndex, typeIndex, withName)
+        if dataType is not NOT_ARCHIVED:
+            metrics.count('types.archiveHits')
+            return dataType
+    ensureModuleTypes(moduleIndex)
+    prepareModuleTypes(moduleIndex)
     if typeIndex in typeCache[moduleIndex]:
-        return typeCache[moduleIndex][typeIndex]
+        metrics.count('types.cacheHits')
     else:
-        pass
-        # We were setting key to prevent loops, but we need pointers to recurse sometimes.
-        # Instead, now we popular the cache early in specific places in `innerCreateType`
-        # typeCache[moduleIndex][typeIndex] = None
-    
-    result = innerCreateType(moduleIndex, typeIndex, withName, withNameIndex)
-    typeCache[moduleIndex][typeIndex] = result
-    return result
+        metrics.count('types.cacheMisses')
+        materializeTypes(moduleIndex, typeIndex, withName)
+    dataType = typeCache[moduleIndex].get(typeIndex)
+    if createdTypes is not None:
+        if withName is not None and modulesTypesDict[moduleIndex].kinds[typeIndex] == KIND_PROCEDURE:
+            recordFunctionType(moduleIndex, typeIndex)
+        else:
+            createdTypes[(moduleIndex, typeIndex)] = dataType
+    return dataType
+
+def getCanonicalKey(moduleIndex, typeIndex, name):
+    types = modulesTypesDict[moduleIndex]
+    if types.kinds[typeIndex] not in SHELL_KINDS:
+        name = None
+    return (fingerprintCache[moduleIndex].get(typeIndex), name)
+
+def getShellName(moduleIndex, typeIndex, rootIndex, withName):
+    if typeIndex == rootIndex and withName is not None:
+        return withName
+    return typeNames[moduleIndex].get(typeIndex)
+
+@metrics.timed('types.materialize')
+def materializeTypes(moduleIndex, rootIndex, withName = None):
+    """Create `rootIndex` and everything it needs that doesn't exist yet, visiting each entry once.
+
+    1. walk the not yet materialized part of the type graph reachable from the root. Entries
+       that are structurally identical to a type we already made are reused on the spot.
+    2. add struct and function definition shells.
+    3. create the remaining types and fill in the shells in dependency order (see
+       `orderPendingTypes`).
+    """
+    global duplicateTypesCollapsed
+    types = modulesTypesDict[moduleIndex]
+    kinds = types.kinds
+    children = types.children
+    cache = typeCache[moduleIndex]
+
+    pending = []
+    shellNames = dict()
+    seen = set([rootIndex])
+    queue = [rootIndex]
+    for typeIndex in queue:
+        name = getShellName(moduleIndex, typeIndex, rootIndex, withName)
+        canonicalKey = getCanonicalKey(moduleIndex, typeIndex, name)
+        if canonicalKey[0] is not None and canonicalKey in canonicalTypes:
+            duplicateTypesCollapsed += 1
+            metrics.count('types.shared')
+            cache[typeIndex] = canonicalTypes[canonicalKey]
+            continue
+        pending.append(typeIndex)
+        shellNames[typeIndex] = name
+        for child in children[typeIndex]:
+            if 0 < child < len(types) and child not in cache and child not in seen:
+                seen.add(child)
+                queue.append(child)
+
+    for typeIndex in pending:
+        if kinds[typeIndex] in SHELL_KINDS:
+            shell = createShellType(moduleIndex, typeIndex, shellNames[typeIndex])
+            cache[typeIndex] = shell
+            canonicalTypes[getCanonicalKey(moduleIndex, typeIndex, shellNames[typeIndex])] = shell
+
+    for typeIndex in orderPendingTypes(types, pending):
+        if kinds[typeIndex] in SHELL_KINDS:
+            fillShellType(moduleIndex, typeIndex, cache[typeIndex])
+        else:
+            result = createValueType(moduleIndex, typeIndex)
+            cache[typeIndex] = result
+            if result is not None:
+                canonicalTypes[getCanonicalKey(moduleIndex, typeIndex, None)] = result
+
+def createShellType(moduleIndex, typeIndex, name):
+    module = modulesDict[moduleIndex]
+    types = modulesTypesDict[moduleIndex]
+    if types.kinds[typeIndex] == KIND_STRUCT:
+        categoryPath = createTypeCategory('/' + module['name'] + '/struct')
+        structName = name if name is not None else "unnamed_struct_{}".format(typeIndex)
+        structBytes = types.details[typeIndex][0]
+        struct = StructureDataType(categoryPath, structName, structBytes)
+        return addDataType(struct)
+    else:
+        categoryPath = createTypeCategory('/' + module['name'])
+        funcName = name if name is not None else "unnamed_funcptr_{}".format(typeIndex)
+        func = FunctionDefinitionDataType(categoryPath, funcName)
+        return addDataType(func)
 
-def innerCreateType(moduleIndex, typeIndex, withName = None, withNameIndex = None):
+def fillShellType(moduleIndex, typeIndex, shell):
+    types = modulesTypesDict[moduleIndex]
+    cache = typeCache[moduleIndex]
+    details = types.details[typeIndex]
+    if types.kinds[typeIndex] == KIND_STRUCT:
+        struct = shell
+        for f in details[1]:
+            fieldKind, fieldName, fieldOffset, fieldType, startBit, bitSize = f
+            fieldDataType = cache.get(fieldType)
+            if fieldDataType is not None:
+                try:
+                    if fieldKind.startswith("STRUCTURE_FIELD"):
+                        struct.replaceAtOffset(fieldOffset, fieldDataType, -1, fieldName, None)
+                    elif fieldKind.startswith("STRUCTURE_BIT"):
+                        # startBit, bitSize
+                        # byteoffset, byteWidth, bitOffset, datatype, bitsize, name, comment
+                        struct.insertBitFieldAt(fieldOffset, fieldDataType.getLength(), startBit, fieldDataType, bitSize, fieldName, None)
+                    else:
+                        log.warning('unhandled subtype! {}'.format(fieldKind))
+                except:
+                    metrics.count('exceptions.structField')
+                    log.warning('Exception! Failed to add subtype! {}', f)
+            else:
+                metrics.count('types.missingFieldType')
+                log.warning('failed to add field {}: could not get type. field: {} type: {}', fieldName, f, types.describe(fieldType))
+    else:
+        retType, paramTypes = details
+        fillFunctionType(shell, cache.get(retType), [cache.get(paramType) for paramType in paramTypes])
+
+def fillFunctionType(func, returnType, paramTypes):
+    """Set the return type and parameters of function definition `func`."""
+    #   print("returnType: {}, paramTypes: {}".format(returnType, paramTypes))
+    func.setReturnType(returnType)
+    for i in range(len(paramTypes)):
+        paramType = paramTypes[i]
+        # print("foo: {}, {}".format(paramType, i))
+        if paramType is not None and paramType != VoidDataType.dataType:
+            try:
+                func.replaceArgument(i, None, paramType, None, SourceType.IMPORTED)
+            except:
+                metrics.count('exceptions.functionArgument')
+                log.warning('failed to replace arg! func: {} arg: {} type: {}', func.getName(), i, paramType.getName())
+        elif paramType is None:
+            log.warning('func {} arg {} type is None', func.getName(), i)
+
+def createValueType(moduleIndex, typeIndex):
+    """Create a type that isn't a shell. Everything it refers to is already in `typeCache`."""
     # print(moduleIndex, typeIndex)
     module = modulesDict[moduleIndex]
     types = modulesTypesDict[moduleIndex]
-    typeRoot = types[typeIndex]
-    entryType = typeRoot['typeName']
-    category = typeRoot['categoryName']
-    nameOfType = typeRoot.get('name')
-
-    if entryType == 'NAME':
-        typeCache[moduleIndex][typeIndex] = None # these are immutable, so we can't create a "shell" early
-        scopeCode = typeRoot['scope']
-        scopeName = types[scopeCode]['name'] if scopeCode != 0 else None
-        aliasFor = typeRoot['type']
+    cache = typeCache[moduleIndex]
+    kind = types.kinds[typeIndex]
+    category = types.categories[typeIndex]
+    nameOfType = types.names[typeIndex]
+    details = types.details[typeIndex]
+
+    if kind == KIND_NAME:
+        scopeCode, aliasFor = details
+        scopeName = types.names[scopeCode] if scopeCode != 0 else None
         aliasForType = None
 
         # print('nameOfType is {} scope: {} aliasFor: {}'.format(nameOfType, scopeName, aliasFor))
 
         if scopeName is None or scopeName == 'struct':
-            # typeRootForAliasFor = types[aliasFor]
-            # print(typeRootForAliasFor)
-            #if typeRootForAliasFor['typeName'] != 'NAME':
-            aliasForType = createType(moduleIndex, aliasFor, withName=nameOfType, withNameIndex=typeIndex)
-            #else:
-            #    print("warning: typeIndex {} nameOfType {} points to {} ".format(typeIndex, nameOfType, typeRootForAliasFor))
+            aliasForType = cache.get(aliasFor)
         else:
-            print('skipped due to scope: nameOfType is {} scope: {} aliasFor: {}'.format(nameOfType, scopeName, aliasFor))
+            log.warning('skipped due to scope: nameOfType is {} scope: {} aliasFor: {}', nameOfType, scopeName, aliasFor)
 
         if aliasForType is not None:
             if scopeName is None:
@@ -219,13 +697,12 @@ def innerCreateType(moduleIndex, typeIndex, withName = None, withNameIndex = Non
                 rv = TypedefDataType(categoryPath, nameOfType, aliasForType, dtm)
 
                 # print('new type: ', rv)
-                return dtm.addDataType(rv, DataTypeConflictHandler.REPLACE_HANDLER)
+                return addDataType(rv)
             else:
                 # don't create a new global name for a struct/union/enum
                 return aliasForType
-    elif entryType == 'SCALAR':
-        scalarSize = typeRoot['scalarTypeSizeInBytes']
-        scalarCategory = typeRoot['scalarTypeClassName']
+    elif kind == KIND_SCALAR:
+        scalarCategory, scalarSize = details
         if scalarCategory == 'void':
             return VoidDataType.dataType
         elif scalarCategory == 'int':
@@ -236,79 +713,23 @@ def innerCreateType(moduleIndex, typeIndex, withName = None, withNameIndex = Non
             return AbstractFloatDataType.getFloatDataType(scalarSize, dtm)
         elif scalarCategory == 'complex':
             return AbstractComplexDataType.getComplexDataType(scalarSize, dtm)
-    elif category == 'POINTER':
-        baseTypeCode = typeRoot['baseType']
-        baseLocator = typeRoot.get('baseLocator') # todo
+    elif category == CATEGORY_POINTER:
+        baseTypeCode, _, baseLocator = details # todo
         if baseLocator is not None:
-            print('unhandled baseLocator! {}'.format(baseLocator))
+            log.warning('unhandled baseLocator! {}', baseLocator)
 
-        baseType = createType(moduleIndex, baseTypeCode)
+        baseType = cache.get(baseTypeCode)
         if baseType is not None:
             return Pointer32DataType(baseType)
         else:
-            print("pointer: failed to get base type! pointer type: {} base type: {}".format(typeRoot, types[baseTypeCode]))
+            log.warning("pointer: failed to get base type! pointer type: {} base type: {}", types.describe(typeIndex), types.describe(baseTypeCode))
         # print('pointer: ', baseTypeCode, baseLocator)
-    elif entryType == 'ARRAY_BYTE_INDEX' or entryType == 'ARRAY_WORD_INDEX' or entryType == 'ARRAY_LONG_INDEX':
-        baseTypeCode = typeRoot['baseType']
-        highBound = typeRoot['highBound']
-        baseType = createType(moduleIndex, baseTypeCode)
+    elif kind in ARRAY_KINDS:
+        baseTypeCode, highBound, _ = details
+        baseType = cache.get(baseTypeCode)
         if baseType is not None:
             return ArrayDataType(baseType, highBound + 1)
         # print('array type:', baseTypeCode, highBound)
-    elif entryType == 'STRUCTURE_LIST':
-        categoryPath = createTypeCategory('/' + module['name'] + '/struct')
-        structName = withName if withName is not None else "unnamed_struct_{}".format(typeIndex)
-        structBytes = typeRoot.get('size', 0)
-        struct = StructureDataType(categoryPath, structName, structBytes)
-        struct = dtm.addDataType(struct, DataTypeConflictHandler.REPLACE_HANDLER)
-        typeCache[moduleIndex][typeIndex] = struct # update cache now, in case some field is a pointer to us
-        if withNameIndex is not None:
-            typeCache[moduleIndex][withNameIndex] = struct # prevent infinite recursion
-
-        for f in typeRoot['fields']:
-            fieldDataType = createType(moduleIndex, f['type'])
-            if fieldDataType is not None:
-                try:
-                    if f['typeName'].startswith("STRUCTURE_FIELD"):
-                        struct.replaceAtOffset(f['offset'], fieldDataType, -1, f['name'], None)
-                    elif f['typeName'].startswith("STRUCTURE_BIT"):
-                        # startBit, bitSize
-                        # byteoffset, byteWidth, bitOffset, datatype, bitsize, name, comment
-                        struct.insertBitFieldAt(f['offset'], fieldDataType.getLength(), f['startBit'], fieldDataType, f['bitSize'], f['name'], None)
-                    else:
-                        print('unhandled subtype! {}'.format(f['typeName']))
-                except:
-                    print('Exception! Failed to add subtype! {}'.format(f))
-            else:
-                print('warning: failed to add field {}: could not get type. field: {} type: {}'.format(f['name'], f, types[f['type']]))
-
-        return struct
-    elif entryType == 'PROCEDURE_NEAR386':
-        categoryPath = createTypeCategory('/' + module['name'])
-        funcName = withName if withName is not None else "unnamed_funcptr_{}".format(typeIndex)
-        func = FunctionDefinitionDataType(categoryPath, funcName)
-        func = dtm.addDataType(func, DataTypeConflictHandler.REPLACE_HANDLER)
-        typeCache[moduleIndex][typeIndex] = func # update cache now, in case some field is a pointer to us
-        if withNameIndex is not None:
-            typeCache[moduleIndex][withNameIndex] = func # prevent infinite recursion
-
-        returnType = createType(moduleIndex, typeRoot['retType'])
-        paramTypes = [createType(moduleIndex, paramType) for paramType in typeRoot['paramTypes']]
-
-        #   print("returnType: {}, paramTypes: {}".format(returnType, paramTypes))
-        func.setReturnType(returnType)
-        for i in range(len(paramTypes)):
-            paramType = paramTypes[i]
-            # print("foo: {}, {}".format(paramType, i))
-            if paramType is not None and paramType != VoidDataType.dataType:
-                try:
-                    func.replaceArgument(i, None, paramType, None, SourceType.IMPORTED)
-                except:
-                    print('failed to replace arg! func: {} arg: {} type: {}'.format(func.getName(), i, paramType.getName()))
-            elif paramType is None:
-                print('func {} arg {} type is None'.format(func.getName(), i))
-
-        return func
 
     # elif entryType.startswith('STRUCTURE_FIELD') or entryType.startswith('STRUCTURE_BIT'):
         # this one is weird. We process these the normal way in the STRUCTURE_LIST arm.
@@ -319,209 +740,918 @@ def innerCreateType(moduleIndex, typeIndex, withName = None, withNameIndex = Non
     #    return createType(moduleIndex, typeRoot['type'], withName=typeRoot['name'], withNameIndex=typeIndex)
         
     else:
-        print('unhandled entryType: ', entryType)
+        metrics.count('types.unhandled')
+        # one template per kind, so each kind is counted on its own and the entry only goes in the arguments
+        log.warning('unhandled entryType ' + TYPE_CODE_NAMES[kind] + ': {}', types.describe(typeIndex))
         return None
     
-    print('partly handled entryType: {}'.format(entryType))
+    metrics.count('types.unhandled')
+    log.warning('partly handled entryType ' + TYPE_CODE_NAMES[kind] + ': {}', types.describe(typeIndex))
     return None
-    
 
-groupIntoFragments()
 
-functionManager = currentProgram.getFunctionManager()
+#
+# type archive
+#
 
-for local in modulesLocals:
-    # print('local is: ' + str(local))
-    moduleIndex = local['meta']['moduleIndex']
-    baseAddr = None
-    func = None
-    blockParentOffset = None        
-    blockSize = None
-    returnAddressOffset = None
-
-    for entry in local['entries']:
-        # print(entry)
-        if entry["typeName"] == 'MODULE386':
-            newType = createType(moduleIndex, entry['typeIndex'])
-            memoryBlock = getMemoryBlockFromSegment(entry['segment'])
-            address = getAddressFromSegment(entry['segment'], entry['location'])
-            createLabel(address, entry['symbolName'], False, SourceType.IMPORTED)
-            if newType is not None:
-                try:
-                    # print("assigning type: {}: {}".format(entry['symbolName'], newType.getName()))
-                    listing.createData(address, newType)
-                except CodeUnitInsertionException as e:
-                    # print(e)
-                    pass
-        elif entry["typeName"] == 'SET_BASE386':
-            baseAddr = getAddressFromSegment(entry['segment'], entry['location'])
-        elif entry['typeName'] == 'NEAR_RTN_386' or entry['typeName'] == 'FAR_RTN_386' or entry['typeName'] ==  'NEAR_RTN' or entry['typeName'] == 'FAR_RTN':
-            blockParentOffset = None
-            blockSize = None
-            # startOffset, size, parentBlockOffset, returnAddressOffset, typeIndex, returnValueLocation
-            # numberOfPregisterParams, registerParams, symbolName
-
-            name = entry['symbolName']
-            size = entry['size']
-            registerParams = entry.get('registerParams', [])
-            returnValueLocation = entry.get('returnValueLocation', [])[0]
-            returnAddressOffset = entry.get('returnAddressOffset', 0)
-            address = baseAddr.add(entry['startOffset'])
-            func = functionManager.getFunctionAt(address)
-            
-            if func is not None:
-                old_name = func.getName()
-                func.setName(name, SourceType.IMPORTED)
-                print("Renamed function {} to {} at address {}".format(old_name, name, address))
-            else:
-                func = functionManager.createFunction(name, address, AddressSet(address, address.add(size - 1)), SourceType.IMPORTED)
-                print("Created function {} at address {}".format(name, address))
+# part of the hash, change it when types come out differently for the same input
+TYPE_ARCHIVE_VERSION = 'watcom-types-1'
+NOT_ARCHIVED = object()
+
+typesHash = None
+typeArchive = None
+archivedTypeIds = None
+resolvedTypes = dict()
+createdTypes = None
+
+# A function's own type is named after the function, which the types hash doesn't cover.
+# So the archive only has its return and parameter types, by type index, and the named
+# function definition is made fresh from those.
+archivedFunctionTypes = None
+createdFunctionTypes = None
+archivedFunctionShells = dict()
+
+def getTypeArchivePaths(exportPath):
+    # a directory per export, so that importing many executables doesn't evict the archives
+    # of the others. A sharded export goes by the name of its directory.
+    exportName = os.path.basename(os.path.dirname(exportPath) if shardedExport else exportPath)
+    archiveDir = os.path.join(TYPE_ARCHIVE_DIR or os.path.join(os.path.dirname(exportPath), 'watcom-type-archives'), exportName)
+    base = os.path.join(archiveDir, typesHash)
+    return base + '.gdt', base + '.json'
+
+def openTypeArchive(exportPath, hash):
+    """Use the archive made for `hash` if there is one, otherwise record types for a new one."""
+    global typesHash, typeArchive, archivedTypeIds, archivedFunctionTypes, createdTypes, createdFunctionTypes
+    typesHash = hash
+    archivePath, indexPath = getTypeArchivePaths(exportPath)
+    if not REBUILD_TYPE_ARCHIVE and os.path.exists(archivePath) and os.path.exists(indexPath):
+        try:
+            with open(indexPath, 'r') as indexFile:
+                index = json.load(indexFile)
+            archivedTypeIds = index['types']
+            archivedFunctionTypes = index.get('functions', dict())
+            typeArchive = FileDataTypeManager.openFileArchive(File(archivePath), False)
+            # the modification time is what eviction goes by
+            os.utime(archivePath, None)
+            os.utime(indexPath, None)
+            log.info('Using the types in {}', archivePath)
+            return
+        except:
+            log.warning('failed to open type archive {}: {}', archivePath, sys.exc_info()[1])
+            archivedTypeIds = None
+            typeArchive = None
+    createdTypes = dict()
+    createdFunctionTypes = dict()
+
+def getArchivedType(moduleIndex, typeIndex):
+    """The program's copy of an archived type, or NOT_ARCHIVED if the archive doesn't have it."""
+    typeId = archivedTypeIds.get('{}:{}'.format(moduleIndex, typeIndex), NOT_ARCHIVED)
+    if typeId is NOT_ARCHIVED or typeId is None:
+        return typeId
+    if typeId not in resolvedTypes:
+        metrics.count('types.archiveResolves')
+        resolvedTypes[typeId] = dtm.resolve(typeArchive.getDataType(typeId), DataTypeConflictHandler.DEFAULT_HANDLER)
+    return resolvedTypes[typeId]
+
+def getArchivedFunctionType(moduleIndex, typeIndex, name):
+    """Function definition `name` for procedure type `moduleIndex:typeIndex`, made from the
+    archived return and parameter types, or NOT_ARCHIVED."""
+    children = archivedFunctionTypes.get('{}:{}'.format(moduleIndex, typeIndex))
+    if children is None:
+        return NOT_ARCHIVED
+    childTypes = [getArchivedType(moduleIndex, child) for child in children]
+    if any(childType is NOT_ARCHIVED for childType in childTypes):
+        return NOT_ARCHIVED
+    # the same sharing as `materializeTypes`: per type index, and across modules by name
+    # and structure
+    shellKey = (name, tuple(archivedTypeIds.get('{}:{}'.format(moduleIndex, child)) for child in children))
+    shell = archivedFunctionShells.get((moduleIndex, typeIndex)) or archivedFunctionShells.get(shellKey)
+    if shell is None:
+        categoryPath = createTypeCategory('/' + modulesDict[moduleIndex]['name'])
+        shell = addDataType(FunctionDefinitionDataType(categoryPath, name))
+        fillFunctionType(shell, childTypes[0], childTypes[1:])
+        archivedFunctionShells[shellKey] = shell
+    archivedFunctionShells[(moduleIndex, typeIndex)] = shell
+    return shell
 
-            returnType = None
-            functionDataType = None
+def recordFunctionType(moduleIndex, typeIndex):
+    """Keep the return and parameter types of a function's own type for the archive."""
+    types = modulesTypesDict[moduleIndex]
+    cache = typeCache[moduleIndex]
+    retType, paramTypes = types.details[typeIndex]
+    children = [retType] + list(paramTypes)
+    for child in children:
+        if child not in cache and 0 < child < len(types):
+            # a shared function type doesn't bring its children along
+            createType(moduleIndex, child)
+        createdTypes[(moduleIndex, child)] = cache.get(child)
+    createdFunctionTypes['{}:{}'.format(moduleIndex, typeIndex)] = children
+
+def saveTypeArchive(exportPath):
+    archivePath, indexPath = getTypeArchivePaths(exportPath)
+    archiveDir = os.path.dirname(archivePath)
+    if not os.path.isdir(archiveDir):
+        try:
+            os.makedirs(archiveDir)
+        except OSError:
+            # another import may have just made it
+            if not os.path.isdir(archiveDir):
+                raise
+    if os.path.exists(archivePath):
+        os.remove(archivePath)
+    archive = FileDataTypeManager.createFileArchive(File(archivePath))
+    typeIds = dict()
+    index = dict()
+    try:
+        transaction = archive.startTransaction('Watcom types')
+        try:
+            for (moduleIndex, typeIndex), dataType in createdTypes.items():
+                typeId = None
+                if dataType is not None:
+                    if id(dataType) not in typeIds:
+                        archived = archive.resolve(dataType, DataTypeConflictHandler.DEFAULT_HANDLER)
+                        typeIds[id(dataType)] = archive.getID(archived)
+                    typeId = typeIds[id(dataType)]
+                index['{}:{}'.format(moduleIndex, typeIndex)] = typeId
+        finally:
+            archive.endTransaction(transaction, True)
+        archive.save()
+    finally:
+        archive.close()
+    with open(indexPath, 'w') as indexFile:
+        json.dump({'typesHash': typesHash, 'types': index, 'functions': createdFunctionTypes}, indexFile)
+    log.info('Saved {} types to {}', len(typeIds), archivePath)
+    evictTypeArchives(archiveDir)
+
+def getModificationTime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+def evictTypeArchives(archiveDir):
+    """Delete all but the TYPE_ARCHIVE_KEEP most recently used archives.
+
+    Another import of the same export may be evicting at the same time, so files that are
+    already gone are fine.
+    """
+    archives = [os.path.join(archiveDir, name) for name in os.listdir(archiveDir) if name.endswith('.gdt')]
+    archives.sort(key=getModificationTime, reverse=True)
+    for archivePath in archives[TYPE_ARCHIVE_KEEP:]:
+        indexPath = archivePath[:-len('.gdt')] + '.json'
+        for path in (archivePath, indexPath):
             try:
-                functionDataType = createType(moduleIndex, entry['typeIndex'], withName=name)
-                returnType = functionDataType.getReturnType()
-                if returnValueLocation['lsmName'] == 'UNKNOWN':
-                    func.setReturnType(returnType, SourceType.IMPORTED)    
-                else:
-                    if returnValueLocation['lsmName'] == "MULTI_REG":
-                        func.setCustomVariableStorage(True)
-                        regName = returnValueLocation['registerNames'][0]
-                        reg = currentProgram.getRegister(regName)
-                        varStorage = VariableStorage(currentProgram, reg)
-                        try:
-                            func.setReturn(returnType, varStorage, SourceType.IMPORTED)
-                        except:
-                            print('failed to set function return type')
-                            pass
+                os.remove(path)
+            except OSError:
+                pass
+        log.info('Evicted type archive {}', archivePath)
 
-            except:
-                pass                
-            
-            if len(registerParams) > 0:
-                func.setCustomVariableStorage(True)
-
-            fdtArgs = functionDataType.getArguments()
-            varStorageParams = []
-            for i in range(max(len(registerParams), len(fdtArgs))):
-                if i < len(registerParams):
-                    registerParam = registerParams[i][0]
-                
-                    if registerParam['lsmName'] == "MULTI_REG":
-                        regName = registerParam['registerNames'][0]
-                        reg = currentProgram.getRegister(regName)
-                        varStorage = VariableStorage(currentProgram, reg)
-                        if i < len(fdtArgs):
-                            paramType = fdtArgs[i].getDataType()
-                        else:
-                                paramType = Undefined.getUndefinedDataType(reg.getNumBytes())
-                        param = ParameterImpl(None, paramType, varStorage, currentProgram)
-                        varStorageParams.append(param)
-                else:
-                    param = ParameterImpl(None, fdtArgs[i].getDataType(), None, currentProgram)
-                    varStorageParams.append(param)
-
-            func.replaceParameters(varStorageParams, Function.FunctionUpdateType.CUSTOM_STORAGE, True, SourceType.IMPORTED)
-            # func.updateFunction(Function.UpdateType.CUSTOM_STORAGE, True, SourceType.IMPORTED, varStorageParams)
-        elif entry['typeName'] == 'LOCAL':
-            if func is not None:
-                symbolName = entry['symbolName']
-                location = entry['location'][0]
-                datatypeIndex = entry['typeIndex']
-                
-                if location['lsmName'].startswith('BP_OFFSET'):
-                    offset = location['offset']
-                    # add `returnAddressOffset` to `offset` because ghidra uses the ESP and not EBP!
-                    # and by "add" I mean "subtract" since these are all negative
-                    if returnAddressOffset is not None:
-                        offset = offset - returnAddressOffset
-
-                    #if dataType.getLength() > 0:
-                    #    storage = VariableStorage(currentProgram, offset, dataType.getLength())
-                    #    var = LocalVariableImpl(symbolName, 0, dataType, storage, True, currentProgram, SourceType.IMPORTED)
-                    #else:
-                    try:
-                        localDataType = createType(moduleIndex, datatypeIndex)
-                        var = LocalVariableImpl(symbolName, localDataType, offset, currentProgram, SourceType.IMPORTED)
-                        # if blockParentOffset is not None:
-                        # turns out this isn't allowed for stack variables
-                        #    var.setFirstUseOffset(blockParentOffset)
-                        try:
-                            func.addLocalVariable(var, SourceType.IMPORTED)
-                        except DuplicateNameException:
-                            var.setName('{}_{:08x}'.format(symbolName, offset), SourceType.IMPORTED)
-                            func.addLocalVariable(var, SourceType.IMPORTED)
-
-                    except:
-                        print('exception! failed to add var {} to func {}'.format(symbolName, func.getName()))
-                        print(sys.exc_info())
-                elif location['lsmName'] == "CONST_ADDR386":
-                    localDataType = createType(moduleIndex, entry['typeIndex'])
-                    address = getAddressFromSegment(location['constSegment'], location['constAddress'])
-
-                    var = LocalVariableImpl(symbolName, 0, localDataType, address, currentProgram, SourceType.IMPORTED)
-                    if blockParentOffset is not None:
-                        var.setFirstUseOffset(blockParentOffset)
-                    func.addLocalVariable(var, SourceType.IMPORTED)
-                    
-                else:
-                    print('local: unhandled location {} for local for func {}'.format(location, func.getName()))
-
-        elif entry['typeName'] == "BLOCK_386" or entry['typeName'] == "BLOCK":
-            # blocks can also have LOCALs, make sure we don't treat it as the last func we saw!
-            # todo: enhance to look up contained function
-                        # "typeName": "BLOCK_386",
-                        # "startOffset": 76,
-                        # "size": 93,
-                        # "parentBlockOffset": 304
-            func = None
-            address = baseAddr.add(entry['startOffset'])
-            endAddress = address.add(entry['size'])
-            createLabel(address, 'block_start_{:08x}'.format(entry['startOffset']), False)
-            createLabel(endAddress, 'block_end_{:08x}'.format(entry['startOffset']), False)
-            func = functionManager.getFunctionContaining(address)
-            if func is None:
-                print('BLOCK_386: cannot find func at {}'.format(address))
+def closeTypeArchive(exportPath):
+    if typeArchive is not None:
+        typeArchive.close()
+    elif createdTypes is not None and (isScoped() or previousManifest or cancelled):
+        # types that weren't needed this time would be missing from the archive
+        log.info('Not saving a type archive for an import of only part of the export')
+    elif createdTypes is not None:
+        try:
+            saveTypeArchive(exportPath)
+        except:
+            log.warning('failed to save the type archive: {}', sys.exc_info()[1])
+
+
+#
+# incremental imports
+#
+
+# The manifest is a string property map of the program, named after MANIFEST_VERSION, so
+# change it when manifests can't be compared any more. Each address has the entries of
+# the groups at that address, as a JSON list of [key, entry].
+MANIFEST_VERSION = 'watcom-manifest-2'
+
+previousManifest = dict()
+manifest = None
+
+def getManifestAddress(key):
+    """Where the entry of group `key` goes. Fragments don't have an address of their own,
+    they go at the lowest address of the program."""
+    parts = json.loads(key)
+    if parts[1] == 'fragment':
+        return currentProgram.getMinAddress()
+    return getAddressFromSegment(parts[2], parts[3])
+
+def readManifest():
+    """The entries of the manifest in the program, None if it doesn't have one."""
+    propertyMap = currentProgram.getUsrPropertyManager().getStringPropertyMap(MANIFEST_VERSION)
+    if propertyMap is None:
+        return None
+    entries = dict()
+    for address in propertyMap.getPropertyIterator():
+        for key, entry in json.loads(propertyMap.getString(address)):
+            entries[key] = entry
+    return entries
+
+def writeManifest(entries):
+    propertyManager = currentProgram.getUsrPropertyManager()
+    propertyManager.removePropertyMap(MANIFEST_VERSION)
+    propertyMap = propertyManager.createStringPropertyMap(MANIFEST_VERSION)
+    entriesByAddress = dict()
+    for key in sorted(entries):
+        entriesByAddress.setdefault(getManifestAddress(key), []).append([key, entries[key]])
+    for address, addressEntries in entriesByAddress.items():
+        propertyMap.add(address, json.dumps(addressEntries, sort_keys=True))
+
+def openManifest():
+    """Read the manifest of the last import into this program, if there was one."""
+    global previousManifest, manifest
+    manifest = dict()
+    try:
+        entries = readManifest()
+    except:
+        log.warning('failed to read the manifest of the last import, importing everything: {}', sys.exc_info()[1])
+        return
+    if entries is None:
+        return
+    previousManifest = entries
+    if isScoped():
+        # what is out of scope stays the way the last import left it
+        manifest = dict(previousManifest)
+    log.info('Only applying what changed since the last import, {} groups', len(previousManifest))
+
+def saveManifest():
+    if cancelled:
+        writeManifest(checkpointManifest(previousManifest, manifest))
+        log.info('Kept how far this import got in the program, importing again picks up from there')
+        return
+    writeManifest(manifest)
+    log.info('Kept the manifest of this import in the program')
+
+#
+# scoped imports
+#
+
+def isScoped():
+    return MODULE_FILTER is not None or ADDRESS_RANGE is not None or SELECTION_ONLY
+
+def getImportScope():
+    """The addresses to import symbols at, or None to import them wherever they are."""
+    scope = None
+    if ADDRESS_RANGE is not None:
+        scope = AddressSet(toAddr(ADDRESS_RANGE[0]), toAddr(ADDRESS_RANGE[1]))
+    if SELECTION_ONLY:
+        if currentSelection is None or currentSelection.isEmpty():
+            log.warning('SELECTION_ONLY is set but nothing is selected, not importing anything')
+            return AddressSet()
+        scope = AddressSet(currentSelection) if scope is None else scope.intersect(currentSelection)
+    return scope
+
+def getScopeRanges(scope):
+    """`scope` as the planner's `(first, last)` address ranges."""
+    return [(addressRange.getMinAddress().getOffset(), addressRange.getMaxAddress().getOffset()) for addressRange in scope.getAddressRanges()]
+
+def getAddressOffset(segment, offset):
+    return getAddressFromSegment(segment, offset).getOffset()
+
+
+#
+# applying the plan
+#
+
+moduleTypesWindow = None
+pendingModuleTypes = None
+
+@metrics.timed('types.load')
+def ensureModuleTypes(moduleIndex):
+    """Make sure the types of `moduleIndex` are loaded.
+
+    When streaming, `modulesTypes` is walked side by side with the plan (both are ordered
+    by module), and only the types of the module we are currently working on are kept.
+    """
+    global moduleTypesWindow, pendingModuleTypes
+    if moduleIndex in modulesTypesDict or not STREAMING_LOAD:
+        return
+    if moduleTypesWindow is None:
+        moduleTypesWindow = iterate_module_types(f, selectedModules)
+        pendingModuleTypes = next(moduleTypesWindow, None)
+    dropModuleTypes()
+    while pendingModuleTypes is not None and pendingModuleTypes[0] < moduleIndex:
+        passModuleTypes(*pendingModuleTypes)
+        pendingModuleTypes = next(moduleTypesWindow, None)
+    if pendingModuleTypes is not None and pendingModuleTypes[0] == moduleIndex:
+        addModuleTypes(modulesTypesDict, moduleIndex, pendingModuleTypes[1])
+        pendingModuleTypes = next(moduleTypesWindow, None)
+    else:
+        modulesTypesDict[moduleIndex] = TypeTable()
+
+referencedTypes = dict()
+unreachableTypes = 0
+retiredModules = 0
+
+def retireModuleTypes(moduleIndex):
+    """We are done with a module: make the rest of its types with MATERIALIZE_ALL_TYPES,
+    and count the ones that no symbol led to."""
+    global unreachableTypes, retiredModules
+    if progressPhase == 'types':
+        checkCancelled()
+    types = modulesTypesDict[moduleIndex]
+    if MATERIALIZE_ALL_TYPES:
+        for typeIndex in range(1, len(types)):
+            createType(moduleIndex, typeIndex)
+    reachable = getReachableTypes(types, referencedTypes.pop(moduleIndex, ()))
+    unreachable = max(len(types) - 1, 0) - len(reachable)
+    metrics.count('types.unreachable', unreachable)
+    unreachableTypes += unreachable
+    retiredModules += 1
+    if progressPhase == 'types':
+        monitor.setProgress(retiredModules)
+
+def dropModuleTypes():
+    for moduleIndex in list(modulesTypesDict):
+        retireModuleTypes(moduleIndex)
+    modulesTypesDict.clear()
+    typeCache.clear()
+    fingerprintCache.clear()
+    typeNames.clear()
+
+def passModuleTypes(moduleIndex, entries):
+    """A module the streaming window skips over, because no symbol uses its types."""
+    addModuleTypes(modulesTypesDict, moduleIndex, entries)
+    dropModuleTypes()
+
+def finishModuleTypes():
+    """Retire the modules still loaded, and when streaming, the ones after them."""
+    global moduleTypesWindow, pendingModuleTypes
+    startProgress('types', retiredModules)
+    dropModuleTypes()
+    if STREAMING_LOAD and moduleTypesWindow is None and MATERIALIZE_ALL_TYPES:
+        moduleTypesWindow = iterate_module_types(f, selectedModules)
+        pendingModuleTypes = next(moduleTypesWindow, None)
+    if moduleTypesWindow is not None:
+        while pendingModuleTypes is not None:
+            passModuleTypes(*pendingModuleTypes)
+            pendingModuleTypes = next(moduleTypesWindow, None)
+    elif STREAMING_LOAD:
+        # no type table was ever read: there are no types, or the archive had every type
+        # used, including the return and parameter types of the functions' own types
+        return
+    log.info('Skipped {} types nothing refers to', unreachableTypes)
+
+# What the program already has, by address, read once per run the first time it's needed
+# and then kept up to date by the ops, so that only the writes that change something are
+# made. Labels the locals and the global symbols both make are only made once.
+symbolIndex = None
+functionIndex = None
+
+def getSymbolIndex():
+    """The names of the symbols at each address."""
+    global symbolIndex
+    if symbolIndex is None:
+        symbolIndex = dict()
+        for symbol in symbolTable.getAllSymbols(False):
+            symbolIndex.setdefault(symbol.getAddress(), set()).add(symbol.getName())
+            metrics.count('symbols.indexed')
+    return symbolIndex
+
+def getFunctionIndex():
+    """The functions by entry point."""
+    global functionIndex
+    if functionIndex is None:
+        functionIndex = dict()
+        for func in functionManager.getFunctions(True):
+            functionIndex[func.getEntryPoint()] = func
+            metrics.count('functions.indexed')
+    return functionIndex
+
+def refreshSymbols(address):
+    """Read the symbols at `address` again, after something went that took an unknown number with it."""
+    if symbolIndex is not None:
+        symbolIndex[address] = set(symbol.getName() for symbol in symbolTable.getSymbols(address))
+
+def updateSymbolIndex(address, name, oldName = None):
+    if symbolIndex is not None:
+        names = symbolIndex.setdefault(address, set())
+        names.discard(oldName)
+        names.add(name)
+
+def getOpAddress(op):
+    return getAddressFromSegment(op['segment'], op['offset'])
+
+lastFunctionKey = None
+lastFunction = None
+
+def getPlannedFunction(op):
+    """The function an op is about. Consecutive ops for the same function share one lookup."""
+    global lastFunctionKey, lastFunction
+    key = (op['segment'], op['offset'], op.get('inBlock', False))
+    if key == lastFunctionKey:
+        return lastFunction
+    address = getOpAddress(op)
+    metrics.count('functions.lookups')
+    if op.get('inBlock', False):
+        func = functionManager.getFunctionContaining(address)
+        if func is None:
+            log.warning('BLOCK_386: cannot find func at {}', address)
+        else:
+            log.debug('BLOCK_386: found func {} at address {}', func.getName(), address)
+    else:
+        func = getFunctionIndex().get(address)
+    lastFunctionKey = key
+    lastFunction = func
+    return func
+
+fragmentIndex = None
+
+def getFragmentIndex():
+    """The fragments directly under the root module by name, looked up once per run."""
+    global fragmentIndex
+    if fragmentIndex is None:
+        fragmentIndex = dict()
+        for child in rootProgramModule.getChildren():
+            if isinstance(child, ProgramFragment):
+                fragmentIndex[child.getName()] = child
+    return fragmentIndex
+
+def applyFragment(op):
+    name = op['name']
+    index = getFragmentIndex()
+    fragment = index.get(name)
+    # plans from before fragments were merged have one range per op
+    ranges = op.get('ranges') or [[op['segment'], op['offset'], op['size']]]
+    for segment, offset, size in ranges:
+        startAddress = getAddressFromSegment(segment, offset)
+        try:
+            if fragment is None:
+                fragment = createFragment(name, startAddress, size)
+                index[name] = fragment
             else:
-                blockParentOffset = entry['parentBlockOffset']
-                blockSize = entry['size']
-                print('BLOCK_386: found func {} at address {}'.format(func.getName(), address))
+                fragment.move(startAddress, startAddress.add(size - 1))
+            metrics.count('fragments.ranges')
+        except (Exception, NotFoundException) as e:
+            metrics.count('exceptions.fragment')
+            log.warning('failed to move {} to fragment {}: {}', startAddress, name, e)
 
+def applyLabel(op):
+    address = getOpAddress(op)
+    names = getSymbolIndex().setdefault(address, set())
+    if op['name'] in names:
+        metrics.count('labels.present')
+        return
+    if op['imported']:
+        createLabel(address, op['name'], False, SourceType.IMPORTED)
+    else:
+        createLabel(address, op['name'], False)
+    names.add(op['name'])
+    metrics.count('labels.created')
+
+def applyData(op):
+    newType = createType(op['module'], op['type'])
+    if newType is not None:
+        address = getOpAddress(op)
+        try:
+            # print("assigning type: {}: {}".format(op['name'], newType.getName()))
+            listing.createData(address, newType)
+            analysisData.add(address)
+            metrics.count('data.created')
+        except CodeUnitInsertionException as e:
+            # print(e)
+            metrics.count('data.conflicts')
+
+def applyFunction(op):
+    global lastFunctionKey, lastFunction
+    name = op['name']
+    address = getOpAddress(op)
+    func = getFunctionIndex().get(address)
+
+    if func is not None:
+        old_name = func.getName()
+        if old_name != name:
+            func.setName(name, SourceType.IMPORTED)
+            updateSymbolIndex(address, name, old_name)
+            metrics.count('functions.renamed')
+            log.debug("Renamed function {} to {} at address {}", old_name, name, address)
         else:
-            print("unhandled local entry: {}".format(entry['typeName']))
+            metrics.count('functions.present')
+    else:
+        if op['size'] is not None:
+            func = functionManager.createFunction(name, address, AddressSet(address, address.add(op['size'] - 1)), SourceType.IMPORTED)
+        else:
+            func = createFunction(address, name)
+        if func is not None:
+            functionIndex[address] = func
+            updateSymbolIndex(address, name)
+        analysisFunctions.add(address)
+        metrics.count('functions.created')
+        log.debug("Created function {} at address {}", name, address)
+    lastFunctionKey = (op['segment'], op['offset'], False)
+    lastFunction = func
 
+# The signature and locals of the function the plan is on, written in one go when it moves
+# on to the next function, instead of an update per setting and per local.
+pendingRoutine = None
 
-def processGlobalSymbolsTable():
-    for g in globalSymbolsTable:
-        # for some reason bools aren't getting parsed out of the JSON correctly...
-        addressOffset = g['addressOffset']
-        addressSegment = g['addressSegment']
+def getPendingRoutine(func):
+    global pendingRoutine
+    if pendingRoutine is not None and pendingRoutine['function'].getEntryPoint() != func.getEntryPoint():
+        flushRoutine()
+    if pendingRoutine is None:
+        pendingRoutine = {'function': func, 'signature': None, 'locals': []}
+    return pendingRoutine
 
-        name = g['name'].encode('utf-8')
+@metrics.timed('routines.write')
+def flushRoutine():
+    """Write what was gathered for the pending function."""
+    global pendingRoutine
+    routine = pendingRoutine
+    if routine is None:
+        return
+    pendingRoutine = None
+    if routine['signature'] is not None:
+        writeSignature(routine['function'], routine['signature'])
+    if routine['locals']:
+        writeLocals(routine['function'], routine['locals'])
+    metrics.count('routines.written')
 
-        address = getAddressFromSegment(addressSegment, addressOffset)
-        kind = 'data'
-        if name.endswith('_'):
-            name = name[:-1]
-            kind = 'code'
-        elif name.startswith('_'):
-            name = name[1:]
-        
-        
-        if kind == 'data':
-            createLabel(address, name, False)
+def applySignature(op):
+    func = getPlannedFunction(op)
+    if func is None:
+        metrics.count('signatures.noFunction')
+        return
+    getPendingRoutine(func)['signature'] = op
+
+def applyLocal(op):
+    func = getPlannedFunction(op)
+    if func is None:
+        metrics.count('locals.noFunction')
+        return
+    getPendingRoutine(func)['locals'].append(op)
+
+def writeSignature(func, op):
+    """Set the return value and parameters with one update of the function."""
+    registerParams = op['registerParams']
+    try:
+        functionDataType = createType(op['module'], op['type'], withName=op['name'])
+    except:
+        metrics.count('exceptions.signature')
+        return
+    if functionDataType is None:
+        return
+
+    returnType = functionDataType.getReturnType()
+    returnParam = None
+    if op['returnLocation'] == 'UNKNOWN':
+        # only dynamic storage works out where the calling convention puts it
+        func.setReturnType(returnType, SourceType.IMPORTED)
+    elif op['returnRegister'] is not None:
+        reg = currentProgram.getRegister(op['returnRegister'])
+        returnParam = ReturnParameterImpl(returnType, VariableStorage(currentProgram, reg), currentProgram)
+
+    fdtArgs = functionDataType.getArguments()
+    varStorageParams = []
+    for i in range(max(len(registerParams), len(fdtArgs))):
+        if i < len(registerParams):
+            regName = registerParams[i]
+            if regName is not None:
+                reg = currentProgram.getRegister(regName)
+                varStorage = VariableStorage(currentProgram, reg)
+                if i < len(fdtArgs):
+                    paramType = fdtArgs[i].getDataType()
+                else:
+                    paramType = Undefined.getUndefinedDataType(reg.getNumBytes())
+                param = ParameterImpl(None, paramType, varStorage, currentProgram)
+                varStorageParams.append(param)
+        else:
+            param = ParameterImpl(None, fdtArgs[i].getDataType(), None, currentProgram)
+            varStorageParams.append(param)
+
+    try:
+        func.updateFunction(None, returnParam, varStorageParams, Function.FunctionUpdateType.CUSTOM_STORAGE, True, SourceType.IMPORTED)
+    except:
+        if returnParam is None:
+            metrics.count('exceptions.signature')
+            log.warning('failed to set the signature of {}: {}', func.getName(), sys.exc_info()[1])
+            return
+        # keep the parameters even if the return value doesn't fit its register
+        metrics.count('exceptions.returnType')
+        log.warning('failed to set the return type of {}', func.getName())
+        func.updateFunction(None, None, varStorageParams, Function.FunctionUpdateType.CUSTOM_STORAGE, True, SourceType.IMPORTED)
+    metrics.count('signatures.applied')
+
+def getVariableKey(var):
+    if var.isStackVariable():
+        return ('stack', var.getStackOffset())
+    return ('address', var.getMinAddress())
+
+def getUniqueName(name, suffix, taken):
+    """`name`, or `name` with `suffix` (and a number) when the function already has a variable called that."""
+    if name not in taken:
+        return name
+    metrics.count('locals.renamed')
+    unique = '{}_{}'.format(name, suffix)
+    n = 2
+    while unique in taken:
+        unique = '{}_{}_{}'.format(name, suffix, n)
+        n += 1
+    return unique
+
+def writeLocals(func, ops):
+    """Add the locals of a function, skipping the ones it already has and making the names unique up front."""
+    taken = set(var.getName() for var in func.getParameters())
+    present = set()
+    for var in func.getLocalVariables():
+        taken.add(var.getName())
+        present.add((var.getName(), getVariableKey(var)))
+
+    for op in ops:
+        symbolName = op['name']
+        if 'stackOffset' in op:
+            offset = op['stackOffset']
+            key = ('stack', offset)
+            suffix = '{:08x}'.format(offset)
         else:
-            func = functionManager.getFunctionAt(address)
+            address = getAddressFromSegment(op['constSegment'], op['constAddress'])
+            key = ('address', address)
+            suffix = '{:08x}'.format(op['constAddress'])
+        # an earlier import may have had to make the name unique
+        if (symbolName, key) in present or ('{}_{}'.format(symbolName, suffix), key) in present:
+            metrics.count('locals.present')
+            continue
+        present.add((symbolName, key))
+        name = getUniqueName(symbolName, suffix, taken)
+        taken.add(name)
 
-            if func is not None:
-                old_name = func.getName()
-                if old_name != name:
-                    func.setName(name, SourceType.IMPORTED)
-                    print("Renamed function {} to {} at address {}".format(old_name, name, address))
+        try:
+            localDataType = createType(op['module'], op['type'])
+            if 'stackOffset' in op:
+                # a first use offset isn't allowed for stack variables
+                var = LocalVariableImpl(name, localDataType, offset, currentProgram, SourceType.IMPORTED)
             else:
-                func = createFunction(address, name)
-                print("Created function {} at address {}".format(name, address))
+                var = LocalVariableImpl(name, 0, localDataType, address, currentProgram, SourceType.IMPORTED)
+                if op['firstUseOffset'] is not None:
+                    var.setFirstUseOffset(op['firstUseOffset'])
+            func.addLocalVariable(var, SourceType.IMPORTED)
+            metrics.count('locals.added')
+        except:
+            metrics.count('exceptions.local')
+            log.warning('exception! failed to add var {} to func {}: {}', name, func.getName(), sys.exc_info()[1])
+
+def applyClear(op):
+    func = getFunctionIndex().get(getOpAddress(op))
+    if func is None:
+        return
+    func.replaceParameters([], Function.FunctionUpdateType.DYNAMIC_STORAGE_ALL_PARAMS, True, SourceType.DEFAULT)
+    func.setReturnType(DataType.DEFAULT, SourceType.DEFAULT)
+    func.setCustomVariableStorage(False)
+    for var in func.getLocalVariables():
+        func.removeVariable(var)
+        metrics.count('locals.removed')
+    metrics.count('functions.cleared')
+
+def applyRemove(op):
+    global lastFunctionKey, lastFunction
+    address = getOpAddress(op)
+    kind = op['kind']
+    try:
+        if kind == 'function':
+            removeFunctionAt(address)
+            getFunctionIndex().pop(address, None)
+            refreshSymbols(address)
+            lastFunctionKey = None
+            lastFunction = None
+        elif kind == 'label':
+            removeSymbol(address, op['name'])
+            if symbolIndex is not None:
+                symbolIndex.get(address, set()).discard(op['name'])
+        elif kind == 'data':
+            removeDataAt(address)
+        metrics.count('removed.' + kind)
+        log.debug('Removed {} at address {}', kind, address)
+    except:
+        metrics.count('exceptions.remove')
+        log.warning('failed to remove {} at {}: {}', kind, address, sys.exc_info()[1])
+
+def applyPhase(op):
+    commitBatch()
+    metrics.startPhase(op['name'])
+    startProgress(op['name'])
+    log.info('Applying {}', op['name'])
+
+OPERATIONS = {
+    'phase': applyPhase,
+    'fragment': applyFragment,
+    'label': applyLabel,
+    'data': applyData,
+    'function': applyFunction,
+    'signature': applySignature,
+    'local': applyLocal,
+    'clear': applyClear,
+    'remove': applyRemove,
+}
+
+# the ops gathered into the pending function
+ROUTINE_OPERATIONS = ('signature', 'local')
+# the ops that end the pending function; labels and fragments don't, block labels come in
+# between a function's locals
+ROUTINE_BOUNDARIES = ('function', 'data', 'phase', 'clear', 'remove')
+
+def applyPlan(ops):
+    ops = iter(ops)
+    while True:
+        # planning happens lazily, as we pull ops out of the plan
+        planStartTime = time.time()
+        op = next(ops, None)
+        metrics.addTime('plan', time.time() - planStartTime)
+        if op is None:
+            break
+        kind = op['op']
+        if kind in ROUTINE_BOUNDARIES:
+            # the types of the function's module may be on their way out
+            flushRoutine()
+        if kind not in ROUTINE_OPERATIONS:
+            # in between groups of ops, so the manifest has everything up to here
+            checkCancelled()
+        if kind != 'phase':
+            batchTick()
+            metrics.count('ops')
+        opStartTime = time.time()
+        OPERATIONS[kind](op)
+        metrics.addTime('op.' + kind, time.time() - opStartTime)
+    flushRoutine()
+
+def getLoadedSection(debuggingRegion, sectionName, moduleIndices = None):
+    """A section of an export loaded in one go. A sharded export has some in its shards.
+
+    With `moduleIndices`, the per-module sections only have the records of those modules.
+    """
+    if shardedExport and sectionName in SHARD_SECTIONS:
+        records = iterate_shard_section(f, sectionName, moduleIndices)
+    else:
+        records = debuggingRegion[sectionName]
+    if moduleIndices is None:
+        return records
+    return [record for record in records if inModules(moduleIndices, record['meta']['moduleIndex'])]
+
+def loadPlan(f):
+    """The operations for export `f`: a plan cached by `watcom_import_plan.py`, or a fresh one."""
+    global modulesTypesDict, shardedExport, selectedModules
+    planPath = plan_path_for(f.absolutePath)
+    shardedExport = is_sharded_export(f.absolutePath)
+    if STREAMING_LOAD:
+        modules = list(iterate_json_section(f, 'modules'))
+    else:
+        data = load_json_as_py(f)
+        # print(type(data))       # <type 'dict'>
+        # print(data.keys())      # dict keys
+        debuggingRegion = data["debuggingRegion"]
+        modules = debuggingRegion["modules"]     
+    for module in modules:
+        modulesDict[module['moduleIndex']] = module
+
+    if MODULE_FILTER is not None:
+        selectedModules = select_modules(modules, MODULE_FILTER)
+        log.info('Importing {} of {} modules', len(selectedModules), len(modules))
+    if shardedExport:
+        log.info('Reading the shards of {}', f.absolutePath)
+
+    if STREAMING_LOAD:
+        # the global symbols are only counted here, for the progress bar
+        readGlobalSymbol = skip_json_value if selectedModules is None else read_module_index
+        sections = collect_json_sections(f, {'segments': read_json_value, 'segmentMap': read_json_value, 'globalSymbolsTable': readGlobalSymbol})
+        buildSegmentBases(sections['segments'], sections['segmentMap'])
+        countProgressTotals(modules, sections['globalSymbolsTable'])
+    else:
+        modulesTypesDict = mergeModuleTypes(getLoadedSection(debuggingRegion, "modulesTypes", selectedModules))
+        buildSegmentBases(java_to_python(debuggingRegion["segments"]), java_to_python(debuggingRegion.get("segmentMap")) or [])
+        countProgressTotals(modules, (symbol['moduleIndex'] for symbol in debuggingRegion["globalSymbolsTable"]))
+
+    if USE_TYPE_ARCHIVE or INCREMENTAL:
+        hashStartTime = time.time()
+        if STREAMING_LOAD:
+            modulesTypes = iterate_export_section(f, 'modulesTypes', selectedModules)
+        else:
+            modulesTypes = (java_to_python(moduleType) for moduleType in getLoadedSection(debuggingRegion, "modulesTypes", selectedModules))
+        allTypesHash, moduleHashes = hash_module_types(modules, modulesTypes, TYPE_ARCHIVE_VERSION)
+        metrics.addTime('types.hash', time.time() - hashStartTime)
+        if USE_TYPE_ARCHIVE:
+            # an archive with all the types is a different archive
+            openTypeArchive(f.absolutePath, allTypesHash + ('-all' if MATERIALIZE_ALL_TYPES else ''))
+
+    # a cached plan is for all modules
+    if selectedModules is None and os.path.exists(planPath) and os.path.getmtime(planPath) >= os.path.getmtime(f.absolutePath):
+        log.info('Using the plan in {}', planPath)
+        ops = read_plan(planPath)
+        if not BLOCK_LABELS:
+            ops = (op for op in ops if not op.get('block', False))
+    else:
+        if STREAMING_LOAD:
+            addressesTable = iterate_json_section(f, 'addressesTable')
+            modulesLocals = iterate_export_section(f, 'modulesLocals', selectedModules)
+            globalSymbolsTable = iterate_json_section(f, 'globalSymbolsTable')
+        else:
+            addressesTable = debuggingRegion["addressesTable"]
+            modulesLocals = getLoadedSection(debuggingRegion, "modulesLocals", selectedModules)
+            globalSymbolsTable = debuggingRegion["globalSymbolsTable"]
+        ops = planExport(addressesTable, modules, modulesLocals, globalSymbolsTable, selectedModules, BLOCK_LABELS)
+    ops = trackProgress(ops)
+
+    scope = getImportScope()
+    if scope is not None:
+        ops = scopePlan(ops, getScopeRanges(scope), getAddressOffset)
+
+    if INCREMENTAL:
+        openManifest()
+        ops = planIncremental(ops, previousManifest, moduleHashes, manifest)
+    return ops
+
+
+def log_path_for(exportPath):
+    return exportPath + '.log'
+
+def writeMetrics():
+    result = metrics.summary(
+        export = f.absolutePath,
+        options = {
+            'STREAMING_LOAD': STREAMING_LOAD, 'BATCH_SIZE': BATCH_SIZE, 'DEFER_ANALYSIS': DEFER_ANALYSIS, 'INCREMENTAL': INCREMENTAL,
+            'MODULE_FILTER': MODULE_FILTER, 'ADDRESS_RANGE': ADDRESS_RANGE, 'SELECTION_ONLY': SELECTION_ONLY, 'BLOCK_LABELS': BLOCK_LABELS,
+        },
+        sharedTypes = len(canonicalTypes),
+        cancelled = cancelled,
+        repeatedMessages = log.repeats,
+    )
+    for line in metrics.formatPhases(result):
+        log.info(line)
+    if WRITE_METRICS:
+        metricsPath = metrics.metrics_path_for(f.absolutePath)
+        metrics.write_summary(metricsPath, result)
+        log.info('Wrote metrics to {}', metricsPath)
+
+def applyScriptOptions(args):
+    """Set options from `NAME=value` arguments. Values are JSON or Python's True, False and
+    None, anything else is taken as a string."""
+    for arg in args:
+        name, sep, value = arg.partition('=')
+        if not sep or name not in SCRIPT_OPTIONS:
+            raise ValueError('unknown script argument {!r}, expected one of {}=...'.format(arg, '=..., '.join(SCRIPT_OPTIONS)))
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = {'True': True, 'False': False, 'None': None}.get(value, value)
+        globals()[name] = value
+
+def getExportFile():
+    """The export to import: the first script argument when there is one, otherwise ask."""
+    args = list(getScriptArgs())
+    if args:
+        applyScriptOptions(args[1:])
+        return File(args[0])
+    return askFile("Give me a file to open", "Go baby go!")
+
+def main():
+    """Import an export into the current program.
+
+    Headless, the export and options come from the script arguments instead of a dialog:
+
+        analyzeHeadless <project dir> <project> -import game.exe -scriptPath <this dir>
+            -postScript ImportWatcomSymbolsScript.py game.exe.json INCREMENTAL=false
+    """
+    global f, cancelled
+    f = getExportFile()
 
-processGlobalSymbolsTable()
+    log.reset(LOG_LEVEL)
+    if WRITE_LOG:
+        log.open_log(log_path_for(f.absolutePath))
+    metrics.reset()
+    if PROFILE_INTERVAL is not None:
+        metrics.startProfiler(PROFILE_INTERVAL)
+    metrics.startPhase('load')
+    startProgress('load')
+    suspendAnalysis()
+    try:
+        try:
+            applyPlan(loadPlan(f))
+            finishModuleTypes()
+        except CancelledException:
+            cancelled = True
+            log.warning('Cancelled, keeping what was applied up to batch {}', batchNumber)
+            if manifest is None:
+                log.warning('INCREMENTAL is off, so importing again starts from the beginning')
+        finally:
+            if moduleTypesWindow is not None:
+                moduleTypesWindow.close()
+            metrics.stopProfiler()
+        log.info('Collapsed {} duplicate types into {} shared types', duplicateTypesCollapsed, len(canonicalTypes))
+        closeTypeArchive(f.absolutePath)
+        commitBatch()
+        if manifest is not None:
+            saveManifest()
+        metrics.startPhase('analysis')
+        resumeAnalysis()
+        writeMetrics()
+        log.printSummary()
+    finally:
+        # an import that failed partway leaves auto-analysis on, without analyzing anything
+        restoreAnalysis()
+        if WRITE_LOG:
+            log.info('Wrote the full log to {}', log_path_for(f.absolutePath))
+        log.close_log()
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import { BufferPtr } from "./BufferPtr.ts";
+
+// The object table of a LE/LX executable (what DOS/4GW and friends load), which says
+// where each object gets loaded. The segment numbers in the debug info are object numbers.
+// Reference: "LX - Linear eXecutable Module Format Description" (IBM), the LE header
+// is laid out the same up to the object table.
+
+export interface LxObject {
+	/** 1-based, like the segment numbers in the debug info */
+	objectNumber: number;
+	virtualSize: number;
+	relocationBaseAddress: number;
+	flags: number;
+}
+
+export interface SegmentMapEntry {
+	segment: number;
+	base: number;
+	size: number;
+}
+
+const objectTableEntrySize = 24;
+
+/**
+ * Returns undefined if `buffer` isn't a LE/LX executable (or is cut short).
+ */
+export function parseLxObjectTable(
+	buffer: ArrayBufferLike,
+): LxObject[] | undefined {
+	const bytes = new Uint8Array(buffer);
+	// 'MZ'
+	if (bytes.length < 0x40 || bytes[0] !== 0x4d || bytes[1] !== 0x5a) {
+		return undefined;
+	}
+	const headerOffset = BufferPtr.from(buffer, 0x3c, 4).get32Le() >>> 0;
+	if (headerOffset + 0x48 > bytes.length) {
+		return undefined;
+	}
+	const signature = String.fromCharCode(
+		bytes[headerOffset],
+		bytes[headerOffset + 1],
+	);
+	if (signature !== "LE" && signature !== "LX") {
+		return undefined;
+	}
+
+	const header = BufferPtr.from(buffer, headerOffset + 0x40, 8);
+	const objectTableOffset = header.getAndInc32Le() >>> 0;
+	const objectCount = header.getAndInc32Le() >>> 0;
+	const tableOffset = headerOffset + objectTableOffset;
+	if (tableOffset + objectCount * objectTableEntrySize > bytes.length) {
+		return undefined;
+	}
+
+	const ptr = BufferPtr.from(
+		buffer,
+		tableOffset,
+		objectCount * objectTableEntrySize,
+	);
+	const rt: LxObject[] = [];
+	for (let i = 0; i < objectCount; i++) {
+		const virtualSize = ptr.getAndInc32Le() >>> 0;
+		const relocationBaseAddress = ptr.getAndInc32Le() >>> 0;
+		const flags = ptr.getAndInc32Le() >>> 0;
+		// page table index, page table entries, reserved
+		ptr.offset += 12;
+		rt.push({
+			objectNumber: i + 1,
+			virtualSize,
+			relocationBaseAddress,
+			flags,
+		});
+	}
+	return rt;
+}
+
+/**
+ * Where each of the debug info's segments starts, for the ones the object table has.
+ */
+export function buildSegmentMap(
+	segments: number[],
+	objects: LxObject[] | undefined,
+): SegmentMapEntry[] {
+	if (objects === undefined) {
+		return [];
+	}
+	return segments.flatMap((segment) => {
+		const object = objects[segment - 1];
+		if (object === undefined) {
+			return [];
+		}
+		return [
+			{
+				segment,
+				base: object.relocationBaseAddress,
+				size: object.virtualSize,
+			},
+		];
+	});
+}
@@ -1,10 +1,26 @@
 import { readFile } from 'node:fs/promises';
+import { parseArgs } from 'node:util';
+import { writeShardedExport } from './sharded-export.ts';
 import { parseWatcomDebugInfo } from './watcom-debug-parser.ts';
 
-const filename = process.argv[2];
+// node ./src/main.ts game.exe > game.exe.json
+// node ./src/main.ts game.exe --sharded game.exe.export [--gzip]
+const { values, positionals } = parseArgs({
+	allowPositionals: true,
+	options: {
+		sharded: { type: 'string' },
+		gzip: { type: 'boolean', default: false },
+	},
+});
+const filename = positionals[0];
 
 const buffer = await readFile(filename);
 
 
 const result = parseWatcomDebugInfo(buffer.buffer);
-process.stdout.write(JSON.stringify(result, null, 4));
\ No newline at end of file
+if (values.sharded !== undefined) {
+	const indexPath = await writeShardedExport(result, values.sharded, { gzip: values.gzip });
+	process.stderr.write(`wrote ${indexPath}\n`);
+} else {
+	process.stdout.write(JSON.stringify(result, null, 4));
+}
@@ -0,0 +1,87 @@
+import { mkdir, writeFile } from "node:fs/promises";
+import { join } from "node:path";
+import { gzipSync } from "node:zlib";
+import type { parseWatcomDebugInfo } from "./watcom-debug-parser.ts";
+
+// An export split into a small index and one shard per module, so that an importer
+// only has to read (and hold) the modules it is working on.
+//
+//   <dir>/index.json              everything but the per-module sections, plus `shards`
+//   <dir>/modules/00012.json[.gz] `modulesTypes` and `modulesLocals` of module 12
+//
+// A shard looks like an export of its own, with the sections under `debuggingRegion`,
+// so the same readers work on both.
+
+export const shardedExportFormat = "watcom-sharded-1";
+
+type WatcomDebugInfo = ReturnType<typeof parseWatcomDebugInfo>;
+
+interface ModuleRecord {
+	meta: { moduleIndex: number };
+}
+
+export interface ShardEntry {
+	moduleIndex: number;
+	/** relative to the index */
+	path: string;
+}
+
+function groupByModule<T extends ModuleRecord>(records: T[]) {
+	const byModule = new Map<number, T[]>();
+	for (const record of records) {
+		const moduleIndex = record.meta.moduleIndex;
+		let moduleRecords = byModule.get(moduleIndex);
+		if (moduleRecords === undefined) {
+			moduleRecords = [];
+			byModule.set(moduleIndex, moduleRecords);
+		}
+		moduleRecords.push(record);
+	}
+	return byModule;
+}
+
+/**
+ * Writes `result` as a sharded export into `dir`, and returns the path of the index.
+ * The shards are written first, so the index is always the newest file.
+ */
+export async function writeShardedExport(
+	result: WatcomDebugInfo,
+	dir: string,
+	options: { gzip?: boolean } = {},
+): Promise<string> {
+	const { modulesTypes, modulesLocals, ...rest } = result.debuggingRegion;
+	const typesByModule = groupByModule(modulesTypes);
+	const localsByModule = groupByModule(modulesLocals);
+	const moduleIndices = [
+		...new Set([...typesByModule.keys(), ...localsByModule.keys()]),
+	].sort((a, b) => a - b);
+
+	await mkdir(join(dir, "modules"), { recursive: true });
+	const shards: ShardEntry[] = [];
+	for (const moduleIndex of moduleIndices) {
+		const path = `modules/${String(moduleIndex).padStart(5, "0")}.json${options.gzip ? ".gz" : ""}`;
+		const shard = JSON.stringify({
+			moduleIndex,
+			debuggingRegion: {
+				modulesTypes: typesByModule.get(moduleIndex) ?? [],
+				modulesLocals: localsByModule.get(moduleIndex) ?? [],
+			},
+		});
+		await writeFile(
+			join(dir, path),
+			options.gzip ? gzipSync(shard) : shard,
+		);
+		shards.push({ moduleIndex, path });
+	}
+
+	const indexPath = join(dir, "index.json");
+	await writeFile(
+		indexPath,
+		JSON.stringify({
+			format: shardedExportFormat,
+			masterDebugHeader: result.masterDebugHeader,
+			debuggingRegion: { ...rest, shards },
+		}),
+	);
+	return indexPath;
+}
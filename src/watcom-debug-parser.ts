@@ -1,4 +1,5 @@
 import { BufferPtr } from "./BufferPtr.ts";
+import { buildSegmentMap, parseLxObjectTable } from "./lx-object-table.ts";
 import { parseModuleLocals } from "./watcom-debug-parser-locals.ts";
 import { parseModuleTypes } from "./watcom-debug-parser-types.ts";
 
@@ -289,9 +290,16 @@ export function parseWatcomDebugInfo(buffer: ArrayBufferLike) {
 		masterDebugHeader,
 		debuggingRegionBuffer,
 	);
+	// the rest of the executable says where the segments get loaded
+	const segmentMap = buildSegmentMap(
+		debuggingRegion.segments,
+		parseLxObjectTable(buffer),
+	);
 
+	// right after the segments, so a reader streaming the export gets it before the big sections
+	const { langs, segments, ...rest } = debuggingRegion;
 	return {
 		masterDebugHeader,
-		debuggingRegion,
+		debuggingRegion: { langs, segments, segmentMap, ...rest },
 	};
 }
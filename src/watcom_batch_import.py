@@ -0,0 +1,177 @@
+##
+# Imports the symbols of many Watcom executables in one go, with Ghidra's `analyzeHeadless`.
+#
+#   python src/watcom_batch_import.py --ghidra ~/ghidra_11.4.2_PUBLIC --projects ~/watcom-projects \
+#       -j 4 games/ overlays/extra.ovl
+#
+# Every executable needs an export next to it, `<executable>.json` (see `--export-suffix`).
+# Directories are searched for executables that have one. Each executable gets a project of
+# its own, since a project can only be open in one Ghidra at a time, and one Ghidra runs per
+# worker. The executable is imported into its project, or, when the project is already
+# there, the program in it is processed again (which `INCREMENTAL` makes cheap), and
+# `ImportWatcomSymbolsScript.py` runs on it as a post script.
+#
+# Options for the script go after `--option` (`--option MODULE_FILTER='["gfx*.c"]'`),
+# anything after `--` goes to `analyzeHeadless` as is (`-- -loader LxLoader -max-cpu 2`).
+#
+# When all are done, it prints how each went: how long Ghidra took, how long the symbol
+# import took by its own metrics, and what went wrong, and `--report` writes that as JSON.
+# The output of each Ghidra is kept in `<projects>/<name>.headless.log`, where the name is the
+# executable's, with a short hash of its path so executables of the same name don't collide.
+##
+from __future__ import print_function, division
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from watcom_import_metrics import metrics_path_for
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_NAME = 'ImportWatcomSymbolsScript.py'
+
+# what the script or Ghidra print when a post script fails
+ERROR_PATTERN = re.compile(r'ERROR|Traceback|Exception')
+
+
+def getHeadlessPath(ghidraDir):
+    name = 'analyzeHeadless.bat' if os.name == 'nt' else 'analyzeHeadless'
+    return os.path.join(ghidraDir, 'support', name)
+
+def findJobs(paths, exportSuffix):
+    """(executable, export) pairs for the given executables and directories of them."""
+    jobs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                candidate = os.path.join(path, name)
+                if os.path.isfile(candidate) and os.path.isfile(candidate + exportSuffix):
+                    jobs.append((candidate, candidate + exportSuffix))
+        else:
+            jobs.append((path, path + exportSuffix))
+    return jobs
+
+def getProjectName(executable):
+    """The executable's name and a hash of where it is, `MAIN.EXE` in two directories are two projects."""
+    pathHash = hashlib.sha1(os.path.abspath(executable).encode('utf-8')).hexdigest()[:8]
+    return '{}-{}'.format(re.sub(r'[^A-Za-z0-9_.-]', '_', os.path.basename(executable)), pathHash)
+
+def getErrorLines(output, limit = 5):
+    return [line.strip() for line in output.splitlines() if ERROR_PATTERN.search(line)][:limit]
+
+def importOne(executable, export, args, headlessArgs):
+    """Run one Ghidra on one executable and describe how it went."""
+    name = os.path.basename(executable)
+    projectName = getProjectName(executable)
+    logPath = os.path.join(args.projects, projectName + '.headless.log')
+    metricsPath = metrics_path_for(os.path.abspath(export))
+    result = {'executable': executable, 'export': export, 'project': projectName}
+    if not os.path.isfile(export):
+        result.update(status='no export', seconds=0.0)
+        return result
+
+    command = [getHeadlessPath(args.ghidra), args.projects, projectName]
+    if os.path.exists(os.path.join(args.projects, projectName + '.gpr')) and not args.overwrite:
+        command += ['-process', name]
+    else:
+        command += ['-import', executable, '-overwrite']
+    # the script has to write metrics, that's how we know it finished
+    scriptArgs = [os.path.abspath(export)] + args.option + ['WRITE_METRICS=True']
+    command += ['-scriptPath', SCRIPT_DIR, '-postScript', SCRIPT_NAME] + scriptArgs + headlessArgs
+
+    startTime = time.time()
+    timedOut = False
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=args.timeout)
+        output = process.stdout.decode('utf-8', 'replace')
+        returnCode = process.returncode
+    except subprocess.TimeoutExpired as e:
+        output = (e.stdout or b'').decode('utf-8', 'replace')
+        returnCode = None
+        timedOut = True
+    except OSError as e:
+        output = str(e)
+        returnCode = None
+    result['seconds'] = time.time() - startTime
+    with open(logPath, 'w') as logFile:
+        logFile.write(' '.join(command))
+        logFile.write('\n\n')
+        logFile.write(output)
+    result['log'] = logPath
+
+    finished = os.path.exists(metricsPath) and os.path.getmtime(metricsPath) >= startTime
+    if finished:
+        with open(metricsPath) as metricsFile:
+            metrics = json.load(metricsFile)
+        result['importSeconds'] = metrics['totalSeconds']
+        result['ops'] = metrics['counters'].get('ops', 0)
+    if finished and returnCode == 0:
+        result['status'] = 'ok'
+    elif timedOut:
+        result['status'] = 'timed out'
+    else:
+        result['status'] = 'failed'
+    if result['status'] != 'ok':
+        result['errors'] = getErrorLines(output) or output.strip().splitlines()[-3:]
+    return result
+
+def formatResult(result):
+    line = '{:<10} {:<24} {:>8.1f}s'.format(result['status'], os.path.basename(result['executable']), result['seconds'])
+    if 'importSeconds' in result:
+        line += ' {:>8.1f}s import {:>9d} ops'.format(result['importSeconds'], result['ops'])
+    return line
+
+def main(argv):
+    headlessArgs = []
+    if '--' in argv:
+        headlessArgs = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+
+    parser = argparse.ArgumentParser(description='Import Watcom debug symbols into many executables with analyzeHeadless.')
+    parser.add_argument('paths', nargs='+', help='executables, or directories with executables and their exports')
+    parser.add_argument('--ghidra', default=os.environ.get('GHIDRA_INSTALL_DIR'), help='the Ghidra install directory (default: $GHIDRA_INSTALL_DIR)')
+    parser.add_argument('--projects', required=True, help='directory for the Ghidra projects, one per executable')
+    parser.add_argument('-j', '--jobs', type=int, default=max(1, (os.cpu_count() or 2) // 2), help='Ghidras to run at once')
+    parser.add_argument('--export-suffix', default='.json', help="what to add to an executable's path to get its export")
+    parser.add_argument('--option', action='append', default=[], metavar='NAME=VALUE', help='set an option of the import script')
+    parser.add_argument('--overwrite', action='store_true', help='import executables again even if their project exists')
+    parser.add_argument('--timeout', type=float, help='give up on an executable after this many seconds')
+    parser.add_argument('--report', help='also write the results to this file, as JSON')
+    args = parser.parse_args(argv)
+    if args.ghidra is None:
+        parser.error('--ghidra or $GHIDRA_INSTALL_DIR is needed')
+    if not os.path.isdir(args.projects):
+        os.makedirs(args.projects)
+
+    jobs = findJobs(args.paths, args.export_suffix)
+    results = []
+    startTime = time.time()
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(importOne, executable, export, args, headlessArgs) for executable, export in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print('[{}/{}] {}'.format(len(results), len(jobs), formatResult(result)))
+            for error in result.get('errors', []):
+                print('    ' + error)
+    totalSeconds = time.time() - startTime
+
+    results.sort(key=lambda result: result['executable'])
+    failed = [result for result in results if result['status'] != 'ok']
+    print('{} of {} imported in {:.1f}s with {} workers'.format(len(results) - len(failed), len(results), totalSeconds, args.jobs))
+    for result in failed:
+        seeLog = ', see {}'.format(result['log']) if 'log' in result else ''
+        print('  {}: {}{}'.format(result['executable'], result['status'], seeLog))
+    if args.report:
+        with open(args.report, 'w') as reportFile:
+            json.dump({'totalSeconds': totalSeconds, 'jobs': args.jobs, 'results': results}, reportFile, indent=2)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
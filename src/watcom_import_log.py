@@ -0,0 +1,117 @@
+##
+# Leveled logging for the importer, without flooding the Ghidra console.
+#
+# Messages at `consoleLevel` and up are printed, but each warning (or error) template is
+# only printed the first `REPEAT_LIMIT` times. After that it is just counted, and
+# `summaryLines()` reports how often it happened in total. Messages at `fileLevel` and
+# up, which by default is all of them, go to a buffered log file when one is open.
+#
+#   warning('unhandled entryType: {}', entryType)
+#
+# Arguments are only formatted when the message goes somewhere, and the template is
+# what identifies repeats. Format the argument in yourself
+# (`warning('unhandled entryType: {}'.format(entryType))`) to count each value
+# separately.
+#
+# Like `watcom_import_plan.py` this has no Ghidra dependencies.
+##
+from __future__ import print_function, division
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+REPEAT_LIMIT = 5
+BUFFER_LINES = 1000
+
+consoleLevel = INFO
+fileLevel = DEBUG
+
+logFile = None
+buffered = []
+repeats = dict()
+levelCounts = dict()
+
+
+def reset(level = INFO):
+    global consoleLevel
+    close_log()
+    consoleLevel = level
+    repeats.clear()
+    levelCounts.clear()
+
+def open_log(path, level = DEBUG):
+    global logFile, fileLevel
+    close_log()
+    logFile = open(path, 'w')
+    fileLevel = level
+
+def flush():
+    if logFile is not None and buffered:
+        logFile.write('\n'.join(buffered))
+        logFile.write('\n')
+        del buffered[:]
+
+def close_log():
+    global logFile
+    if logFile is None:
+        return
+    flush()
+    logFile.close()
+    logFile = None
+
+def log(level, template, *args):
+    toConsole = level >= consoleLevel
+    toFile = logFile is not None and level >= fileLevel
+    levelCounts[level] = levelCounts.get(level, 0) + 1
+    if not toConsole and not toFile:
+        return
+    message = template.format(*args) if args else template
+    if toFile:
+        buffered.append('{:<7} {}'.format(LEVEL_NAMES[level], message))
+        if len(buffered) >= BUFFER_LINES:
+            flush()
+    if toConsole and level < WARNING:
+        print(message)
+    elif toConsole:
+        seen = repeats.get(template, 0) + 1
+        repeats[template] = seen
+        if seen <= REPEAT_LIMIT:
+            print(message)
+        if seen == REPEAT_LIMIT:
+            print('(not printing "{}" any more, see the summary at the end)'.format(template))
+
+def debug(template, *args):
+    log(DEBUG, template, *args)
+
+def info(template, *args):
+    log(INFO, template, *args)
+
+def warning(template, *args):
+    log(WARNING, template, *args)
+
+def error(template, *args):
+    log(ERROR, template, *args)
+
+def summaryLines():
+    """How often each message that hit `REPEAT_LIMIT` was logged, most frequent first."""
+    lines = []
+    for template, seen in sorted(repeats.items(), key=lambda item: -item[1]):
+        if seen > REPEAT_LIMIT:
+            lines.append('{}: {} times'.format(template, seen))
+    return lines
+
+def printSummary():
+    lines = summaryLines()
+    if lines:
+        print('Repeated messages:')
+        for line in lines:
+            print('  ' + line)
+    counts = ', '.join('{} {}s'.format(levelCounts[level], LEVEL_NAMES[level].lower()) for level in sorted(levelCounts, reverse=True) if level >= WARNING)
+    if counts:
+        print('Logged {}'.format(counts))
+    if logFile is not None:
+        flush()
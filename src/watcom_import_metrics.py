@@ -0,0 +1,190 @@
+##
+# Timers and counters for the importer, written out as a JSON summary at the end of a run.
+#
+# Like `watcom_import_plan.py` this has no Ghidra dependencies and runs under Jython as
+# well as CPython. Everything is module-level state, there's only ever one import running.
+#
+#   count('functions.created')          bump a counter
+#   addTime('op.local', seconds)        add to a timer (seconds and number of calls)
+#   @timed('types.materialize')         time every call to a function
+#   startPhase('locals')                start a phase. Each phase records how long it
+#                                       took and how much each counter moved during it.
+#   startProfiler(0.01)                 sample the stack of the calling thread every 10ms
+#   summary()                           end the last phase and gather everything up
+#   write_summary(path, summary())      write it as JSON
+##
+from __future__ import print_function, division
+
+import json
+import sys
+import threading
+import time
+
+counters = dict()
+timers = dict()
+phases = []
+runStartTime = time.time()
+
+currentPhase = None
+phaseStartTime = None
+phaseStartCounters = None
+
+profiler = None
+
+
+def reset():
+    global runStartTime, currentPhase, phaseStartTime, phaseStartCounters, profiler
+    counters.clear()
+    timers.clear()
+    del phases[:]
+    runStartTime = time.time()
+    currentPhase = None
+    phaseStartTime = None
+    phaseStartCounters = None
+    profiler = None
+
+def count(name, n = 1):
+    counters[name] = counters.get(name, 0) + n
+
+def addTime(name, seconds, calls = 1):
+    timer = timers.get(name)
+    if timer is None:
+        timers[name] = [seconds, calls]
+    else:
+        timer[0] += seconds
+        timer[1] += calls
+
+def timed(name):
+    """Decorator adding the time spent in every call to timer `name`."""
+    def decorate(func):
+        def timedFunc(*args, **kwargs):
+            startTime = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                addTime(name, time.time() - startTime)
+        timedFunc.__name__ = func.__name__
+        timedFunc.__doc__ = func.__doc__
+        return timedFunc
+    return decorate
+
+def endPhase():
+    global currentPhase
+    if currentPhase is None:
+        return
+    now = time.time()
+    moved = dict()
+    for name, value in counters.items():
+        delta = value - phaseStartCounters.get(name, 0)
+        if delta:
+            moved[name] = delta
+    phases.append({'name': currentPhase, 'seconds': now - phaseStartTime, 'counters': moved})
+    currentPhase = None
+
+def startPhase(name):
+    global currentPhase, phaseStartTime, phaseStartCounters
+    endPhase()
+    currentPhase = name
+    phaseStartTime = time.time()
+    phaseStartCounters = dict(counters)
+
+
+class SamplingProfiler(object):
+    """Looks at the stack of one thread every `interval` seconds from a background thread.
+
+    Cheap enough to leave on for a whole import, and it needs nothing but
+    `sys._current_frames`, which Jython has too.
+    """
+
+    def __init__(self, interval, threadId):
+        self.interval = interval
+        self.threadId = threadId
+        self.samples = 0
+        self.selfSamples = dict()
+        self.totalSamples = dict()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='watcom-import-profiler')
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.is_set():
+            frame = sys._current_frames().get(self.threadId)
+            if frame is not None:
+                self.sample(frame)
+            self.stopped.wait(self.interval)
+
+    def sample(self, frame):
+        self.samples += 1
+        where = self.describe(frame)
+        self.selfSamples[where] = self.selfSamples.get(where, 0) + 1
+        seen = set()
+        while frame is not None:
+            where = self.describe(frame)
+            if where not in seen:
+                seen.add(where)
+                self.totalSamples[where] = self.totalSamples.get(where, 0) + 1
+            frame = frame.f_back
+
+    def describe(self, frame):
+        code = frame.f_code
+        return '{}:{}'.format(code.co_filename.replace('\\', '/').split('/')[-1], code.co_name)
+
+    def summary(self, top = 25):
+        def ranked(samples):
+            return [[where, n] for where, n in sorted(samples.items(), key=lambda item: -item[1])[:top]]
+        return {
+            'interval': self.interval,
+            'samples': self.samples,
+            'self': ranked(self.selfSamples),
+            'total': ranked(self.totalSamples),
+        }
+
+def startProfiler(interval):
+    global profiler
+    if not hasattr(sys, '_current_frames'):
+        print('no sys._current_frames, not profiling')
+        return
+    profiler = SamplingProfiler(interval, threading.current_thread().ident)
+    profiler.start()
+
+def stopProfiler():
+    if profiler is not None and profiler.thread.is_alive():
+        profiler.stop()
+
+
+def summary(**extra):
+    endPhase()
+    stopProfiler()
+    result = {
+        'totalSeconds': time.time() - runStartTime,
+        'phases': phases,
+        'counters': counters,
+        'timers': dict((name, {'seconds': timer[0], 'calls': timer[1]}) for name, timer in timers.items()),
+    }
+    if profiler is not None:
+        result['profile'] = profiler.summary()
+    result.update(extra)
+    return result
+
+def metrics_path_for(exportPath):
+    return exportPath + '.metrics.json'
+
+def write_summary(path, result):
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+
+def formatPhases(result):
+    """One line per phase, for the console."""
+    lines = []
+    for phase in result['phases']:
+        ops = phase['counters'].get('ops', 0)
+        lines.append('{:<10} {:8.2f}s {:8d} ops {:8.0f} ops/s'.format(phase['name'], phase['seconds'], ops, ops / max(phase['seconds'], 0.001)))
+    lines.append('{:<10} {:8.2f}s'.format('total', result['totalSeconds']))
+    return lines
@@ -0,0 +1,863 @@
+##
+# Turns the JSON written by `src/main.ts` into a flat list of import operations.
+#
+# Nothing in here touches Ghidra, so it runs under the Jython that Ghidra ships as
+# well as under a plain CPython. `ImportWatcomSymbolsScript.py` only has to apply the
+# operations. Run it directly to compute (and cache) a plan outside of Ghidra:
+#
+#   python src/watcom_import_plan.py results.json -j 8
+#
+# writes `results.json.plan.jsonl`, which the Ghidra script picks up instead of
+# planning again as long as it is newer than the export. For a sharded export
+# (`main.ts --sharded`), pass its `index.json`, and each worker plans a shard.
+#
+# Operations are plain dicts so they can be written out as JSON. Addresses are
+# a `segment` plus an `offset` into that segment, and types are referred to by
+# `module` and `type` (the index into that module's `modulesTypes` table).
+#
+#   fragment   move `ranges` (a sorted list of non-overlapping `[segment, offset, size]`)
+#              into the fragment called `name`
+#   label      create label `name` at `segment:offset`, `imported` picks the SourceType.
+#              `block` marks the labels at the start and end of a block.
+#   data       apply type `module:type` at `segment:offset`
+#   function   create or rename function `name` at `segment:offset`. With a `size` the
+#              body is exactly that, without one Ghidra works the body out itself.
+#   signature  set the return type and parameters of the function at `segment:offset`
+#              from type `module:type` and the registers it uses
+#   local      add local variable `name` of type `module:type` to the function at
+#              `segment:offset` (or the one containing it, when `inBlock` is set)
+#   clear      reset the signature of the function at `segment:offset` and remove all
+#              its local variables
+#   remove     undo an earlier import: delete the `kind` (function, label or data) at
+#              `segment:offset`, for labels only the one called `name`
+#   phase      marks the start of the `fragments`, `locals`, `globals` or `remove` part of
+#              the plan
+##
+from __future__ import print_function, division
+
+import bisect
+import fnmatch
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import os
+import sys
+
+import watcom_import_log as log
+import watcom_import_metrics as metrics
+
+ROUTINE_ENTRIES = ('NEAR_RTN_386', 'FAR_RTN_386', 'NEAR_RTN', 'FAR_RTN')
+BLOCK_ENTRIES = ('BLOCK_386', 'BLOCK')
+
+# Type names and categories as small ints, so a type table is a few lists of ints. Codes
+# are handed out as new names come up, and only mean something within one run.
+TYPE_CODES = dict()
+TYPE_CODE_NAMES = []
+
+def getTypeCode(name):
+    code = TYPE_CODES.get(name)
+    if code is None:
+        code = len(TYPE_CODE_NAMES)
+        TYPE_CODES[name] = code
+        TYPE_CODE_NAMES.append(name)
+    return code
+
+KIND_DUMMY = getTypeCode('dummy')
+KIND_NAME = getTypeCode('NAME')
+KIND_SCALAR = getTypeCode('SCALAR')
+KIND_STRUCT = getTypeCode('STRUCTURE_LIST')
+KIND_PROCEDURE = getTypeCode('PROCEDURE_NEAR386')
+ARRAY_KINDS = (getTypeCode('ARRAY_BYTE_INDEX'), getTypeCode('ARRAY_WORD_INDEX'), getTypeCode('ARRAY_LONG_INDEX'))
+CATEGORY_POINTER = getTypeCode('POINTER')
+
+# Structs and function definitions are mutable, so we add an empty "shell" for them
+# before anything else. That breaks every cycle a C type graph can have.
+SHELL_KINDS = (KIND_STRUCT, KIND_PROCEDURE)
+
+
+# A sharded export is an index, with everything but the sections below, and a shard per
+# module with that module's part of them. Shards are laid out like an export of their own.
+SHARDED_EXPORT_FORMAT = 'watcom-sharded-1'
+SHARD_SECTIONS = ('modulesTypes', 'modulesLocals')
+
+def open_export(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8')
+    return open(path, 'r')
+
+def load_export(path):
+    """Return the `debuggingRegion` of the export at `path`, parsed in one go.
+
+    For a sharded export that is the index, see `load_shard` for the rest.
+    """
+    with open_export(path) as f:
+        return json.load(f)['debuggingRegion']
+
+def is_sharded_export(path):
+    """Whether `path` is the index of a sharded export. `format` is the first key of one."""
+    with open_export(path) as f:
+        head = f.read(256)
+    return '"format":"{}"'.format(SHARDED_EXPORT_FORMAT) in head.replace(' ', '')
+
+def shard_path_for(indexPath, shard):
+    return os.path.join(os.path.dirname(indexPath), shard['path'])
+
+def load_shard(path):
+    """The sections of one shard, see `SHARD_SECTIONS`."""
+    return load_export(path)
+
+def plan_path_for(exportPath):
+    return exportPath + '.plan.jsonl'
+
+def write_plan(path, ops):
+    with open(path, 'w') as f:
+        for op in ops:
+            f.write(json.dumps(op, sort_keys=True))
+            f.write('\n')
+
+def read_plan(path):
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def mergeModuleTypes(modulesTypes):
+    """Map moduleIndex to its `TypeTable`."""
+    modulesTypesDict = dict()
+    for moduleType in modulesTypes:
+        moduleIndex = moduleType['meta']['moduleIndex']
+        addModuleTypes(modulesTypesDict, moduleIndex, moduleType['entries'])
+    return modulesTypesDict
+
+def addModuleTypes(modulesTypesDict, moduleIndex, moduleEntries):
+    types = modulesTypesDict.get(moduleIndex)
+    if types is None:
+        types = modulesTypesDict[moduleIndex] = TypeTable()
+    types.extend(moduleEntries)
+
+def hash_module_types(modules, modulesTypes, salt = ''):
+    """Hashes of everything that goes into making the types: module names and type tables.
+
+    Returns a hash of the lot, and a hash per module index that only covers that module's
+    name and type table. `salt` is mixed into the first, so that changing how types are
+    made can invalidate old hashes.
+    """
+    names = dict((module['moduleIndex'], module['name']) for module in modules)
+    hasher = hashlib.sha1(salt.encode('utf-8'))
+    hasher.update(json.dumps([module['name'] for module in modules]).encode('utf-8'))
+    moduleHashers = dict()
+    for moduleType in modulesTypes:
+        moduleIndex = moduleType['meta']['moduleIndex']
+        # serialized once for both hashes. The lot hashes `[moduleIndex, entries]`, the same
+        # bytes as json.dumps of that list.
+        entries = json.dumps(moduleType['entries'], sort_keys=True).encode('utf-8')
+        hasher.update('[{}, '.format(json.dumps(moduleIndex)).encode('utf-8'))
+        hasher.update(entries)
+        hasher.update(b']')
+        if moduleIndex not in moduleHashers:
+            moduleHashers[moduleIndex] = hashlib.sha1(json.dumps(names.get(moduleIndex)).encode('utf-8'))
+        # leave the index out, so that modules keep their hash when others come and go
+        moduleHashers[moduleIndex].update(entries)
+    moduleHashes = dict((moduleIndex, moduleHasher.hexdigest()) for moduleIndex, moduleHasher in moduleHashers.items())
+    return hasher.hexdigest(), moduleHashes
+
+
+#
+# types
+#
+
+def getTypeChildren(typeRoot):
+    """Type indexes that the `modulesTypes` entry `typeRoot` refers to, in a stable order."""
+    entryType = typeRoot['typeName']
+    if entryType == 'NAME':
+        return [typeRoot['type']]
+    elif entryType == 'STRUCTURE_LIST':
+        return [f['type'] for f in typeRoot['fields']]
+    elif entryType == 'PROCEDURE_NEAR386':
+        return [typeRoot['retType']] + list(typeRoot['paramTypes'])
+    elif typeRoot.get('baseType') is not None:
+        return [typeRoot['baseType']]
+    return []
+
+class TypeTable(object):
+    """A module's type table, as parallel lists indexed by type index.
+
+    The export's entries are only read once, here. For every entry we keep its kind and
+    category (`getTypeCode`), its name, the type indexes it refers to (`getTypeChildren`)
+    and a tuple with whatever else its kind needs:
+
+      NAME                (scope, type)
+      SCALAR              (scalarTypeClassName, scalarTypeSizeInBytes)
+      STRUCTURE_LIST      (size, fields), a field is (typeName, name, offset, type, startBit, bitSize)
+      PROCEDURE_NEAR386   (retType, paramTypes)
+      anything else       (baseType, highBound, baseLocator)
+
+    Watcom numbers types from 1. If the first entry isn't 0, index 0 is a placeholder.
+    """
+
+    __slots__ = ('kinds', 'categories', 'names', 'children', 'details')
+
+    def __init__(self):
+        self.kinds = []
+        self.categories = []
+        self.names = []
+        self.children = []
+        self.details = []
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def extend(self, entries):
+        for entry in entries:
+            if not self.kinds and entry['selfIndex'] != 0:
+                self.add(KIND_DUMMY, None, None, (), None)
+            self.append(entry)
+
+    def add(self, kind, category, name, children, details):
+        self.kinds.append(kind)
+        self.categories.append(category)
+        self.names.append(name)
+        self.children.append(children)
+        self.details.append(details)
+
+    def append(self, entry):
+        entryType = entry['typeName']
+        if entryType == 'NAME':
+            details = (entry['scope'], entry['type'])
+        elif entryType == 'SCALAR':
+            details = (entry['scalarTypeClassName'], entry['scalarTypeSizeInBytes'])
+        elif entryType == 'STRUCTURE_LIST':
+            details = (entry.get('size', 0), tuple((f['typeName'], f['name'], f['offset'], f['type'], f.get('startBit'), f.get('bitSize')) for f in entry['fields']))
+        elif entryType == 'PROCEDURE_NEAR386':
+            details = (entry['retType'], tuple(entry['paramTypes']))
+        else:
+            details = (entry.get('baseType'), entry.get('highBound'), entry.get('baseLocator'))
+        category = entry.get('categoryName')
+        self.add(getTypeCode(entryType), getTypeCode(category) if category is not None else None,
+                 entry.get('name'), tuple(getTypeChildren(entry)), details)
+
+    def describe(self, typeIndex):
+        """The entry at `typeIndex`, for log messages."""
+        if not 0 <= typeIndex < len(self.kinds):
+            return 'no type {}'.format(typeIndex)
+        category = self.categories[typeIndex]
+        return '{} {} {} {}'.format(TYPE_CODE_NAMES[self.kinds[typeIndex]], TYPE_CODE_NAMES[category] if category is not None else None,
+                                    self.names[typeIndex], self.details[typeIndex])
+
+def getReachableTypes(types, roots):
+    """The type indexes in `roots` and every type they refer to, directly or not."""
+    children = types.children
+    queue = [root for root in set(roots) if 0 < root < len(types)]
+    reachable = set(queue)
+    for typeIndex in queue:
+        for child in children[typeIndex]:
+            if 0 < child < len(types) and child not in reachable:
+                reachable.add(child)
+                queue.append(child)
+    return reachable
+
+def getTypeShape(types, typeIndex):
+    """Everything about a type that we look at when creating it, except the types it refers to."""
+    kind = types.kinds[typeIndex]
+    details = types.details[typeIndex]
+    if kind == KIND_NAME:
+        scopeCode = details[0]
+        scopeName = types.names[scopeCode] if scopeCode != 0 else None
+        return (kind, types.names[typeIndex], scopeName)
+    elif kind == KIND_SCALAR:
+        return (kind,) + details
+    elif kind == KIND_STRUCT:
+        fields = [(fieldType, name, offset, startBit, bitSize) for fieldType, name, offset, _, startBit, bitSize in details[1]]
+        return (kind, details[0], fields)
+    elif kind == KIND_PROCEDURE:
+        return (kind, types.categories[typeIndex], types.names[typeIndex], None)
+    return (kind, types.categories[typeIndex], types.names[typeIndex], details[1])
+
+def findStronglyConnectedTypes(types):
+    """Tarjan's algorithm, without recursion. Returns the SCCs with dependencies first."""
+    index = dict()
+    low = dict()
+    onStack = set()
+    stack = []
+    sccs = []
+    counter = 0
+    typeChildren = types.children
+    for start in range(1, len(types)):
+        if start in index:
+            continue
+        index[start] = low[start] = counter
+        counter += 1
+        stack.append(start)
+        onStack.add(start)
+        work = [(start, iter(typeChildren[start]))]
+        while work:
+            node, children = work[-1]
+            descended = False
+            for child in children:
+                if child <= 0 or child >= len(types):
+                    continue
+                if child not in index:
+                    index[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    onStack.add(child)
+                    work.append((child, iter(typeChildren[child])))
+                    descended = True
+                    break
+                elif child in onStack:
+                    low[node] = min(low[node], index[child])
+            if descended:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                scc = []
+                while True:
+                    member = stack.pop()
+                    onStack.discard(member)
+                    scc.append(member)
+                    if member == node:
+                        break
+                sccs.append(scc)
+    return sccs
+
+FINGERPRINT_ROUNDS = 3
+
+def computeTypeFingerprints(types):
+    """Structural fingerprint of every entry in a module's type table.
+
+    Acyclic entries hash their own shape plus their children's fingerprints. A cycle (an
+    SCC) is hashed once, as a breadth-first walk from a canonical start where edges inside
+    the SCC are numbered in visiting order, and each member's fingerprint is that hash plus
+    the member's number in the walk. So the result doesn't depend on the entries' indexes
+    in the table, and the whole thing stays linear in the size of the table.
+
+    The start is the member with the smallest label after `FINGERPRINT_ROUNDS` rounds of
+    label refinement. Ties go to the lowest index, which only costs sharing: SCCs get the
+    same hash only when their walks, and so their structure, are the same.
+    """
+    fingerprints = dict()
+    children = types.children
+    for scc in findStronglyConnectedTypes(types):
+        if len(scc) == 1 and scc[0] not in children[scc[0]]:
+            parts = [getTypeShape(types, scc[0])]
+            parts.extend(fingerprints.get(child, 'missing') for child in children[scc[0]])
+            fingerprints[scc[0]] = hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+            continue
+
+        members = set(scc)
+        shapes = dict()
+        labels = dict()
+        for member in scc:
+            refs = [child in members or fingerprints.get(child, 'missing') for child in children[member]]
+            shapes[member] = repr(getTypeShape(types, member))
+            labels[member] = hashlib.md5(repr((shapes[member], refs)).encode('utf-8')).hexdigest()
+        for _ in range(FINGERPRINT_ROUNDS):
+            labels = dict((member, hashlib.md5(repr((labels[member], [labels.get(child) for child in children[member]])).encode('utf-8')).hexdigest())
+                          for member in scc)
+        start = min(scc, key=lambda member: (labels[member], member))
+
+        numbering = {start: 0}
+        queue = [start]
+        walk = []
+        for node in queue:
+            refs = []
+            for child in children[node]:
+                if child in members:
+                    if child not in numbering:
+                        numbering[child] = len(queue)
+                        queue.append(child)
+                    refs.append(('#', numbering[child]))
+                else:
+                    refs.append(fingerprints.get(child, 'missing'))
+            walk.append((shapes[node], refs))
+        sccHash = hashlib.md5(repr(('cycle', walk)).encode('utf-8')).hexdigest()
+        for member in scc:
+            fingerprints[member] = '{}#{}'.format(sccHash, numbering[member])
+    return fingerprints
+
+def computeTypeNames(types):
+    """Name for each struct/function type, taken from the NAME entry that refers to it."""
+    names = dict()
+    for typeIndex in range(len(types)):
+        if types.kinds[typeIndex] != KIND_NAME:
+            continue
+        scopeCode, aliasFor = types.details[typeIndex]
+        scopeName = types.names[scopeCode] if scopeCode != 0 else None
+        if scopeName == 'struct' or (scopeName is None and aliasFor not in names):
+            names[aliasFor] = types.names[typeIndex]
+    return names
+
+def orderPendingTypes(types, pending):
+    """Order in which to create (or, for shells, fill in) the `pending` type entries.
+
+    Kahn's algorithm: a shell only has to wait for the non-shell types it refers to,
+    everything else waits for all of its pending children. Edges into shells are already
+    satisfied by the time we get here, so this is a DAG unless there is a cycle that
+    doesn't go through a struct or function, which C can't express. If there is one
+    anyway we break it and let the missing types come out as None.
+    """
+    pendingSet = set(pending)
+    waitingOn = dict()
+    dependents = dict()
+    for typeIndex in pending:
+        waitingOn[typeIndex] = 0
+        for child in set(types.children[typeIndex]):
+            if child in pendingSet and types.kinds[child] not in SHELL_KINDS:
+                waitingOn[typeIndex] += 1
+                dependents.setdefault(child, []).append(typeIndex)
+    ready = [typeIndex for typeIndex in pending if waitingOn[typeIndex] == 0]
+    done = set()
+    order = []
+    while ready or len(done) < len(pending):
+        if not ready:
+            stuck = [typeIndex for typeIndex in pending if typeIndex not in done]
+            log.warning('type cycle without a struct: {}', stuck)
+            ready.append(stuck[0])
+        typeIndex = ready.pop()
+        if typeIndex in done:
+            continue
+        done.add(typeIndex)
+        order.append(typeIndex)
+        for dependent in dependents.get(typeIndex, []):
+            waitingOn[dependent] -= 1
+            if waitingOn[dependent] == 0:
+                ready.append(dependent)
+    return order
+
+
+#
+# symbols
+#
+
+def mergeRanges(ranges):
+    """Sort `[segment, offset, size]` ranges and merge the ones that touch or overlap."""
+    merged = []
+    for segment, offset, size in sorted(ranges):
+        if size <= 0:
+            continue
+        last = merged[-1] if merged else None
+        if last is not None and last[0] == segment and offset <= last[1] + last[2]:
+            last[2] = max(last[2], offset + size - last[1])
+        else:
+            merged.append([segment, offset, size])
+    return merged
+
+def select_modules(modules, patterns):
+    """The indices of the modules whose name matches one of the glob `patterns`."""
+    return set(module['moduleIndex'] for module in modules
+               if any(fnmatch.fnmatch(module['name'], pattern) for pattern in patterns))
+
+def inModules(moduleIndices, moduleIndex):
+    return moduleIndices is None or moduleIndex in moduleIndices
+
+def planFragments(addressesTable, modules, moduleIndices = None):
+    """One op per module, with all of its address rows merged into as few ranges as possible."""
+    names = []
+    rangesByName = dict()
+    for addrTable in addressesTable:
+        segment = addrTable["segment"]
+        for addrInfo in addrTable["addressInfo"]:
+            if not inModules(moduleIndices, addrInfo["moduleIndex"]):
+                continue
+            name = modules[addrInfo["moduleIndex"]]["name"]
+            if name not in rangesByName:
+                names.append(name)
+                rangesByName[name] = []
+            rangesByName[name].append((segment, addrInfo["address"], addrInfo["size"]))
+    for name in names:
+        ranges = mergeRanges(rangesByName[name])
+        if ranges:
+            yield {'op': 'fragment', 'name': name, 'ranges': ranges}
+
+def getRegisterName(location):
+    if location['lsmName'] == "MULTI_REG":
+        return location['registerNames'][0]
+    return None
+
+def findRoutine(routines, segment, offset):
+    """The start of the routine that `segment:offset` is in.
+
+    `routines` is a sorted list of `(segment, start, end)`, routines don't overlap.
+    """
+    i = bisect.bisect_right(routines, (segment, offset, float('inf'))) - 1
+    if i >= 0 and routines[i][0] == segment and routines[i][1] <= offset < routines[i][2]:
+        return (segment, routines[i][1])
+    return None
+
+def planModuleLocals(local, blockLabels = True):
+    """The ops for one `modulesLocals` record. Blocks are resolved to the routine they are
+    in here, from the routines seen so far, so the applier doesn't have to look them up."""
+    moduleIndex = local['meta']['moduleIndex']
+    routines = []
+    base = None
+    routine = None
+    routineName = None
+    inBlock = False
+    blockParentOffset = None
+    returnAddressOffset = None
+
+    for entry in local['entries']:
+        entryType = entry['typeName']
+        if entryType == 'MODULE386':
+            yield {'op': 'label', 'segment': entry['segment'], 'offset': entry['location'], 'name': entry['symbolName'], 'imported': True}
+            yield {'op': 'data', 'segment': entry['segment'], 'offset': entry['location'], 'module': moduleIndex, 'type': entry['typeIndex']}
+        elif entryType == 'SET_BASE386':
+            base = (entry['segment'], entry['location'])
+        elif entryType in ROUTINE_ENTRIES:
+            # startOffset, size, parentBlockOffset, returnAddressOffset, typeIndex, returnValueLocation
+            # numberOfPregisterParams, registerParams, symbolName
+            inBlock = False
+            blockParentOffset = None
+            if base is None:
+                log.warning('routine {} comes before any SET_BASE386, skipping it', entry['symbolName'])
+                routine = None
+                continue
+
+            routineName = entry['symbolName']
+            returnAddressOffset = entry.get('returnAddressOffset', 0)
+            returnValueLocation = entry.get('returnValueLocation', [])[0]
+            routine = (base[0], base[1] + entry['startOffset'])
+            bisect.insort(routines, (routine[0], routine[1], routine[1] + entry['size']))
+            yield {'op': 'function', 'segment': routine[0], 'offset': routine[1], 'size': entry['size'], 'name': routineName}
+            yield {
+                'op': 'signature',
+                'segment': routine[0],
+                'offset': routine[1],
+                'name': routineName,
+                'module': moduleIndex,
+                'type': entry['typeIndex'],
+                'returnLocation': returnValueLocation['lsmName'],
+                'returnRegister': getRegisterName(returnValueLocation),
+                # a register parameter we can't express comes out as None and is skipped
+                'registerParams': [getRegisterName(registerParam[0]) for registerParam in entry.get('registerParams', [])],
+            }
+        elif entryType == 'LOCAL':
+            if routine is None:
+                continue
+            symbolName = entry['symbolName']
+            location = entry['location'][0]
+            op = {'op': 'local', 'segment': routine[0], 'offset': routine[1], 'inBlock': inBlock, 'name': symbolName, 'module': moduleIndex, 'type': entry['typeIndex']}
+
+            if location['lsmName'].startswith('BP_OFFSET'):
+                offset = location['offset']
+                # add `returnAddressOffset` to `offset` because ghidra uses the ESP and not EBP!
+                # and by "add" I mean "subtract" since these are all negative
+                if returnAddressOffset is not None:
+                    offset = offset - returnAddressOffset
+                op['stackOffset'] = offset
+            elif location['lsmName'] == "CONST_ADDR386":
+                op['constSegment'] = location['constSegment']
+                op['constAddress'] = location['constAddress']
+                op['firstUseOffset'] = blockParentOffset
+            else:
+                log.warning('local: unhandled location {} for local for func {}', location, routineName)
+                continue
+            yield op
+        elif entryType in BLOCK_ENTRIES:
+            # blocks can also have LOCALs, which belong to the routine the block is in
+            if base is None:
+                routine = None
+                continue
+            block = (base[0], base[1] + entry['startOffset'])
+            routine = findRoutine(routines, block[0], block[1])
+            inBlock = False
+            if routine is None:
+                # not in a routine of this module, the applier looks up the function containing it
+                routine = block
+                inBlock = True
+            blockParentOffset = entry['parentBlockOffset']
+            if blockLabels:
+                yield {'op': 'label', 'segment': block[0], 'offset': block[1], 'name': 'block_start_{:08x}'.format(entry['startOffset']), 'imported': False, 'block': True}
+                yield {'op': 'label', 'segment': block[0], 'offset': block[1] + entry['size'], 'name': 'block_end_{:08x}'.format(entry['startOffset']), 'imported': False, 'block': True}
+        else:
+            log.warning("unhandled local entry: {}".format(entryType))
+
+def planGlobalSymbols(globalSymbolsTable, moduleIndices = None):
+    for g in globalSymbolsTable:
+        if not inModules(moduleIndices, g['moduleIndex']):
+            continue
+        # for some reason bools aren't getting parsed out of the JSON correctly...
+        name = g['name']
+        kind = 'data'
+        if name.endswith('_'):
+            name = name[:-1]
+            kind = 'code'
+        elif name.startswith('_'):
+            name = name[1:]
+
+        if kind == 'data':
+            yield {'op': 'label', 'segment': g['addressSegment'], 'offset': g['addressOffset'], 'name': name, 'imported': False}
+        else:
+            yield {'op': 'function', 'segment': g['addressSegment'], 'offset': g['addressOffset'], 'size': None, 'name': name}
+
+def planPhase(name, ops):
+    yield {'op': 'phase', 'name': name}
+    for op in ops:
+        yield op
+
+def planExport(addressesTable, modules, modulesLocals, globalSymbolsTable, moduleIndices = None, blockLabels = True):
+    """The whole plan, in the order it should be applied. The sections can be streamed.
+
+    With `moduleIndices`, only what belongs to those modules is planned. Without
+    `blockLabels`, the start and end of blocks aren't labelled.
+    """
+    return itertools.chain(
+        planPhase('fragments', planFragments(addressesTable, modules, moduleIndices)),
+        planPhase('locals', (op for local in modulesLocals if inModules(moduleIndices, local['meta']['moduleIndex']) for op in planModuleLocals(local, blockLabels))),
+        planPhase('globals', planGlobalSymbols(globalSymbolsTable, moduleIndices)),
+    )
+
+
+#
+# scoped imports
+#
+# A scope is a sorted list of non-overlapping, inclusive `(first, last)` addresses, and
+# `getAddress(segment, offset)` says where a segment offset is in those terms.
+#
+
+def inScope(scopeRanges, address):
+    i = bisect.bisect_right(scopeRanges, (address, float('inf'))) - 1
+    return i >= 0 and scopeRanges[i][1] >= address
+
+def clipRange(scopeRanges, start, size):
+    """The parts of the `size` addresses from `start` that are in scope, as (start, size) pairs."""
+    end = start + size - 1
+    i = max(bisect.bisect_right(scopeRanges, (start, float('inf'))) - 1, 0)
+    while i < len(scopeRanges) and scopeRanges[i][0] <= end:
+        first = max(start, scopeRanges[i][0])
+        last = min(end, scopeRanges[i][1])
+        if first <= last:
+            yield first, last - first + 1
+        i += 1
+
+def scopePlan(ops, scopeRanges, getAddress):
+    """The ops of the plan that are about addresses in scope. Fragments keep only the part
+    of their ranges that is in scope."""
+    for op in ops:
+        kind = op['op']
+        if kind == 'phase':
+            yield op
+        elif kind == 'fragment':
+            ranges = []
+            for segment, offset, size in op.get('ranges') or [[op['segment'], op['offset'], op['size']]]:
+                start = getAddress(segment, offset)
+                for first, clippedSize in clipRange(scopeRanges, start, size):
+                    ranges.append([segment, offset + first - start, clippedSize])
+            if ranges:
+                yield {'op': 'fragment', 'name': op['name'], 'ranges': ranges}
+        elif inScope(scopeRanges, getAddress(op['segment'], op['offset'])):
+            yield op
+        else:
+            metrics.count('scope.skippedOps')
+
+
+#
+# incremental imports
+#
+# A manifest remembers what a plan did to the program, one entry per group of ops: a
+# function with its signature and locals, a label, a data item or a fragment. Each entry
+# has a hash of the group's ops (with type references made independent of module
+# numbering), and what it would take to undo it. Diffing a new plan against the manifest
+# of the last import leaves only the groups that are new or changed, plus `remove` ops
+# for what is gone.
+#
+# A group only goes into the new manifest once all of its ops have been handed out, so
+# when an import stops partway, the manifest has the groups it got through.
+#
+
+def getGroupKey(phase, op):
+    kind = op['op']
+    if kind == 'fragment':
+        return json.dumps([phase, kind, op['name']])
+    if kind == 'label':
+        return json.dumps([phase, kind, op['segment'], op['offset'], op['name']])
+    return json.dumps([phase, kind, op['segment'], op['offset']])
+
+def getUndo(op):
+    kind = op['op']
+    if kind == 'function':
+        return {'kind': 'function', 'segment': op['segment'], 'offset': op['offset']}
+    if kind == 'label':
+        return {'kind': 'label', 'segment': op['segment'], 'offset': op['offset'], 'name': op['name']}
+    if kind == 'data':
+        return {'kind': 'data', 'segment': op['segment'], 'offset': op['offset']}
+    # fragments and anything else stay put
+    return None
+
+def hashGroup(ops, moduleHashes):
+    hasher = hashlib.sha1()
+    for op in ops:
+        if 'module' in op:
+            op = dict(op)
+            op['module'] = moduleHashes.get(op['module'])
+        hasher.update(json.dumps(op, sort_keys=True).encode('utf-8'))
+    return hasher.hexdigest()
+
+def diffGroup(key, ops, previous, moduleHashes):
+    """The manifest entry of one group, and the ops of it that still have to be applied."""
+    undo = getUndo(ops[0])
+    groupHash = hashGroup(ops, moduleHashes)
+    # whether the group sets up the function's signature and locals, or just names it
+    detailed = len(ops) > 1
+    entry = {'hash': groupHash, 'undo': undo, 'detailed': detailed}
+    before = previous.get(key)
+    if before is None:
+        metrics.count('incremental.added')
+        return entry, ops
+    if before['hash'] == groupHash:
+        metrics.count('incremental.unchanged')
+        metrics.count('incremental.skippedOps', len(ops))
+        return entry, []
+    metrics.count('incremental.changed')
+    if undo is not None and undo['kind'] == 'data':
+        # data can't be applied over other data
+        return entry, [dict(undo, op='remove')] + ops
+    if undo is not None and undo['kind'] == 'function' and (detailed or before.get('detailed')):
+        # start from a clean signature instead of adding to what the last import did
+        return entry, ops[:1] + [{'op': 'clear', 'segment': undo['segment'], 'offset': undo['offset']}] + ops[1:]
+    return entry, ops
+
+def diffSingleGroup(phase, op, previous, moduleHashes, manifest):
+    """The ops of a group of one op, recording it in `manifest` once they are handed out."""
+    key = getGroupKey(phase, op)
+    entry, ops = diffGroup(key, [op], previous, moduleHashes)
+    for groupOp in ops:
+        yield groupOp
+    manifest[key] = entry
+
+def diffFunctionGroup(phase, sequence, previous, moduleHashes, manifest):
+    """The ops of a function group and the ops interleaved with it, in their original order."""
+    groupOps = [op for op in sequence if op['op'] in ('function', 'signature', 'local')]
+    key = getGroupKey(phase, groupOps[0])
+    entry, result = diffGroup(key, groupOps, previous, moduleHashes)
+    # the function op, and a `clear` if there is one
+    for op in result[:len(result) - len(groupOps) + 1]:
+        yield op
+    for op in sequence[1:]:
+        if op['op'] in ('signature', 'local'):
+            if result:
+                yield op
+        else:
+            for otherOp in diffSingleGroup(phase, op, previous, moduleHashes, manifest):
+                yield otherOp
+    manifest[key] = entry
+
+def diffPlan(ops, previous, moduleHashes, manifest):
+    """Yield the ops that are new or changed since the import `previous` is the manifest of.
+
+    `manifest` gets an entry for every group of the new plan, applied or not. Signatures
+    and locals belong to the function before them. Labels and data are groups of their
+    own, but keep their place in between, so the order of the ops doesn't change.
+    """
+    phase = None
+    sequence = None
+    for op in ops:
+        kind = op['op']
+        if kind != 'phase' and kind != 'function' and sequence is not None:
+            sequence.append(op)
+            continue
+        if sequence is not None:
+            for sequenceOp in diffFunctionGroup(phase, sequence, previous, moduleHashes, manifest):
+                yield sequenceOp
+            sequence = None
+        if kind == 'phase':
+            phase = op['name']
+            yield op
+        elif kind == 'function':
+            sequence = [op]
+        else:
+            for groupOp in diffSingleGroup(phase, op, previous, moduleHashes, manifest):
+                yield groupOp
+    if sequence is not None:
+        for sequenceOp in diffFunctionGroup(phase, sequence, previous, moduleHashes, manifest):
+            yield sequenceOp
+
+def planRemovals(previous, manifest):
+    """`remove` ops for what the previous import made that the new plan doesn't have."""
+    # the same function, label or data can come from more than one phase, and move
+    # from one to the other without going away
+    kept = set(json.dumps(entry['undo'], sort_keys=True) for entry in manifest.values())
+    for key in sorted(previous):
+        if key in manifest:
+            continue
+        undo = previous[key]['undo']
+        if undo is None:
+            continue
+        if json.dumps(undo, sort_keys=True) in kept:
+            if undo['kind'] == 'function' and previous[key].get('detailed'):
+                # still there, but nothing gives it a signature any more
+                yield {'op': 'clear', 'segment': undo['segment'], 'offset': undo['offset']}
+            continue
+        metrics.count('incremental.removed')
+        yield dict(undo, op='remove')
+
+def planIncremental(ops, previous, moduleHashes, manifest):
+    """`ops` diffed against `previous`, followed by a phase removing what is gone."""
+    return itertools.chain(
+        diffPlan(ops, previous, moduleHashes, manifest),
+        planPhase('remove', planRemovals(previous, manifest)),
+    )
+
+def checkpointManifest(previous, manifest):
+    """The manifest of an import that stopped partway: the groups it got through, and for
+    the rest, what the import before it did. Importing again then picks up where it stopped,
+    and still removes what the export no longer has."""
+    checkpoint = dict(previous)
+    checkpoint.update(manifest)
+    return checkpoint
+
+
+def planLocalsChunk(locals):
+    # a cached plan has the block labels, the script drops them unless it wants them
+    return [op for local in locals for op in planModuleLocals(local, True)]
+
+def planShard(path):
+    return planLocalsChunk(load_shard(path)['modulesLocals'])
+
+def main(argv):
+    import argparse
+    from multiprocessing import Pool
+
+    parser = argparse.ArgumentParser(description='Plan the import of a Watcom debug symbols export without Ghidra.')
+    parser.add_argument('export', help='JSON written by src/main.ts, or the index.json of a sharded export')
+    parser.add_argument('-o', '--output', help='where to write the plan (default: next to the export)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='worker processes for planning locals')
+    args = parser.parse_args(argv)
+
+    debuggingRegion = load_export(args.export)
+    output = args.output or plan_path_for(args.export)
+
+    if is_sharded_export(args.export):
+        # the workers read their shards themselves
+        planChunk = planShard
+        chunks = [shard_path_for(args.export, shard) for shard in debuggingRegion['shards']]
+    else:
+        # one chunk per module keeps each worker's input small and the output in order
+        planChunk = planLocalsChunk
+        chunks = []
+        for local in debuggingRegion['modulesLocals']:
+            if chunks and chunks[-1][0]['meta']['moduleIndex'] == local['meta']['moduleIndex']:
+                chunks[-1].append(local)
+            else:
+                chunks.append([local])
+
+    pool = Pool(args.jobs)
+    try:
+        localsOps = pool.map(planChunk, chunks)
+    finally:
+        pool.close()
+
+    write_plan(output, itertools.chain(
+        planPhase('fragments', planFragments(debuggingRegion['addressesTable'], debuggingRegion['modules'])),
+        planPhase('locals', (op for chunk in localsOps for op in chunk)),
+        planPhase('globals', planGlobalSymbols(debuggingRegion['globalSymbolsTable'])),
+    ))
+    print('wrote {}'.format(output))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,218 @@
+##
+# Tests for the Ghidra-free parts of `src/watcom_import_plan.py`:
+#
+#   python -m pytest tests
+##
+from __future__ import print_function, division
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from watcom_import_plan import (
+    TypeTable, clipRange, computeTypeFingerprints, diffPlan, findRoutine, mergeRanges, planIncremental,
+    planModuleLocals, planRemovals, scopePlan,
+)
+
+
+#
+# symbols
+#
+
+def test_merge_ranges_merges_touching_and_overlapping_ranges():
+    ranges = [[1, 0x20, 0x10], [1, 0x0, 0x10], [1, 0x10, 0x10], [1, 0x40, 0x10], [1, 0x48, 0x4]]
+    assert mergeRanges(ranges) == [[1, 0x0, 0x30], [1, 0x40, 0x10]]
+
+def test_merge_ranges_keeps_segments_apart_and_drops_empty_ranges():
+    ranges = [[3, 0x0, 0x10], [1, 0x0, 0x10], [1, 0x10, 0], [3, 0x10, 0x10]]
+    assert mergeRanges(ranges) == [[1, 0x0, 0x10], [3, 0x0, 0x20]]
+
+def test_find_routine():
+    routines = [(1, 0x0, 0x20), (1, 0x40, 0x60), (3, 0x0, 0x100)]
+    assert findRoutine(routines, 1, 0x0) == (1, 0x0)
+    assert findRoutine(routines, 1, 0x1f) == (1, 0x0)
+    assert findRoutine(routines, 1, 0x20) is None
+    assert findRoutine(routines, 1, 0x50) == (1, 0x40)
+    assert findRoutine(routines, 2, 0x10) is None
+    assert findRoutine(routines, 3, 0x80) == (3, 0x0)
+
+def routineEntry(name, startOffset, size):
+    return {
+        'typeName': 'NEAR_RTN_386', 'symbolName': name, 'startOffset': startOffset, 'size': size, 'parentBlockOffset': 0,
+        'returnAddressOffset': 4, 'typeIndex': 1, 'returnValueLocation': [{'lsmName': 'MULTI_REG', 'registerNames': ['EAX']}],
+        'registerParams': [],
+    }
+
+def localEntry(name, offset):
+    return {'typeName': 'LOCAL', 'symbolName': name, 'typeIndex': 2, 'location': [{'lsmName': 'BP_OFFSET_BYTE', 'offset': offset}]}
+
+def test_block_locals_go_to_the_routine_the_block_is_in():
+    local = {'meta': {'moduleIndex': 0}, 'entries': [
+        {'typeName': 'SET_BASE386', 'segment': 1, 'location': 0x100},
+        routineEntry('f', 0x0, 0x40),
+        {'typeName': 'BLOCK_386', 'startOffset': 0x10, 'size': 0x8, 'parentBlockOffset': 0},
+        localEntry('x', -8),
+    ]}
+    ops = list(planModuleLocals(local, blockLabels = False))
+    assert [op['op'] for op in ops] == ['function', 'signature', 'local']
+    assert (ops[2]['segment'], ops[2]['offset'], ops[2]['inBlock']) == (1, 0x100, False)
+    assert ops[2]['stackOffset'] == -12
+
+
+#
+# incremental imports
+#
+
+def functionOps(name, offset, locals):
+    ops = [
+        {'op': 'function', 'segment': 1, 'offset': offset, 'size': 0x20, 'name': name},
+        {'op': 'signature', 'segment': 1, 'offset': offset, 'name': name, 'module': 0, 'type': 1, 'returnLocation': 'MULTI_REG',
+         'returnRegister': 'EAX', 'registerParams': []},
+    ]
+    for localName in locals:
+        ops.append({'op': 'local', 'segment': 1, 'offset': offset, 'inBlock': False, 'name': localName, 'module': 0, 'type': 2, 'stackOffset': -8})
+    return ops
+
+def labelOp(name, offset):
+    return {'op': 'label', 'segment': 1, 'offset': offset, 'name': name, 'imported': False, 'block': True}
+
+def planOps(fLocals = ('x',), label = 'block_start_00000004'):
+    """A locals phase where a block label comes in between a function's signature and its locals."""
+    f = functionOps('f', 0x0, fLocals)
+    return ([{'op': 'phase', 'name': 'locals'}] + f[:2] + [labelOp(label, 0x4)] + f[2:] +
+            functionOps('g', 0x20, ['y']) + [{'op': 'phase', 'name': 'globals'}, labelOp('counter', 0x100)])
+
+MODULE_HASHES = {0: 'module0'}
+
+def importOnce(ops, previous):
+    manifest = dict()
+    applied = list(planIncremental(ops, previous, MODULE_HASHES, manifest))
+    return applied, manifest
+
+def test_a_first_import_applies_the_plan_as_is():
+    ops = planOps()
+    applied, manifest = importOnce(ops, dict())
+    assert applied == ops + [{'op': 'phase', 'name': 'remove'}]
+    assert len(manifest) == 4
+
+def test_importing_the_same_plan_again_applies_nothing():
+    _, manifest = importOnce(planOps(), dict())
+    applied, again = importOnce(planOps(), manifest)
+    assert [op for op in applied if op['op'] != 'phase'] == []
+    assert again == manifest
+
+def test_a_reimport_keeps_the_ops_in_their_place():
+    # the ops that interleave with a function group must stay in between its ops, moving
+    # them ahead of the group reorders the plan across modules
+    _, manifest = importOnce(planOps(), dict())
+    applied, _ = importOnce(planOps(fLocals = ('x', 'z'), label = 'block_start_00000006'), manifest)
+    assert [(op['op'], op.get('name')) for op in applied] == [
+        ('phase', 'locals'), ('function', 'f'), ('clear', None), ('signature', 'f'), ('label', 'block_start_00000006'),
+        ('local', 'x'), ('local', 'z'), ('phase', 'globals'), ('phase', 'remove'), ('remove', 'block_start_00000004'),
+    ]
+
+def test_diff_plan_records_a_group_only_after_its_ops_are_handed_out():
+    manifest = dict()
+    ops = diffPlan(iter(planOps()), dict(), MODULE_HASHES, manifest)
+    for op in ops:
+        if op['op'] == 'local':
+            break
+    assert sorted(manifest) == ['["locals", "label", 1, 4, "block_start_00000004"]']
+
+def test_removals():
+    _, previous = importOnce(planOps(), dict())
+    manifest = dict((key, entry) for key, entry in previous.items() if '"g"' not in key and ', 32]' not in key and 'counter' not in key)
+    assert list(planRemovals(previous, manifest)) == [
+        {'op': 'remove', 'kind': 'label', 'segment': 1, 'offset': 0x100, 'name': 'counter'},
+        {'op': 'remove', 'kind': 'function', 'segment': 1, 'offset': 0x20},
+    ]
+
+
+#
+# scoped imports
+#
+
+def getAddress(segment, offset):
+    return segment * 0x10000 + offset
+
+def test_clip_range():
+    scopeRanges = [(0x10, 0x1f), (0x30, 0x3f)]
+    assert list(clipRange(scopeRanges, 0x0, 0x50)) == [(0x10, 0x10), (0x30, 0x10)]
+    assert list(clipRange(scopeRanges, 0x18, 0x4)) == [(0x18, 0x4)]
+    assert list(clipRange(scopeRanges, 0x20, 0x10)) == []
+
+def test_scope_plan_clips_fragments_and_drops_what_is_out_of_scope():
+    scopeRanges = [(0x10010, 0x1002f)]
+    ops = [
+        {'op': 'phase', 'name': 'fragments'},
+        {'op': 'fragment', 'name': 'a.c', 'ranges': [[1, 0x0, 0x20], [1, 0x100, 0x20]]},
+        {'op': 'fragment', 'name': 'b.c', 'ranges': [[1, 0x20, 0x20]]},
+        {'op': 'fragment', 'name': 'c.c', 'ranges': [[1, 0x40, 0x20]]},
+        {'op': 'phase', 'name': 'locals'},
+        {'op': 'function', 'segment': 1, 'offset': 0x0, 'size': 0x20, 'name': 'f'},
+        {'op': 'function', 'segment': 1, 'offset': 0x20, 'size': 0x20, 'name': 'g'},
+    ]
+    assert list(scopePlan(ops, scopeRanges, getAddress)) == [
+        {'op': 'phase', 'name': 'fragments'},
+        {'op': 'fragment', 'name': 'a.c', 'ranges': [[1, 0x10, 0x10]]},
+        {'op': 'fragment', 'name': 'b.c', 'ranges': [[1, 0x20, 0x10]]},
+        {'op': 'phase', 'name': 'locals'},
+        {'op': 'function', 'segment': 1, 'offset': 0x20, 'size': 0x20, 'name': 'g'},
+    ]
+
+
+#
+# types
+#
+
+def makeTypes(entries, first = 1):
+    types = TypeTable()
+    types.extend(dict(entry, selfIndex = first + i) for i, entry in enumerate(entries))
+    return types
+
+def scalar(size):
+    return {'typeName': 'SCALAR', 'scalarTypeClassName': 'SIGNED', 'scalarTypeSizeInBytes': size}
+
+def pointer(to):
+    return {'typeName': 'POINTER_NEAR386', 'categoryName': 'POINTER', 'baseType': to}
+
+def struct(*fields):
+    return {'typeName': 'STRUCTURE_LIST', 'size': 4 * len(fields), 'fields': [
+        {'typeName': 'FIELD', 'name': name, 'offset': 4 * i, 'type': fieldType} for i, (name, fieldType) in enumerate(fields)]}
+
+def linkedList(first):
+    """`struct node { int value; struct node *next; }`, numbered from `first`."""
+    return [scalar(4), struct(('value', first), ('next', first + 2)), pointer(first + 1)]
+
+def test_identical_types_get_the_same_fingerprint_wherever_they_are_in_the_table():
+    one = computeTypeFingerprints(makeTypes(linkedList(1)))
+    other = computeTypeFingerprints(makeTypes([scalar(2), scalar(8)] + linkedList(3)))
+    assert [one[i] for i in (1, 2, 3)] == [other[i] for i in (3, 4, 5)]
+    assert len(set(one.values())) == 3
+
+def test_different_types_get_different_fingerprints():
+    one = computeTypeFingerprints(makeTypes(linkedList(1)))
+    entries = linkedList(1)
+    entries[1] = struct(('count', 1), ('next', 3))
+    other = computeTypeFingerprints(makeTypes(entries))
+    assert one[1] == other[1]
+    assert one[2] != other[2] and one[3] != other[3]
+
+def test_rings_of_pointers_are_fingerprinted_in_linear_time():
+    # every member of a cycle used to walk the whole cycle
+    size = 20000
+    types = makeTypes([pointer(1 + (i + 1) % size) for i in range(size)])
+    startTime = time.time()
+    fingerprints = computeTypeFingerprints(types)
+    assert time.time() - startTime < 5
+    assert len(fingerprints) == size
+    # the same ring, going through the table in another order
+    order = [(i * 37) % 100 for i in range(100)]
+    entries = [None] * 100
+    for k, typeIndex in enumerate(order):
+        entries[typeIndex] = pointer(1 + order[(k + 1) % 100])
+    inOrder = computeTypeFingerprints(makeTypes([pointer(1 + (i + 1) % 100) for i in range(100)]))
+    shuffled = computeTypeFingerprints(makeTypes(entries))
+    assert sorted(inOrder.values()) == sorted(shuffled.values())